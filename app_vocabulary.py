@@ -0,0 +1,176 @@
+"""
+アプリ名辞書モジュール
+アプリ名と小さな整数IDを対応付ける共有の表（SystemMonitor・Database・PatternLearner で共用）
+"""
+import heapq
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AppVocabulary:
+    """アプリ名 ↔ 整数ID の表
+
+    名前の文字列はプロセス内で1つだけ持ち、比較は整数で行えるようにする。
+    アプリ名は normalize()（小文字化）した形で登録する。SystemMonitor が一度だけ
+    正規化して pin し、ID を表示用の名前と一緒に後段へ渡す。
+    IDを保存・参照し続ける側は pin しておく。pin されていない名前は件数が
+    max_size を超えると使われていない順に捨て、IDは再利用する。
+    表に無い名前は lookup() で負のハッシュIDになる（登録はしない）。
+    """
+
+    # 学習パターンの app_id（uint16）に収まる範囲
+    MAX_ID = 0xFFFF
+
+    def __init__(self, max_size: int = 4096, hash_buckets: int = 1024):
+        self.max_size = max_size
+        self.hash_buckets = hash_buckets
+        self._lock = threading.Lock()
+        self._ids: dict[str, int] = {}
+        self._names: list[Optional[str]] = []
+        self._pins: dict[int, int] = {}
+        # pin されていないID（使われた順。先頭が最も古い）
+        self._unpinned: OrderedDict[int, None] = OrderedDict()
+        self._free: list[int] = []
+        self._warned = False
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        """登録する形にそろえる（大文字・小文字を区別しない）"""
+        return name.lower()
+
+    def intern(self, name: str, pin: bool = False) -> int:
+        """名前のIDを取得（無ければ登録）。pin=True なら release() まで捨てない"""
+        with self._lock:
+            id_ = self._ids.get(name)
+            if id_ is None:
+                id_ = self._allocate(name)
+            if pin:
+                self._pins[id_] = self._pins.get(id_, 0) + 1
+                self._unpinned.pop(id_, None)
+            elif id_ in self._unpinned:
+                self._unpinned.move_to_end(id_)
+            return id_
+
+    def _allocate(self, name: str) -> int:
+        """新しい名前にIDを割り当てる（満杯なら pin されていない最古の名前を捨てる）"""
+        while len(self._ids) >= self.max_size and self._unpinned:
+            old, _ = self._unpinned.popitem(last=False)
+            del self._ids[self._names[old]]
+            self._names[old] = None
+            heapq.heappush(self._free, old)
+            self.evictions += 1
+        if len(self._ids) >= self.max_size and not self._warned:
+            self._warned = True
+            logger.warning(
+                f"アプリ名辞書が上限に達しましたが、すべて pin 中のため捨てられません: {len(self._ids)}件"
+            )
+
+        if self._free:
+            id_ = heapq.heappop(self._free)
+        else:
+            id_ = len(self._names)
+            if id_ > self.MAX_ID:
+                raise OverflowError("アプリ名辞書のIDが上限に達しました")
+            self._names.append(None)
+        name = sys.intern(name)
+        self._ids[name] = id_
+        self._names[id_] = name
+        self._unpinned[id_] = None
+        return id_
+
+    def pin(self, id_: int, count: int = 1):
+        """登録済みのIDを count 回分 pin する"""
+        with self._lock:
+            self._pins[id_] = self._pins.get(id_, 0) + count
+            self._unpinned.pop(id_, None)
+
+    def release(self, id_: int, count: int = 1):
+        """pin を count 回分外す（すべて外れたら捨てられる候補に戻る）"""
+        with self._lock:
+            remaining = self._pins.get(id_, 0) - count
+            if remaining > 0:
+                self._pins[id_] = remaining
+            elif self._pins.pop(id_, None) is not None:
+                self._unpinned[id_] = None
+
+    def acquire(self, name: str, id_: int = -1) -> int:
+        """name のIDを pin して返す
+
+        name は表示用の名前でよい（正規化して扱う）。id_ が今も name を指していれば
+        辞書は引かない（pin が外れて使い回されたIDや -1 なら登録し直す）。
+        """
+        with self._lock:
+            if self._matches(id_, name):
+                self._pins[id_] = self._pins.get(id_, 0) + 1
+                self._unpinned.pop(id_, None)
+                return id_
+        return self.intern(self.normalize(name), pin=True)
+
+    def resolve(self, name: str, id_: int = -1) -> int:
+        """name のIDを返す（id_ が今も name を指していればそのまま、無ければ lookup）"""
+        if self._matches(id_, name):
+            return id_
+        return self.lookup(self.normalize(name))
+
+    def _matches(self, id_: int, name: str) -> bool:
+        """id_ が name（表示用・正規化済みのどちらでもよい）の登録を指しているか"""
+        if not 0 <= id_ < len(self._names):
+            return False
+        registered = self._names[id_]
+        return registered is not None and (
+            registered == name or registered == self.normalize(name)
+        )
+
+    def lookup(self, name: str) -> int:
+        """名前のIDを取得（無ければ登録せず負のハッシュID、ハッシュしない設定なら -1）"""
+        id_ = self._ids.get(name)
+        if id_ is not None:
+            return id_
+        return self.hashed_id(name)
+
+    def hashed_id(self, name: str) -> int:
+        """名前のハッシュID（-1 〜 -hash_buckets。実行ごとに変わらない）"""
+        if self.hash_buckets <= 0:
+            return -1
+        return -1 - zlib.crc32(name.encode("utf-8")) % self.hash_buckets
+
+    def name(self, id_: int) -> Optional[str]:
+        """IDの名前（未登録・ハッシュIDなら None）"""
+        if 0 <= id_ < len(self._names):
+            return self._names[id_]
+        return None
+
+    def stats(self) -> dict:
+        """件数などの統計を取得"""
+        with self._lock:
+            return {
+                "size": len(self._ids),
+                "pinned": len(self._pins),
+                "evictions": self.evictions,
+            }
+
+
+_shared: Optional[AppVocabulary] = None
+_shared_lock = threading.Lock()
+
+
+def get_vocabulary() -> AppVocabulary:
+    """プロセス共有のアプリ名辞書を取得"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AppVocabulary()
+        return _shared
@@ -0,0 +1,124 @@
+"""
+データベースベンチマーク
+接続毎回オープン（旧実装）と永続接続の呼び出しレイテンシを比較
+
+    python benchmarks/bench_database.py --rows 1000000
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database, UsageRecord  # noqa: E402
+
+APPS = ["chrome.exe", "code.exe", "explorer.exe", "steam.exe", "winword.exe"]
+PLANS = ["高パフォーマンス", "バランス", "省電力"]
+
+
+def make_record(ts: datetime) -> UsageRecord:
+    """ランダムな使用記録を生成"""
+    return UsageRecord(
+        id=None,
+        timestamp=ts,
+        hour=ts.hour,
+        day_of_week=ts.weekday(),
+        cpu_percent=random.uniform(0, 100),
+        memory_percent=random.uniform(20, 90),
+        battery_percent=random.randint(5, 100),
+        is_charging=random.random() < 0.5,
+        active_app=random.choice(APPS),
+        power_plan=random.choice(PLANS),
+    )
+
+
+def fill(db_path: Path, rows: int):
+    """usage_log に rows 件を一括投入"""
+    start = datetime.now() - timedelta(seconds=30 * rows)
+    with Database(db_path, batch_size=10_000) as db:
+        for i in range(rows):
+            db.add_usage_record(make_record(start + timedelta(seconds=30 * i)))
+
+
+# --- 旧実装（呼び出し毎に接続を開く） ---
+
+def legacy_add_usage_record(db_path: Path, record: UsageRecord):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            INSERT INTO usage_log
+            (timestamp, hour, day_of_week, cpu_percent, memory_percent,
+             battery_percent, is_charging, app_id, plan_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            int(record.timestamp.timestamp()), record.hour, record.day_of_week,
+            record.cpu_percent, record.memory_percent, record.battery_percent,
+            int(record.is_charging), 1, 1,
+        ))
+        conn.commit()
+    conn.close()
+
+
+def legacy_get_setting(db_path: Path, key: str) -> str:
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    conn.close()
+    return row[0] if row else ""
+
+
+def legacy_get_today_stats(db_path: Path) -> dict:
+    today = datetime.now().date().isoformat()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT plan_id, minutes FROM daily_plan_minutes WHERE date = ?", (today,)
+        ).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def timeit(label: str, fn, calls: int) -> float:
+    """1呼び出しあたりの平均レイテンシ（ms）を表示"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    per_call = (time.perf_counter() - start) / calls * 1000
+    print(f"  {label:<28} {per_call:8.3f} ms/call")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "usage.db"
+        Database(db_path).close()
+
+        print(f"usage_log に {args.rows:,} 件を投入中...")
+        fill(db_path, args.rows)
+
+        now = datetime.now()
+        print("旧実装（接続毎回オープン）:")
+        timeit(
+            "add_usage_record",
+            lambda: legacy_add_usage_record(db_path, make_record(now)),
+            args.calls,
+        )
+        timeit("get_setting", lambda: legacy_get_setting(db_path, "auto"), args.calls)
+        timeit("get_today_stats", lambda: legacy_get_today_stats(db_path), args.calls)
+
+        print("永続接続:")
+        with Database(db_path) as db:
+            timeit("add_usage_record", lambda: db.add_usage_record(make_record(now)), args.calls)
+            timeit("get_setting", lambda: db.get_setting("auto"), args.calls)
+            timeit("get_today_stats", db.get_today_stats, args.calls)
+
+
+if __name__ == "__main__":
+    main()
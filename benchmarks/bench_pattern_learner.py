@@ -0,0 +1,242 @@
+"""
+パターン学習ベンチマーク
+_predict_from_patterns の旧実装（Pythonループ）と得票表版を比較し、
+同じ入力に対して同じ予測を返すことを確認する。
+旧実装はスコアを浮動小数点で足すため、得票がちょうど同点のときは丸め誤差で勝者が
+決まる。得票表版は 0.1 単位の整数で数えて先に現れたプランを選ぶので、同点の場合は
+同点のプランのどれかであれば一致とみなす（信頼度も丸め誤差の範囲で比較する）。
+あわせて PatternStore の追加速度と、削除方針ごとに残る状況の数を比べる
+
+    python benchmarks/bench_pattern_learner.py --sizes 1000 100000
+
+予測が一致しない場合は終了コード 1 を返す。
+"""
+import argparse
+import math
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from pattern_learner import (  # noqa: E402
+    EVICTION_POLICIES, MODEL_DTYPE, PatternLearner, PatternStore, Prediction,
+)
+
+APPS = ["chrome.exe", "code.exe", "slack.exe", "teams.exe", "zoom.exe", "outlook.exe"]
+PLANS = [PatternLearner.PLAN_HIGH, PatternLearner.PLAN_BALANCED, PatternLearner.PLAN_SAVER]
+
+
+def make_patterns(count: int, rng: random.Random) -> list[dict]:
+    """ランダムな学習パターンを生成"""
+    return [
+        {
+            "hour": rng.randrange(24),
+            "day_of_week": rng.randrange(7),
+            "cpu_percent": rng.uniform(0, 100),
+            "memory_percent": rng.uniform(20, 90),
+            "is_charging": rng.random() < 0.5,
+            "active_app": rng.choice(APPS),
+            "chosen_plan": rng.choice(PLANS),
+            "timestamp": "",
+        }
+        for _ in range(count)
+    ]
+
+
+# --- 旧実装（パターンごとのPythonループ） ---
+
+def legacy_predict_from_patterns(
+    patterns: list[dict],
+    hour: int,
+    day_of_week: int,
+    cpu_percent: float,
+    is_charging: bool,
+    active_app: str
+) -> Optional[Prediction]:
+    similar_patterns = []
+
+    for p in patterns:
+        score = 0.0
+
+        hour_diff = abs(p["hour"] - hour)
+        if hour_diff <= 1:
+            score += 0.3
+        elif hour_diff <= 3:
+            score += 0.1
+
+        if p["day_of_week"] == day_of_week:
+            score += 0.2
+
+        if p["is_charging"] == is_charging:
+            score += 0.2
+
+        if p["active_app"] == active_app:
+            score += 0.3
+
+        if score >= 0.5:
+            similar_patterns.append((score, p["chosen_plan"]))
+
+    if not similar_patterns:
+        return None
+
+    plan_counts = {}
+    for score, plan in similar_patterns:
+        plan_counts[plan] = plan_counts.get(plan, 0) + score
+
+    best_plan = max(plan_counts, key=plan_counts.get)
+    total_score = sum(plan_counts.values())
+    confidence = plan_counts[best_plan] / total_score if total_score > 0 else 0.5
+
+    return Prediction(
+        recommended_plan=best_plan,
+        confidence=min(confidence, 0.85),
+        reason=f"過去の使用パターン（{len(similar_patterns)}件）から予測"
+    )
+
+
+def tied_plans(
+    patterns: list[dict],
+    hour: int,
+    day_of_week: int,
+    cpu_percent: float,
+    is_charging: bool,
+    active_app: str
+) -> set[str]:
+    """得票を 0.1 単位の整数で数えたときに最多となるプラン"""
+    votes: dict[str, int] = {}
+    for p in patterns:
+        hour_diff = abs(p["hour"] - hour)
+        score = 3 if hour_diff <= 1 else 1 if hour_diff <= 3 else 0
+        score += 2 * (p["day_of_week"] == day_of_week) + 2 * (p["is_charging"] == is_charging)
+        score += 3 * (p["active_app"] == active_app)
+        if score >= 5:
+            votes[p["chosen_plan"]] = votes.get(p["chosen_plan"], 0) + score
+    best = max(votes.values())
+    return {plan for plan, count in votes.items() if count == best}
+
+
+def matches(
+    actual: Optional[Prediction], expected: Optional[Prediction], patterns: list[dict], query
+) -> bool:
+    """予測が旧実装と一致するか（同点・丸め誤差は許す）"""
+    if actual is None or expected is None:
+        return actual is expected
+    if actual.reason != expected.reason:
+        return False
+    if not math.isclose(actual.confidence, expected.confidence, rel_tol=1e-9):
+        return False
+    return (
+        actual.recommended_plan == expected.recommended_plan
+        or actual.recommended_plan in tied_plans(patterns, *query)
+    )
+
+
+def make_queries(count: int, rng: random.Random) -> list[tuple]:
+    """ランダムな予測条件を生成（未学習のアプリも混ぜる）"""
+    return [
+        (
+            rng.randrange(24),
+            rng.randrange(7),
+            rng.uniform(20, 70),
+            rng.random() < 0.5,
+            rng.choice(APPS + ["unknown.exe"]),
+        )
+        for _ in range(count)
+    ]
+
+
+def bench(size: int, queries: list[tuple], model_dir: Path) -> int:
+    """size 件のパターンで新旧を比較し、不一致の件数を返す"""
+    rng = random.Random(size)
+    patterns = make_patterns(size, rng)
+    learner = PatternLearner(model_dir / f"model_{size}.bin", capacity=size)
+    learner._replace_patterns(patterns)
+
+    mismatches = 0
+    for query in queries:
+        if not matches(
+            learner._predict_from_patterns(*query),
+            legacy_predict_from_patterns(patterns, *query),
+            patterns,
+            query,
+        ):
+            mismatches += 1
+
+    start = time.perf_counter()
+    for query in queries:
+        legacy_predict_from_patterns(patterns, *query)
+    legacy = (time.perf_counter() - start) / len(queries) * 1000
+
+    start = time.perf_counter()
+    for query in queries:
+        learner._predict_from_patterns(*query)
+    vectorized = (time.perf_counter() - start) / len(queries) * 1000
+
+    print(
+        f"  {size:>8,}件  旧 {legacy:9.3f} ms  新 {vectorized:8.3f} ms  "
+        f"×{legacy / vectorized:6.1f}  不一致 {mismatches}件"
+    )
+    return mismatches
+
+
+def make_stream(count: int, rng: random.Random) -> np.ndarray:
+    """偏りのあるパターン列（ほとんどが平日昼の chrome.exe）を生成"""
+    records = np.zeros(count, dtype=MODEL_DTYPE)
+    for i in range(count):
+        common = rng.random() < 0.9
+        records[i]["timestamp"] = i
+        records[i]["app_id"] = 0 if common else rng.randrange(1, len(APPS))
+        records[i]["hour"] = rng.randrange(10, 17) if common else rng.randrange(24)
+        records[i]["plan_id"] = rng.randrange(len(PLANS))
+    return records
+
+
+def bench_store(capacity: int, count: int):
+    """旧実装（リストに追加して末尾を切り出す）と PatternStore の追加を比較"""
+    stream = make_stream(count, random.Random(1))
+    buckets = lambda records: len({  # noqa: E731
+        (int(r["app_id"]), int(r["hour"])) for r in records
+    })
+
+    start = time.perf_counter()
+    patterns = []
+    for record in stream:
+        patterns.append(record)
+        patterns = patterns[-capacity:]
+    legacy = (time.perf_counter() - start) / count * 1e6
+    print(f"  {'旧(list)':<10} {legacy:8.2f} µs/件  残った(アプリ,時) {buckets(patterns):4}種")
+
+    for policy in EVICTION_POLICIES:
+        store = PatternStore(capacity, policy)
+        start = time.perf_counter()
+        for record in stream:
+            store.append(record)
+        elapsed = (time.perf_counter() - start) / count * 1e6
+        print(f"  {policy:<10} {elapsed:8.2f} µs/件  残った(アプリ,時) {buckets(store.records()):4}種")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--stream", type=int, default=50_000, help="PatternStore に流す件数")
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries, random.Random(0))
+    print("_predict_from_patterns（1予測あたり）:")
+    with tempfile.TemporaryDirectory() as tmp:
+        mismatches = sum(bench(size, queries, Path(tmp)) for size in args.sizes)
+
+    print(f"PatternStore（容量 {PatternLearner.MAX_PATTERNS:,}件に {args.stream:,}件を追加）:")
+    bench_store(PatternLearner.MAX_PATTERNS, args.stream)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+ストレージエンジンの適合性チェックとベンチマーク
+同じ入力に対して各エンジンが SQLite（Database）と同じ結果を返すかを確認し、
+書き込み・読み出しのスループットを比較する
+
+    python benchmarks/bench_storage.py --rows 100000
+
+適合性チェックに失敗した場合は終了コード 1 を返す。
+"""
+import argparse
+import math
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database, RetentionPolicy, UsageRecord  # noqa: E402
+from storage import BinaryLogEngine, MemoryEngine, StorageEngine  # noqa: E402
+
+APPS = ["chrome.exe", "code.exe", "explorer.exe", "steam.exe", "winword.exe", "ゲーム.exe"]
+PLANS = ["高パフォーマンス", "バランス", "省電力"]
+
+# エンジン名 → (生成関数（ディレクトリ, 保持日数）, 再オープンで内容が残るか)
+ENGINES = {
+    "sqlite": (
+        lambda d, days=30: Database(
+            d / "usage.db", batch_size=500, retention=RetentionPolicy(raw_days=days)
+        ),
+        True,
+    ),
+    "memory": (
+        lambda d, days=30: MemoryEngine(max_records=10_000_000, retention_days=days), False
+    ),
+    "binlog": (
+        lambda d, days=30: BinaryLogEngine(d / "binlog", batch_size=500, retention_days=days),
+        True,
+    ),
+}
+
+
+def make_records(rows: int, days: int, seed: int = 0) -> list[UsageRecord]:
+    """days 日前から現在までの使用記録を時刻順に生成"""
+    rng = random.Random(seed)
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days)
+    step = days * 86400 / rows
+    records = []
+    for i in range(rows):
+        ts = start + timedelta(seconds=int(i * step))
+        records.append(UsageRecord(
+            id=None,
+            timestamp=ts,
+            hour=ts.hour,
+            day_of_week=ts.weekday(),
+            cpu_percent=rng.uniform(0, 100),
+            memory_percent=rng.uniform(20, 90),
+            battery_percent=rng.choice([None, rng.randint(5, 100)]),
+            is_charging=rng.random() < 0.5,
+            active_app=rng.choice(APPS),
+            power_plan=rng.choice(PLANS),
+        ))
+    return records
+
+
+def fill(engine: StorageEngine, records: list[UsageRecord]):
+    """使用記録・日次統計・設定を投入"""
+    for record in records:
+        engine.add_usage_record(record)
+    today = datetime.now()
+    for i, plan in enumerate(PLANS * 3):
+        engine.update_daily_stats(plan, i + 1, when=today - timedelta(days=i % 2))
+    engine.set_setting("auto", True)
+    engine.set_setting("interval", 30)
+    engine.set_setting("名前", "テスト")
+    engine.flush()
+
+
+def snapshot(engine: StorageEngine) -> dict:
+    """比較用に主要な問い合わせ結果を集める"""
+    now = datetime.now()
+    rows = lambda records: [  # noqa: E731
+        (r.timestamp, r.hour, r.day_of_week, r.cpu_percent, r.memory_percent,
+         r.battery_percent, r.is_charging, r.active_app, r.power_plan)
+        for r in records
+    ]
+    return {
+        "records": rows(engine.iter_records()),
+        "range": rows(engine.iter_records(now - timedelta(days=3), now - timedelta(days=1))),
+        "app": rows(engine.iter_records(now - timedelta(days=7), app="code.exe")),
+        "recent": rows(engine.get_recent_records(6)),
+        "hourly": [
+            engine.get_hourly_pattern(hour, dow, charging)
+            for hour in range(24)
+            for dow in (None, *range(7))
+            for charging in (None, False, True)
+        ],
+        "apps": engine.get_app_usage_stats(),
+        "apps_top3": engine.get_app_usage_stats(3),
+        "today": engine.get_today_stats(),
+        "yesterday": engine.get_daily_stats((now - timedelta(days=1)).date().isoformat()),
+        "settings": [engine.get_setting(k) for k in ("auto", "interval", "名前", "なし")],
+    }
+
+
+def same(a, b) -> bool:
+    """浮動小数点の誤差を許して比較（binlog は使用率を float32 で保存する）"""
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-5)
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def compare(name: str, stage: str, expected: dict, actual: dict) -> int:
+    """スナップショットを比較し、不一致の項目数を返す"""
+    failures = 0
+    for key, value in expected.items():
+        if not same(value, actual[key]):
+            print(f"  [NG] {name}: {stage} / {key}")
+            failures += 1
+    return failures
+
+
+def conformance(records: list[UsageRecord], retention_days: int) -> int:
+    """全エンジンの結果を SQLite と突き合わせ、不一致の総数を返す"""
+    print("適合性チェック:")
+    failures = 0
+    reference: dict[str, dict] = {}
+    for name, (factory, persistent) in ENGINES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            engine = factory(tmp, retention_days)
+            try:
+                fill(engine, records)
+                results = {"投入後": snapshot(engine)}
+                deleted = engine.cleanup_old_records(retention_days)
+                results["削除後"] = snapshot(engine)
+                results["削除後"]["deleted"] = deleted
+                # 引数なしはエンジンの保持日数（同じ日数なので追加の削除は無い）
+                results["削除後"]["deleted_default"] = engine.cleanup_old_records()
+            finally:
+                engine.close()
+            if persistent:
+                with factory(tmp, retention_days) as reopened:
+                    results["再オープン後"] = snapshot(reopened)
+                    results["再オープン後"]["deleted"] = deleted
+
+        if not reference:
+            reference = results
+            print(f"  {name}: 基準")
+            continue
+        errors = sum(
+            compare(name, stage, reference[stage], snap)
+            for stage, snap in results.items()
+        )
+        print(f"  {name}: {'OK' if errors == 0 else f'{errors}件の不一致'}")
+        failures += errors
+    return failures
+
+
+def throughput(records: list[UsageRecord], calls: int):
+    """書き込み・読み出しの速度を表示"""
+    print(f"スループット（{len(records):,}件）:")
+    print(f"  {'engine':<8} {'insert/s':>12} {'scan/s':>12} {'hourly ms':>10} {'apps ms':>10}")
+    for name, (factory, _) in ENGINES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            with factory(Path(tmp)) as engine:
+                start = time.perf_counter()
+                for record in records:
+                    engine.add_usage_record(record)
+                engine.flush()
+                insert = len(records) / (time.perf_counter() - start)
+
+                start = time.perf_counter()
+                scanned = sum(1 for _ in engine.iter_records())
+                scan = scanned / (time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for i in range(calls):
+                    engine.get_hourly_pattern(i % 24, i % 7, None)
+                hourly = (time.perf_counter() - start) / calls * 1000
+
+                start = time.perf_counter()
+                for _ in range(calls):
+                    engine.get_app_usage_stats()
+                apps = (time.perf_counter() - start) / calls * 1000
+
+        print(f"  {name:<8} {insert:>12,.0f} {scan:>12,.0f} {hourly:>10.3f} {apps:>10.3f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=45, help="生成する記録の期間")
+    parser.add_argument("--retention", type=int, default=30, help="削除チェックの保持日数")
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    failures = conformance(make_records(min(args.rows, 20_000), args.days), args.retention)
+    throughput(make_records(args.rows, args.days, seed=1), args.calls)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
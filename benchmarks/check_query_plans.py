@@ -0,0 +1,57 @@
+"""
+クエリプラン回帰チェック
+Database の主要クエリが全件走査になっていないかを EXPLAIN QUERY PLAN で確認
+
+    python benchmarks/check_query_plans.py [--db usage.db] [--rows 20000] [-v]
+
+全件走査が見つかった場合は終了コード 1 を返す。
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database  # noqa: E402
+from bench_database import fill  # noqa: E402
+
+
+def check(db_path: Path, verbose: bool) -> int:
+    """db_path のDBでクエリプランを検査し、全件走査のクエリ数を返す"""
+    with Database(db_path) as db:
+        db.optimize()
+        plans = db.explain_queries()
+        scans = db.find_full_scans()
+
+    for sql, plan in plans.items():
+        if not verbose and sql not in scans:
+            continue
+        mark = "NG" if sql in scans else "OK"
+        print(f"[{mark}] {' '.join(sql.split())[:100]}")
+        for detail in plan:
+            print(f"       {detail}")
+
+    print(f"{len(plans)}件中 {len(scans)}件が全件走査")
+    return len(scans)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", type=Path, help="検査するDB（省略時はテストデータを生成）")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("-v", "--verbose", action="store_true", help="全クエリの計画を表示")
+    args = parser.parse_args()
+
+    if args.db is not None:
+        return 1 if check(args.db, args.verbose) else 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "usage.db"
+        print(f"usage_log に {args.rows:,} 件を投入中...")
+        fill(db_path, args.rows)
+        return 1 if check(db_path, args.verbose) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,25 @@
 データベースモジュール
 使用パターンログをSQLiteに保存
 """
+import heapq
+import json
 import sqlite3
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Callable, Iterator, Optional
 import logging
 import os
 
+import numpy as np
+
+from app_vocabulary import AppVocabulary, get_vocabulary
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,12 +37,727 @@ class UsageRecord:
     is_charging: bool
     active_app: str
     power_plan: str
+    app_id: int = -1  # アプリ名辞書のID（SystemStatus.app_id。不明なら -1）
+
+
+@dataclass
+class UsageColumns:
+    """使用記録の列データ（各列は連続したNumPy配列）"""
+    epoch: np.ndarray          # int64 エポック秒
+    hour: np.ndarray           # uint8
+    day_of_week: np.ndarray    # uint8
+    cpu: np.ndarray            # float32
+    memory: np.ndarray         # float32
+    battery: np.ndarray        # int8（値なしは -1）
+    battery_mask: np.ndarray   # bool（True = バッテリー値あり）
+    is_charging: np.ndarray    # bool
+    app_id: np.ndarray         # int32
+    plan_id: np.ndarray        # int32
+    app_names: dict[int, str]
+    plan_names: dict[int, str]
+
+    def __len__(self) -> int:
+        return len(self.epoch)
+
+
+# load_columns の読み出し形式（SELECT列と同じ順序）
+_COLUMNS_DTYPE = np.dtype([
+    ("epoch", np.int64),
+    ("hour", np.uint8),
+    ("day_of_week", np.uint8),
+    ("cpu", np.float32),
+    ("memory", np.float32),
+    ("battery", np.int8),
+    ("is_charging", np.bool_),
+    ("app_id", np.int32),
+    ("plan_id", np.int32),
+])
+
+# export / import_ のファイル形式
+#   ヘッダ: マジック, 形式バージョン
+#   チャンク: (行数, 名前表のバイト数) + 名前表 + 列ごとに (バイト数 + zlib圧縮データ)
+#   終端: 行数 0 のチャンク
+_ARCHIVE_HEADER = struct.Struct("<4sH")
+_ARCHIVE_MAGIC = b"PPUA"
+_ARCHIVE_VERSION = 1
+_ARCHIVE_CHUNK = struct.Struct("<II")
+_ARCHIVE_LENGTH = struct.Struct("<I")
+_ARCHIVE_DTYPE = np.dtype([
+    ("timestamp", "<i8"),        # 前の行との差分で保存
+    ("hour", "u1"),
+    ("day_of_week", "u1"),
+    ("cpu_percent", "<f8"),
+    ("memory_percent", "<f8"),
+    ("battery_percent", "i1"),   # 値なしは -1
+    ("is_charging", "u1"),
+    ("app_id", "<u4"),           # 書き出し元DBのID（名前表で名前に対応付け）
+    ("plan_id", "<u4"),
+])
+
+
+def _write_archive_chunk(f, rows: list[tuple], names: dict) -> int:
+    """export のチャンクを1つ書き出し、書いたバイト数を返す"""
+    table = np.array(rows, dtype=_ARCHIVE_DTYPE)
+    epochs = table["timestamp"]
+    epochs[1:] = np.diff(epochs)
+    header = zlib.compress(json.dumps(names, ensure_ascii=False).encode("utf-8"))
+    parts = [_ARCHIVE_CHUNK.pack(len(table), len(header)), header]
+    for name in _ARCHIVE_DTYPE.names:
+        data = zlib.compress(np.ascontiguousarray(table[name]).tobytes())
+        parts += [_ARCHIVE_LENGTH.pack(len(data)), data]
+    chunk = b"".join(parts)
+    f.write(chunk)
+    return len(chunk)
+
+
+def _read_archive(f) -> Iterator[tuple[np.ndarray, dict[int, str], dict[int, str]]]:
+    """export したファイルをチャンクごとに読む: (行, アプリ名表, プラン名表)
+
+    名前表はそれまでのチャンクの分も含む累積。
+    """
+    magic, version = _ARCHIVE_HEADER.unpack(f.read(_ARCHIVE_HEADER.size))
+    if magic != _ARCHIVE_MAGIC or version != _ARCHIVE_VERSION:
+        raise ValueError("使用記録のエクスポートファイルではありません")
+
+    apps: dict[int, str] = {}
+    plans: dict[int, str] = {}
+    while True:
+        count, names_len = _ARCHIVE_CHUNK.unpack(f.read(_ARCHIVE_CHUNK.size))
+        if count == 0:
+            return
+        names = json.loads(zlib.decompress(f.read(names_len)))
+        apps.update((int(k), v) for k, v in names["apps"].items())
+        plans.update((int(k), v) for k, v in names["plans"].items())
+
+        table = np.empty(count, dtype=_ARCHIVE_DTYPE)
+        for name in _ARCHIVE_DTYPE.names:
+            (size,) = _ARCHIVE_LENGTH.unpack(f.read(_ARCHIVE_LENGTH.size))
+            table[name] = np.frombuffer(
+                zlib.decompress(f.read(size)), dtype=_ARCHIVE_DTYPE[name]
+            )
+        table["timestamp"] = np.cumsum(table["timestamp"])
+        yield table, apps, plans
+
+
+@dataclass
+class SeriesPoint:
+    """集約済みの時系列データ点"""
+    start: datetime
+    samples: int
+    cpu_min: float
+    cpu_max: float
+    cpu_avg: float
+    memory_min: float
+    memory_max: float
+    memory_avg: float
+    battery_min: Optional[int]
+    battery_max: Optional[int]
+    battery_avg: Optional[float]
+    charging_ratio: float
+    active_app: str      # 区間内で最も多かったアプリ
+    power_plan: str      # 区間内で最も多かったプラン
+
+
+@dataclass
+class RetentionPolicy:
+    """使用記録の保持ポリシー"""
+    raw_days: int = 30                # 生データの保持日数
+    chunk_size: int = 2000            # 1トランザクションで削除する最大件数
+    max_chunks: int = 25              # 1回のメンテナンスで処理する最大チャンク数
+    vacuum_pages: int = 256           # 1回の incremental_vacuum で解放する最大ページ数
+    keep_aggregates: bool = True      # 削除した行の寄与を集計テーブルに残す
+    downsample: bool = True           # 古い生データを削除せず段階的に集約する
+    minute_days: int = 90             # 分単位集約の保持日数（以降は時間単位へ）
+    hour_days: int = 730              # 時間単位集約の保持日数（以降は日単位へ）
+
+
+@dataclass
+class WriteStats:
+    """書き込みバッファの統計"""
+    buffered_rows: int = 0
+    flushed_rows: int = 0
+    flush_count: int = 0
+    total_flush_ms: float = 0.0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+
+    @property
+    def avg_flush_ms(self) -> float:
+        """1回あたりの平均フラッシュ時間（ms）"""
+        return self.total_flush_ms / self.flush_count if self.flush_count else 0.0
+
+
+# スキーマバージョン（PRAGMA user_version）
+SCHEMA_VERSION = 8
+
+# 進捗コールバック: (段階名, 完了件数, 総件数)
+ProgressCallback = Callable[[str, int, int], None]
+
+# 移行時のコピー単位
+_MIGRATION_CHUNK = 50_000
+
+
+def _migrate_v1(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v1: 初期スキーマ（ISO文字列タイムスタンプ・アプリ名/プラン名を直接保持）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            hour INTEGER NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            cpu_percent REAL NOT NULL,
+            memory_percent REAL NOT NULL,
+            battery_percent INTEGER,
+            is_charging INTEGER NOT NULL,
+            active_app TEXT NOT NULL,
+            power_plan TEXT NOT NULL
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            date DATE PRIMARY KEY,
+            total_minutes INTEGER DEFAULT 0,
+            high_perf_minutes INTEGER DEFAULT 0,
+            balanced_minutes INTEGER DEFAULT 0,
+            power_saver_minutes INTEGER DEFAULT 0,
+            estimated_battery_saved INTEGER DEFAULT 0
+        )
+    """)
+
+    # インデックス作成
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON usage_log(timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_hour ON usage_log(hour)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_app ON usage_log(active_app)")
+
+
+def _migrate_v2(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v2: エポック秒の整数タイムスタンプ、アプリ名/プラン名を辞書テーブル化"""
+    conn.execute("""
+        CREATE TABLE apps (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE plans (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("INSERT INTO apps (name) SELECT DISTINCT active_app FROM usage_log")
+    conn.execute("INSERT INTO plans (name) SELECT DISTINCT power_plan FROM usage_log")
+
+    conn.execute("""
+        CREATE TABLE usage_log_v2 (
+            id INTEGER PRIMARY KEY,
+            timestamp INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            cpu_percent REAL NOT NULL,
+            memory_percent REAL NOT NULL,
+            battery_percent INTEGER,
+            is_charging INTEGER NOT NULL,
+            app_id INTEGER NOT NULL REFERENCES apps(id),
+            plan_id INTEGER NOT NULL REFERENCES plans(id)
+        )
+    """)
+
+    # 旧タイムスタンプはローカル時刻のISO文字列なので 'utc' 修飾子でエポック秒へ
+    total = conn.execute("SELECT COUNT(*) FROM usage_log").fetchone()[0]
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM usage_log").fetchone()[0]
+    done = 0
+    for start in range(0, max_id, _MIGRATION_CHUNK):
+        cursor = conn.execute("""
+            INSERT INTO usage_log_v2
+            (id, timestamp, hour, day_of_week, cpu_percent, memory_percent,
+             battery_percent, is_charging, app_id, plan_id)
+            SELECT
+                u.id,
+                CAST(strftime('%s', u.timestamp, 'utc') AS INTEGER),
+                u.hour, u.day_of_week, u.cpu_percent, u.memory_percent,
+                u.battery_percent, u.is_charging, a.id, p.id
+            FROM usage_log u
+            JOIN apps a ON a.name = u.active_app
+            JOIN plans p ON p.name = u.power_plan
+            WHERE u.id > ? AND u.id <= ?
+        """, (start, start + _MIGRATION_CHUNK))
+        done += cursor.rowcount
+        if progress:
+            progress("usage_log", done, total)
+
+    conn.execute("DROP TABLE usage_log")
+    conn.execute("ALTER TABLE usage_log_v2 RENAME TO usage_log")
+    conn.execute("CREATE INDEX idx_usage_ts ON usage_log(timestamp)")
+    # 時間帯別集計はインデックスだけで完結させる（カバリングインデックス）
+    conn.execute("CREATE INDEX idx_usage_hour ON usage_log(hour, cpu_percent, memory_percent)")
+    conn.execute("CREATE INDEX idx_usage_app ON usage_log(app_id)")
+
+    # 主キー検索のみの小さな表は WITHOUT ROWID にする
+    conn.execute("""
+        CREATE TABLE settings_v2 (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("INSERT INTO settings_v2 SELECT key, value FROM settings")
+    conn.execute("DROP TABLE settings")
+    conn.execute("ALTER TABLE settings_v2 RENAME TO settings")
+
+    conn.execute("""
+        CREATE TABLE daily_stats_v2 (
+            date TEXT PRIMARY KEY,
+            total_minutes INTEGER DEFAULT 0,
+            high_perf_minutes INTEGER DEFAULT 0,
+            balanced_minutes INTEGER DEFAULT 0,
+            power_saver_minutes INTEGER DEFAULT 0,
+            estimated_battery_saved INTEGER DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute("INSERT INTO daily_stats_v2 SELECT * FROM daily_stats")
+    conn.execute("DROP TABLE daily_stats")
+    conn.execute("ALTER TABLE daily_stats_v2 RENAME TO daily_stats")
+
+
+def _rebuild_hourly_rollup(conn: sqlite3.Connection):
+    """hourly_rollup を usage_log から再集計"""
+    conn.execute("DELETE FROM hourly_rollup")
+    conn.execute("""
+        INSERT INTO hourly_rollup
+        (hour, day_of_week, is_charging, plan_id,
+         samples, cpu_sum, cpu_sq_sum, mem_sum, mem_sq_sum)
+        SELECT
+            hour, day_of_week, is_charging, plan_id,
+            COUNT(*),
+            SUM(cpu_percent), SUM(cpu_percent * cpu_percent),
+            SUM(memory_percent), SUM(memory_percent * memory_percent)
+        FROM usage_log
+        GROUP BY hour, day_of_week, is_charging, plan_id
+    """)
+
+
+def _migrate_v3(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v3: 時間帯別の集計テーブル（件数・合計・二乗和）"""
+    conn.execute("""
+        CREATE TABLE hourly_rollup (
+            hour INTEGER NOT NULL,
+            day_of_week INTEGER NOT NULL,
+            is_charging INTEGER NOT NULL,
+            plan_id INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            cpu_sum REAL NOT NULL,
+            cpu_sq_sum REAL NOT NULL,
+            mem_sum REAL NOT NULL,
+            mem_sq_sum REAL NOT NULL,
+            PRIMARY KEY (hour, day_of_week, is_charging, plan_id)
+        ) WITHOUT ROWID
+    """)
+    if progress:
+        progress("hourly_rollup", 0, 1)
+    _rebuild_hourly_rollup(conn)
+    if progress:
+        progress("hourly_rollup", 1, 1)
+
+    # 時間帯別の集計は hourly_rollup が担うので不要
+    conn.execute("DROP INDEX idx_usage_hour")
+
+
+# 段階集約の階層: (名前, 区間の秒数)。生データ → minute → hour → day の順に粗くなる
+TIERS = (("minute", 60), ("hour", 3600), ("day", 86400))
+
+# 集約の読み出し元: 名前 → (テーブル, キー列)
+_TIER_SOURCES = {
+    "raw": ("usage_log", "timestamp"),
+    **{name: (f"usage_{name}", "bucket") for name, _ in TIERS},
+}
+
+_TIER_COLUMNS = """
+    bucket, samples, cpu_min, cpu_max, cpu_sum, mem_min, mem_max, mem_sum,
+    battery_min, battery_max, battery_sum, battery_samples, charging_samples,
+    app_id, plan_id
+"""
+
+
+def _aggregate_sql(source: str) -> str:
+    """source の行を :size 秒の区間に集約するSELECT文を生成
+
+    パラメータ: :size 区間の秒数, :off ローカル時刻のUTCオフセット, [:lo, :hi) 対象範囲。
+    結果列は _TIER_COLUMNS と同じ順序。
+    """
+    table, key = _TIER_SOURCES[source]
+    if source == "raw":
+        aggregates = """
+            COUNT(*), MIN(cpu_percent), MAX(cpu_percent), SUM(cpu_percent),
+            MIN(memory_percent), MAX(memory_percent), SUM(memory_percent),
+            MIN(battery_percent), MAX(battery_percent), COALESCE(SUM(battery_percent), 0),
+            COUNT(battery_percent), SUM(is_charging)
+        """
+        weight = "COUNT(*)"
+    else:
+        aggregates = """
+            SUM(samples), MIN(cpu_min), MAX(cpu_max), SUM(cpu_sum),
+            MIN(mem_min), MAX(mem_max), SUM(mem_sum),
+            MIN(battery_min), MAX(battery_max), SUM(battery_sum),
+            SUM(battery_samples), SUM(charging_samples)
+        """
+        weight = "SUM(samples)"
+
+    def dominant(column: str) -> str:
+        return f"""(
+            SELECT s.{column} FROM {table} s
+            WHERE s.{key} >= MAX(g.b, :lo) AND s.{key} < MIN(g.b + :size, :hi)
+            GROUP BY s.{column} ORDER BY {weight} DESC LIMIT 1
+        )"""
+
+    return f"""
+        SELECT g.*, {dominant("app_id")}, {dominant("plan_id")}
+        FROM (
+            SELECT (({key} + :off) / :size) * :size - :off AS b, {aggregates}
+            FROM {table}
+            WHERE {key} >= :lo AND {key} < :hi
+            GROUP BY b
+        ) g
+        WHERE 1
+    """
+
+
+def _compact_sql(source: str, target: str) -> str:
+    """source を target 階層へ集約して書き込むINSERT文を生成"""
+    return f"""
+        INSERT INTO usage_{target} ({_TIER_COLUMNS})
+        {_aggregate_sql(source)}
+        ON CONFLICT (bucket) DO UPDATE SET
+            app_id = CASE WHEN excluded.samples > samples THEN excluded.app_id ELSE app_id END,
+            plan_id = CASE WHEN excluded.samples > samples THEN excluded.plan_id ELSE plan_id END,
+            samples = samples + excluded.samples,
+            cpu_min = MIN(cpu_min, excluded.cpu_min),
+            cpu_max = MAX(cpu_max, excluded.cpu_max),
+            cpu_sum = cpu_sum + excluded.cpu_sum,
+            mem_min = MIN(mem_min, excluded.mem_min),
+            mem_max = MAX(mem_max, excluded.mem_max),
+            mem_sum = mem_sum + excluded.mem_sum,
+            battery_min = COALESCE(
+                MIN(battery_min, excluded.battery_min), battery_min, excluded.battery_min
+            ),
+            battery_max = COALESCE(
+                MAX(battery_max, excluded.battery_max), battery_max, excluded.battery_max
+            ),
+            battery_sum = battery_sum + excluded.battery_sum,
+            battery_samples = battery_samples + excluded.battery_samples,
+            charging_samples = charging_samples + excluded.charging_samples
+    """
+
+
+_SERIES_SQL = {source: _aggregate_sql(source) for source in _TIER_SOURCES}
+_COMPACT_SQL = {
+    target: _compact_sql(source, target)
+    for source, (target, _) in zip(_TIER_SOURCES, TIERS)
+}
+
+
+def _migrate_v4(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v4: 段階集約テーブル（分・時間・日）"""
+    for name, _ in TIERS:
+        conn.execute(f"""
+            CREATE TABLE usage_{name} (
+                bucket INTEGER PRIMARY KEY,
+                samples INTEGER NOT NULL,
+                cpu_min REAL NOT NULL,
+                cpu_max REAL NOT NULL,
+                cpu_sum REAL NOT NULL,
+                mem_min REAL NOT NULL,
+                mem_max REAL NOT NULL,
+                mem_sum REAL NOT NULL,
+                battery_min INTEGER,
+                battery_max INTEGER,
+                battery_sum INTEGER NOT NULL,
+                battery_samples INTEGER NOT NULL,
+                charging_samples INTEGER NOT NULL,
+                app_id INTEGER NOT NULL REFERENCES apps(id),
+                plan_id INTEGER NOT NULL REFERENCES plans(id)
+            )
+        """)
+
+
+# 旧 daily_stats の列 → プラン名
+_LEGACY_DAILY_COLUMNS = {
+    "high_perf_minutes": "高パフォーマンス",
+    "balanced_minutes": "バランス",
+    "power_saver_minutes": "省電力",
+}
+
+
+def _migrate_v5(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v5: 日次統計をプラン別の正規化テーブルへ（任意のプラン名に対応）"""
+    conn.execute("""
+        CREATE TABLE daily_plan_minutes (
+            date TEXT NOT NULL,
+            plan_id INTEGER NOT NULL REFERENCES plans(id),
+            minutes INTEGER NOT NULL,
+            PRIMARY KEY (date, plan_id)
+        ) WITHOUT ROWID
+    """)
+    for column, plan_name in _LEGACY_DAILY_COLUMNS.items():
+        conn.execute("INSERT OR IGNORE INTO plans (name) VALUES (?)", (plan_name,))
+        conn.execute(f"""
+            INSERT INTO daily_plan_minutes (date, plan_id, minutes)
+            SELECT d.date, p.id, d.{column}
+            FROM daily_stats d JOIN plans p ON p.name = ?
+            WHERE d.{column} > 0
+        """, (plan_name,))
+    conn.execute("DROP TABLE daily_stats")
+
+
+def _rebuild_app_stats(conn: sqlite3.Connection, sample_interval: float):
+    """アプリ別集計を usage_log から再集計"""
+    conn.execute("DELETE FROM app_stats")
+    conn.execute("DELETE FROM app_plan_stats")
+    conn.execute("""
+        INSERT INTO app_stats (app_id, samples, cpu_seconds, last_seen)
+        SELECT app_id, COUNT(*), SUM(cpu_percent) / 100.0 * ?, MAX(timestamp)
+        FROM usage_log
+        GROUP BY app_id
+    """, (sample_interval,))
+    conn.execute("""
+        INSERT INTO app_plan_stats (app_id, plan_id, seconds)
+        SELECT app_id, plan_id, COUNT(*) * ?
+        FROM usage_log
+        GROUP BY app_id, plan_id
+    """, (sample_interval,))
+
+
+def _migrate_v6(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v6: アプリ別の累積集計（件数・CPU加重時間・プラン別時間・最終使用）"""
+    conn.execute("""
+        CREATE TABLE app_stats (
+            app_id INTEGER PRIMARY KEY REFERENCES apps(id),
+            samples INTEGER NOT NULL,
+            cpu_seconds REAL NOT NULL,
+            last_seen INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE app_plan_stats (
+            app_id INTEGER NOT NULL REFERENCES apps(id),
+            plan_id INTEGER NOT NULL REFERENCES plans(id),
+            seconds REAL NOT NULL,
+            PRIMARY KEY (app_id, plan_id)
+        ) WITHOUT ROWID
+    """)
+    # 既存データは30秒間隔で記録されたものとして集計
+    _rebuild_app_stats(conn, 30.0)
+
+
+def _migrate_v7(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v7: 実際のアクセスパターンに合わせた複合インデックス"""
+    # アプリ単独の検索は app_stats が担うので、アプリ＋期間の検索用に置き換える
+    conn.execute("DROP INDEX idx_usage_app")
+    conn.execute("CREATE INDEX idx_usage_app_ts ON usage_log(app_id, timestamp)")
+    # 使用回数の多い順の取得（上位K件を超える limit 指定時）
+    conn.execute("CREATE INDEX idx_app_stats_samples ON app_stats(samples)")
+
+
+def _migrate_v8(conn: sqlite3.Connection, progress: Optional[ProgressCallback]):
+    """v8: アプリ名を正規化（小文字）し、大文字・小文字だけ違うアプリを1つにまとめる"""
+    normalize = AppVocabulary.normalize
+    groups: dict[str, list[int]] = {}
+    for id_, name in conn.execute("SELECT id, name FROM apps ORDER BY id"):
+        groups.setdefault(normalize(name), []).append(id_)
+
+    # まとめる側（最小のID）と、まとめられる側の対応
+    conn.execute("""
+        CREATE TEMP TABLE app_merge (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)
+    """)
+    conn.executemany("INSERT INTO app_merge VALUES (?, ?)", [
+        (id_, ids[0]) for ids in groups.values() if len(ids) > 1 for id_ in ids
+    ])
+    merged = conn.execute("SELECT COUNT(*) FROM app_merge WHERE old_id != new_id").fetchone()[0]
+    if merged:
+        tables = ["usage_log", *(f"usage_{name}" for name, _ in TIERS)]
+        for done, table in enumerate(tables):
+            if progress:
+                progress("apps", done, len(tables))
+            conn.execute(f"""
+                UPDATE {table}
+                SET app_id = (SELECT new_id FROM app_merge WHERE old_id = app_id)
+                WHERE app_id IN (SELECT old_id FROM app_merge WHERE old_id != new_id)
+            """)
+        if progress:
+            progress("apps", len(tables), len(tables))
+
+        # 累積集計は足し合わせる
+        conn.execute("""
+            CREATE TEMP TABLE merged_app_stats AS
+            SELECT m.new_id AS app_id, SUM(s.samples) AS samples,
+                   SUM(s.cpu_seconds) AS cpu_seconds, MAX(s.last_seen) AS last_seen
+            FROM app_stats s JOIN app_merge m ON m.old_id = s.app_id
+            GROUP BY m.new_id
+        """)
+        conn.execute("""
+            CREATE TEMP TABLE merged_app_plan_stats AS
+            SELECT m.new_id AS app_id, s.plan_id, SUM(s.seconds) AS seconds
+            FROM app_plan_stats s JOIN app_merge m ON m.old_id = s.app_id
+            GROUP BY m.new_id, s.plan_id
+        """)
+        conn.execute("DELETE FROM app_stats WHERE app_id IN (SELECT old_id FROM app_merge)")
+        conn.execute("DELETE FROM app_plan_stats WHERE app_id IN (SELECT old_id FROM app_merge)")
+        conn.execute("INSERT INTO app_stats SELECT * FROM merged_app_stats")
+        conn.execute("INSERT INTO app_plan_stats SELECT * FROM merged_app_plan_stats")
+        conn.execute("DROP TABLE merged_app_stats")
+        conn.execute("DROP TABLE merged_app_plan_stats")
+        conn.execute("""
+            DELETE FROM apps WHERE id IN (SELECT old_id FROM app_merge WHERE old_id != new_id)
+        """)
+    conn.execute("DROP TABLE app_merge")
+
+    conn.executemany("UPDATE apps SET name = ? WHERE id = ?", [
+        (name, ids[0]) for name, ids in groups.items()
+    ])
+    if merged:
+        logger.info(f"大文字・小文字だけ違うアプリをまとめました: {merged}件")
+
+
+# バージョン → 移行関数（直前のバージョンから適用）
+MIGRATIONS: dict[int, Callable[[sqlite3.Connection, Optional[ProgressCallback]], None]] = {
+    1: _migrate_v1,
+    2: _migrate_v2,
+    3: _migrate_v3,
+    4: _migrate_v4,
+    5: _migrate_v5,
+    6: _migrate_v6,
+    7: _migrate_v7,
+    8: _migrate_v8,
+}
+
+
+def _table_scans(plan: list[str]) -> list[str]:
+    """EXPLAIN QUERY PLAN の行からインデックスなしの全件走査を抽出
+
+    "SCAN usage_log" は該当、"SCAN app_stats USING INDEX ..." や "SEARCH ..."、
+    サブクエリ結果（CO-ROUTINE / MATERIALIZE された g など）の走査は該当しない。
+    """
+    subqueries = {
+        detail.split()[1] for detail in plan
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+    return [
+        detail for detail in plan
+        if detail.startswith("SCAN ") and " USING " not in detail
+        and detail.split()[1] not in subqueries
+    ]
+
+
+def _setting_str(value: Any) -> str:
+    """設定値を保存用の文字列に変換"""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+# iter_records で指定できる列 → SELECT式
+_COLUMN_SQL = {
+    "id": "id",
+    "timestamp": "timestamp",
+    "hour": "hour",
+    "day_of_week": "day_of_week",
+    "cpu_percent": "cpu_percent",
+    "memory_percent": "memory_percent",
+    "battery_percent": "battery_percent",
+    "is_charging": "is_charging",
+    "active_app": "app_id",
+    "power_plan": "plan_id",
+}
+RECORD_COLUMNS = tuple(_COLUMN_SQL)
 
 
 class Database:
-    """SQLiteデータベース管理"""
+    """SQLiteデータベース管理
+
+    接続は1本を保持して使い回す（WAL + synchronous=NORMAL）。
+    複数スレッドからの呼び出しはロックで直列化する。
+
+    usage_log への書き込みと日次のプラン別稼働時間はメモリ上にバッファし、
+    batch_size 件に達するか最古の未書き込み分が max_buffer_age 秒を超えた
+    時点でまとめてコミットする。
+    異常終了時に失われるのは最大で max_buffer_age 秒分（未フラッシュ分）のみ。
+    バッファ中のアプリは共有のアプリ名辞書のIDで持ち、書き込むまで pin しておく。
+    """
+
+    _INSERT_USAGE_SQL = """
+        INSERT INTO usage_log
+        (timestamp, hour, day_of_week, cpu_percent, memory_percent,
+         battery_percent, is_charging, app_id, plan_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    _UPSERT_ROLLUP_SQL = """
+        INSERT INTO hourly_rollup
+        (hour, day_of_week, is_charging, plan_id,
+         samples, cpu_sum, cpu_sq_sum, mem_sum, mem_sq_sum)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (hour, day_of_week, is_charging, plan_id) DO UPDATE SET
+            samples = samples + excluded.samples,
+            cpu_sum = cpu_sum + excluded.cpu_sum,
+            cpu_sq_sum = cpu_sq_sum + excluded.cpu_sq_sum,
+            mem_sum = mem_sum + excluded.mem_sum,
+            mem_sq_sum = mem_sq_sum + excluded.mem_sq_sum
+    """
+
+    _INTERN_SQL = {
+        "apps": "INSERT INTO apps (name) VALUES (?)",
+        "plans": "INSERT INTO plans (name) VALUES (?)",
+    }
 
-    def __init__(self, db_path: Optional[Path] = None):
+    _UPSERT_DAILY_SQL = """
+        INSERT INTO daily_plan_minutes (date, plan_id, minutes)
+        VALUES (?, ?, ?)
+        ON CONFLICT (date, plan_id) DO UPDATE SET
+            minutes = minutes + excluded.minutes
+    """
+
+    _UPSERT_APP_SQL = """
+        INSERT INTO app_stats (app_id, samples, cpu_seconds, last_seen)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (app_id) DO UPDATE SET
+            samples = samples + excluded.samples,
+            cpu_seconds = cpu_seconds + excluded.cpu_seconds,
+            last_seen = MAX(last_seen, excluded.last_seen)
+    """
+
+    _UPSERT_APP_PLAN_SQL = """
+        INSERT INTO app_plan_stats (app_id, plan_id, seconds)
+        VALUES (?, ?, ?)
+        ON CONFLICT (app_id, plan_id) DO UPDATE SET
+            seconds = seconds + excluded.seconds
+    """
+
+    # メモリ上に保持するアプリ使用回数の上位件数
+    TOP_K = 20
+
+    # プラン名 → get_today_stats の互換キー（ダッシュボード表示用）
+    PLAN_STAT_KEYS = {
+        "高パフォーマンス": "high_perf_minutes",
+        "バランス": "balanced_minutes",
+        "省電力": "power_saver_minutes",
+    }
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        batch_size: int = 20,
+        max_buffer_age: float = 300.0,
+        progress: Optional[ProgressCallback] = None,
+        retention: Optional[RetentionPolicy] = None,
+        sample_interval: float = 30.0,
+        vocabulary: Optional[AppVocabulary] = None
+    ):
         if db_path is None:
             app_data = Path(os.environ.get("APPDATA", "."))
             self.db_path = app_data / "PowerPlanAI" / "usage.db"
@@ -39,211 +765,1173 @@ class Database:
             self.db_path = db_path
 
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self._init_db()
-
-    def _init_db(self):
-        """データベース初期化"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS usage_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME NOT NULL,
-                    hour INTEGER NOT NULL,
-                    day_of_week INTEGER NOT NULL,
-                    cpu_percent REAL NOT NULL,
-                    memory_percent REAL NOT NULL,
-                    battery_percent INTEGER,
-                    is_charging INTEGER NOT NULL,
-                    active_app TEXT NOT NULL,
-                    power_plan TEXT NOT NULL
-                )
-            """)
+        self.sample_interval = sample_interval
+        self.vocabulary = get_vocabulary() if vocabulary is None else vocabulary
+        self._lock = threading.RLock()
+        self._trace: Optional[Callable[[str], None]] = None
+        self._pending_app_counts: list[tuple[int, int]] = []
+        self._conn: Optional[sqlite3.Connection] = self._connect()
+        self._init_db(progress)
 
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL
-                )
-            """)
+        # 書き込みバッファ
+        self.batch_size = max(1, batch_size)
+        self.max_buffer_age = max_buffer_age
+        self._pending: list[tuple] = []
+        self._daily_pending: dict[tuple[str, str], int] = {}
+        self._pending_since = 0.0
+        self._write_stats = WriteStats()
+
+        self.retention = retention or RetentionPolicy()
+        self._setting_listeners: list[tuple[Optional[str], Callable[[str, str], None]]] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """永続接続を開く"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=128,
+        )
+        # 新規DBは WAL に切り替える前（テーブル作成前）に設定すればそのまま有効になる
+        if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # PRAGMA optimize の ANALYZE を表の大きさによらず短時間で終わらせる
+        conn.execute("PRAGMA analysis_limit=1000")
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """ロックを取得してトランザクションを実行（例外時はロールバック）"""
+        with self._lock:
+            if self._conn is None:
+                raise sqlite3.ProgrammingError("データベースは既に閉じられています")
+            try:
+                with self._conn:
+                    yield self._conn
+            except BaseException:
+                self._pending_app_counts = []
+                raise
+            if self._pending_app_counts:
+                self._apply_app_counts()
 
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS daily_stats (
-                    date DATE PRIMARY KEY,
-                    total_minutes INTEGER DEFAULT 0,
-                    high_perf_minutes INTEGER DEFAULT 0,
-                    balanced_minutes INTEGER DEFAULT 0,
-                    power_saver_minutes INTEGER DEFAULT 0,
-                    estimated_battery_saved INTEGER DEFAULT 0
+    def close(self):
+        """バッファをフラッシュして接続を閉じる"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self.flush()
+                    self.optimize()
+                except sqlite3.Error as e:
+                    logger.error(f"終了時のフラッシュに失敗: {e}")
+                self._conn.close()
+                self._conn = None
+                logger.info("データベース接続を閉じました")
+
+    def __enter__(self) -> "Database":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _init_db(self, progress: Optional[ProgressCallback] = None):
+        """データベース初期化（スキーマを最新版へ移行）"""
+        with self._lock:
+            conn = self._conn
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(
+                    f"未対応のスキーマバージョンです: v{version}（対応: v{SCHEMA_VERSION}）"
                 )
-            """)
 
-            # インデックス作成
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON usage_log(timestamp)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_hour ON usage_log(hour)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_app ON usage_log(active_app)")
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    MIGRATIONS[target](conn, progress)
+                    conn.execute(f"PRAGMA user_version = {target}")
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                if version > 0:
+                    logger.info(f"スキーマを v{target} に移行しました")
+            if version < SCHEMA_VERSION:
+                # インデックスが変わったので統計を取り直す
+                conn.execute("ANALYZE")
 
-            conn.commit()
-            logger.info(f"データベース初期化完了: {self.db_path}")
+            # 既存DBの incremental auto_vacuum への切り替え（VACUUM が要る）は
+            # 起動を遅らせないよう run_maintenance まで延ばす
+
+            self._load_dictionaries(conn)
+            self._settings: dict[str, str] = dict(
+                conn.execute("SELECT key, value FROM settings")
+            )
+            self._load_app_counts(conn)
+
+        logger.info(f"データベース初期化完了: {self.db_path}")
+
+    def _load_dictionaries(self, conn: sqlite3.Connection):
+        """アプリ名・プラン名の辞書を読み込み"""
+        self._app_ids = {name: id_ for id_, name in conn.execute("SELECT id, name FROM apps")}
+        self._plan_ids = {name: id_ for id_, name in conn.execute("SELECT id, name FROM plans")}
+        self._app_names = {id_: name for name, id_ in self._app_ids.items()}
+        self._plan_names = {id_: name for name, id_ in self._plan_ids.items()}
+        # アプリ名辞書のID → (名前, apps.id)
+        self._vocabulary_app_ids: dict[int, tuple[str, int]] = {}
+
+    def _load_app_counts(self, conn: sqlite3.Connection):
+        """アプリ別件数と上位K件を読み込み"""
+        self._app_samples: dict[int, int] = dict(
+            conn.execute("SELECT app_id, samples FROM app_stats")
+        )
+        counts = self._app_samples
+        self._top_apps: list[int] = heapq.nlargest(self.TOP_K, counts, key=counts.get)
+
+    def _intern(self, conn: sqlite3.Connection, table: str, name: str) -> int:
+        """辞書テーブルのIDを取得（未登録なら追加。アプリ名は正規化する）"""
+        if table == "apps":
+            name = self.vocabulary.normalize(name)
+        ids, names = (
+            (self._app_ids, self._app_names) if table == "apps"
+            else (self._plan_ids, self._plan_names)
+        )
+        id_ = ids.get(name)
+        if id_ is None:
+            cursor = conn.execute(self._INTERN_SQL[table], (name,))
+            id_ = cursor.lastrowid
+            ids[name] = id_
+            names[id_] = name
+        return id_
+
+    def _intern_app(self, conn: sqlite3.Connection, vocabulary_id: int) -> int:
+        """アプリ名辞書のIDから apps.id を取得（未登録なら追加）
+
+        アプリ名辞書のIDは pin が外れると別の名前に使い回されるので、名前も比べる。
+        """
+        name = self.vocabulary.name(vocabulary_id)
+        entry = self._vocabulary_app_ids.get(vocabulary_id)
+        if entry is not None and entry[0] == name:
+            return entry[1]
+        id_ = self._intern(conn, "apps", name)
+        self._vocabulary_app_ids[vocabulary_id] = (name, id_)
+        return id_
+
+    def optimize(self):
+        """クエリプランナーの統計を必要な表だけ更新（PRAGMA optimize）"""
+        with self._lock:
+            self._conn.execute("PRAGMA optimize")
+
+    def vacuum(self):
+        """ファイルを再構築して空き領域を解放（auto_vacuum も INCREMENTAL に切り替わる）"""
+        self.flush()
+        with self._lock:
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("VACUUM")
+
+    def _switch_auto_vacuum(self) -> bool:
+        """auto_vacuum が INCREMENTAL でなければ VACUUM して切り替え、切り替えたかを返す"""
+        with self._lock:
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+        logger.info("auto_vacuum を INCREMENTAL に切り替えています...")
+        self.vacuum()
+        return True
 
     def add_usage_record(self, record: UsageRecord):
-        """使用記録を追加"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO usage_log
-                (timestamp, hour, day_of_week, cpu_percent, memory_percent,
-                 battery_percent, is_charging, active_app, power_plan)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                record.timestamp.isoformat(),
-                record.hour,
-                record.day_of_week,
-                record.cpu_percent,
-                record.memory_percent,
-                record.battery_percent,
-                1 if record.is_charging else 0,
-                record.active_app,
-                record.power_plan
-            ))
-            conn.commit()
+        """使用記録を追加（バッファ経由）"""
+        row = (
+            int(record.timestamp.timestamp()),
+            record.hour,
+            record.day_of_week,
+            record.cpu_percent,
+            record.memory_percent,
+            record.battery_percent,
+            1 if record.is_charging else 0,
+            self.vocabulary.acquire(record.active_app, record.app_id),
+            record.power_plan
+        )
+        with self._lock:
+            if not self._has_pending():
+                self._pending_since = time.monotonic()
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+            else:
+                self.flush_if_due()
+
+    def flush_if_due(self) -> bool:
+        """最古の未書き込み分が max_buffer_age を超えていればフラッシュ"""
+        with self._lock:
+            if not self._has_pending():
+                return False
+            if time.monotonic() - self._pending_since < self.max_buffer_age:
+                return False
+            self.flush()
+            return True
+
+    def _has_pending(self) -> bool:
+        """未書き込みのデータがあるか"""
+        return bool(self._pending or self._daily_pending)
+
+    def flush(self) -> int:
+        """バッファ済みの使用記録・日次統計を1トランザクションで書き込む
+
+        Returns:
+            書き込んだ使用記録の件数
+        """
+        with self._lock:
+            if not self._has_pending():
+                return 0
+
+            rows = self._pending
+            daily = self._daily_pending
+            start = time.perf_counter()
+            try:
+                with self._transaction() as conn:
+                    resolved = [
+                        row[:7] + (
+                            self._intern_app(conn, row[7]),
+                            self._intern(conn, "plans", row[8]),
+                        )
+                        for row in rows
+                    ]
+                    conn.executemany(self._INSERT_USAGE_SQL, resolved)
+                    self._update_rollups(conn, resolved)
+                    conn.executemany(self._UPSERT_DAILY_SQL, [
+                        (date, self._intern(conn, "plans", plan_name), minutes)
+                        for (date, plan_name), minutes in daily.items()
+                    ])
+            except sqlite3.Error:
+                # ロールバックされた辞書エントリを破棄
+                self._load_dictionaries(self._conn)
+                raise
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._pending = []
+            self._daily_pending = {}
+            for row in rows:
+                self.vocabulary.release(row[7])
+            if not rows:
+                return 0
+
+            stats = self._write_stats
+            stats.flushed_rows += len(rows)
+            stats.flush_count += 1
+            stats.last_flush_ms = elapsed_ms
+            stats.total_flush_ms += elapsed_ms
+            stats.max_flush_ms = max(stats.max_flush_ms, elapsed_ms)
+            logger.debug(f"使用記録をフラッシュ: {len(rows)}件 ({elapsed_ms:.1f}ms)")
+            return len(rows)
+
+    def _update_rollups(self, conn: sqlite3.Connection, rows: list[tuple], sign: int = 1):
+        """書き込んだ行を集計テーブルへ反映（sign=-1 で差し引き）
+
+        rows の先頭9列は (timestamp, hour, day_of_week, cpu, memory,
+        battery, is_charging, app_id, plan_id)。
+        """
+        interval = self.sample_interval
+        hourly: dict[tuple, list] = {}
+        apps: dict[int, list] = {}
+        app_plans: dict[tuple, float] = {}
+        for row in rows:
+            ts, hour, dow, cpu, mem, _, charging, app_id, plan_id = row[:9]
+            acc = hourly.get((hour, dow, charging, plan_id))
+            if acc is None:
+                acc = hourly[(hour, dow, charging, plan_id)] = [0, 0.0, 0.0, 0.0, 0.0]
+            acc[0] += sign
+            acc[1] += sign * cpu
+            acc[2] += sign * cpu * cpu
+            acc[3] += sign * mem
+            acc[4] += sign * mem * mem
+
+            app = apps.get(app_id)
+            if app is None:
+                app = apps[app_id] = [0, 0.0, ts]
+            app[0] += sign
+            app[1] += sign * cpu / 100 * interval
+            app[2] = max(app[2], ts)
+            key = (app_id, plan_id)
+            app_plans[key] = app_plans.get(key, 0.0) + sign * interval
+
+        conn.executemany(
+            self._UPSERT_ROLLUP_SQL,
+            [key + tuple(acc) for key, acc in hourly.items()]
+        )
+        conn.executemany(
+            self._UPSERT_APP_SQL,
+            [(app_id, *acc) for app_id, acc in apps.items()]
+        )
+        conn.executemany(
+            self._UPSERT_APP_PLAN_SQL,
+            [key + (seconds,) for key, seconds in app_plans.items()]
+        )
+        # メモリ上の上位K件はコミット後に反映（_transaction 参照）
+        self._pending_app_counts.extend((app_id, acc[0]) for app_id, acc in apps.items())
+
+    def _apply_app_counts(self):
+        """コミット済みのアプリ別件数を上位K件の構造へ反映"""
+        counts = self._app_samples
+        top = set(self._top_apps)
+        changed: dict[int, None] = {}
+        rebuild = False
+        for app_id, delta in self._pending_app_counts:
+            counts[app_id] = counts.get(app_id, 0) + delta
+            changed[app_id] = None
+            # 上位のアプリが減った場合は圏外のアプリと入れ替わり得るので作り直す
+            rebuild = rebuild or (delta < 0 and app_id in top)
+        if rebuild:
+            self._top_apps = heapq.nlargest(self.TOP_K, counts, key=counts.get)
+        else:
+            # 増えただけなら、入れ替わり得るのは今の上位と件数が変わったアプリだけ
+            candidates = self._top_apps + [app_id for app_id in changed if app_id not in top]
+            self._top_apps = heapq.nlargest(self.TOP_K, candidates, key=counts.get)
+        self._pending_app_counts = []
+
+    def rebuild_rollups(self):
+        """集計テーブルを usage_log から作り直す（バックフィル）
+
+        保持期間を過ぎて削除済みの行の寄与は失われる点に注意。
+        """
+        self.flush()
+        with self._transaction() as conn:
+            _rebuild_hourly_rollup(conn)
+            _rebuild_app_stats(conn, self.sample_interval)
+            self._load_app_counts(conn)
+        logger.info("集計テーブルを再構築しました")
+
+    def get_write_stats(self) -> WriteStats:
+        """書き込みバッファの統計を取得"""
+        with self._lock:
+            stats = self._write_stats
+            return WriteStats(
+                buffered_rows=len(self._pending),
+                flushed_rows=stats.flushed_rows,
+                flush_count=stats.flush_count,
+                total_flush_ms=stats.total_flush_ms,
+                last_flush_ms=stats.last_flush_ms,
+                max_flush_ms=stats.max_flush_ms,
+            )
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """ストリーミング読み出し用の読み取り専用接続を開く
+
+        WALのスナップショットを読むため、書き込み側をブロックしない。
+        """
+        uri = self.db_path.resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if self._trace is not None:
+            conn.set_trace_callback(self._trace)
+        return conn
+
+    def _record_query(
+        self,
+        columns: tuple[str, ...],
+        since: Optional[datetime],
+        until: Optional[datetime],
+        descending: bool,
+        app: Optional[str] = None
+    ) -> tuple[str, tuple]:
+        """iter_records 用のSQLとパラメータを組み立て"""
+        unknown = set(columns) - set(RECORD_COLUMNS)
+        if unknown:
+            raise ValueError(f"不明な列: {', '.join(sorted(unknown))}")
+
+        select = ", ".join(_COLUMN_SQL[c] for c in columns)
+        order = "DESC" if descending else "ASC"
+        where, params = self._range_filter(since, until, app)
+        sql = f"""
+            SELECT {select} FROM usage_log
+            WHERE {where}
+            ORDER BY timestamp {order}
+        """
+        return sql, params
+
+    def _range_filter(
+        self,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        app: Optional[str]
+    ) -> tuple[str, tuple]:
+        """期間（＋アプリ）の WHERE 句とパラメータ
+
+        アプリ指定時は idx_usage_app_ts、それ以外は idx_usage_ts で範囲検索になる。
+        """
+        params = (
+            int(since.timestamp()) if since else 0,
+            int(until.timestamp()) if until else 2**62,
+        )
+        if app is None:
+            return "timestamp >= ? AND timestamp < ?", params
+        # 未登録のアプリは該当なし
+        app_id = self._app_ids.get(self.vocabulary.normalize(app), -1)
+        return "app_id = ? AND timestamp >= ? AND timestamp < ?", (app_id, *params)
+
+    def iter_batches(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        columns: tuple[str, ...] = RECORD_COLUMNS,
+        chunk_size: int = 4096,
+        descending: bool = False,
+        app: Optional[str] = None
+    ) -> Iterator[list[tuple]]:
+        """使用記録を chunk_size 件ずつのタプルのリストで返す
+
+        timestamp はエポック秒、active_app / power_plan は名前、
+        is_charging は 0/1 のまま返す。メモリ使用量は期間の長さに依存しない。
+        app を指定するとそのアプリの記録だけを返す。
+        """
+        sql, params = self._record_query(columns, since, until, descending, app)
+        app_idx = columns.index("active_app") if "active_app" in columns else -1
+        plan_idx = columns.index("power_plan") if "power_plan" in columns else -1
+
+        self.flush()
+        conn = self._open_reader()
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                if app_idx >= 0 or plan_idx >= 0:
+                    chunk = [self._resolve_names(row, app_idx, plan_idx) for row in chunk]
+                yield chunk
+        finally:
+            conn.close()
+
+    def _resolve_names(self, row: tuple, app_idx: int, plan_idx: int) -> tuple:
+        """行内のアプリID・プランIDを名前へ置換"""
+        row = list(row)
+        if app_idx >= 0:
+            row[app_idx] = self._app_names[row[app_idx]]
+        if plan_idx >= 0:
+            row[plan_idx] = self._plan_names[row[plan_idx]]
+        return tuple(row)
+
+    def iter_columns(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        columns: tuple[str, ...] = RECORD_COLUMNS,
+        chunk_size: int = 4096,
+        app: Optional[str] = None
+    ) -> Iterator[dict[str, tuple]]:
+        """使用記録を列ごとのバッチ（列名 → 値のタプル）で返す"""
+        for chunk in self.iter_batches(since, until, columns, chunk_size, app=app):
+            yield dict(zip(columns, zip(*chunk)))
+
+    def iter_records(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        columns: Optional[tuple[str, ...]] = None,
+        chunk_size: int = 4096,
+        descending: bool = False,
+        app: Optional[str] = None
+    ) -> Iterator:
+        """使用記録を1件ずつストリーミング
+
+        columns を省略すると UsageRecord、指定するとその列のタプルを返す。
+        """
+        if columns is not None:
+            for chunk in self.iter_batches(since, until, columns, chunk_size, descending, app):
+                yield from chunk
+            return
+
+        fromtimestamp = datetime.fromtimestamp
+        for chunk in self.iter_batches(
+            since, until, RECORD_COLUMNS, chunk_size, descending, app
+        ):
+            for row in chunk:
+                yield UsageRecord(
+                    id=row[0],
+                    timestamp=fromtimestamp(row[1]),
+                    hour=row[2],
+                    day_of_week=row[3],
+                    cpu_percent=row[4],
+                    memory_percent=row[5],
+                    battery_percent=row[6],
+                    is_charging=bool(row[7]),
+                    active_app=row[8],
+                    power_plan=row[9]
+                )
+
+    def load_columns(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        app: Optional[str] = None
+    ) -> UsageColumns:
+        """期間内の使用記録を列ごとのNumPy配列で取得
+
+        カーソルから直接構造化配列を作るため、行ごとのオブジェクト生成がない。
+        """
+        where, params = self._range_filter(since, until, app)
+
+        self.flush()
+        conn = self._open_reader()
+        try:
+            # 件数と本体を同じスナップショットで読む
+            conn.execute("BEGIN")
+            count = conn.execute(
+                f"SELECT COUNT(*) FROM usage_log WHERE {where}", params
+            ).fetchone()[0]
+            cursor = conn.execute(f"""
+                SELECT
+                    timestamp, hour, day_of_week, cpu_percent, memory_percent,
+                    COALESCE(battery_percent, -1), is_charging, app_id, plan_id
+                FROM usage_log
+                WHERE {where}
+                ORDER BY timestamp
+            """, params)
+            table = np.fromiter(cursor, dtype=_COLUMNS_DTYPE, count=count)
+        finally:
+            conn.close()
+
+        battery = np.ascontiguousarray(table["battery"])
+        return UsageColumns(
+            epoch=np.ascontiguousarray(table["epoch"]),
+            hour=np.ascontiguousarray(table["hour"]),
+            day_of_week=np.ascontiguousarray(table["day_of_week"]),
+            cpu=np.ascontiguousarray(table["cpu"]),
+            memory=np.ascontiguousarray(table["memory"]),
+            battery=battery,
+            battery_mask=battery >= 0,
+            is_charging=np.ascontiguousarray(table["is_charging"]),
+            app_id=np.ascontiguousarray(table["app_id"]),
+            plan_id=np.ascontiguousarray(table["plan_id"]),
+            app_names=dict(self._app_names),
+            plan_names=dict(self._plan_names),
+        )
+
+    def export(
+        self,
+        path: Path,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chunk_size: int = 65536
+    ) -> int:
+        """期間内の使用記録を圧縮した列形式のファイルへ書き出す
+
+        chunk_size 行ずつ読み書きするため、メモリ使用量は期間の長さに依存しない。
+        書き終わるまでは一時ファイルに書き、完了後に置き換える。
+
+        Returns:
+            書き出した件数
+        """
+        where, params = self._range_filter(since, until, None)
+        tmp = path.with_name(path.name + ".tmp")
+        written_apps: set[int] = set()
+        written_plans: set[int] = set()
+        total = 0
+        size = _ARCHIVE_HEADER.size
+
+        self.flush()
+        conn = self._open_reader()
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_ARCHIVE_HEADER.pack(_ARCHIVE_MAGIC, _ARCHIVE_VERSION))
+                cursor = conn.execute(f"""
+                    SELECT
+                        timestamp, hour, day_of_week, cpu_percent, memory_percent,
+                        COALESCE(battery_percent, -1), is_charging, app_id, plan_id
+                    FROM usage_log
+                    WHERE {where}
+                    ORDER BY timestamp
+                """, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    # このチャンクで初めて出てくる名前だけを書く
+                    apps = {row[7] for row in rows} - written_apps
+                    plans = {row[8] for row in rows} - written_plans
+                    names = {
+                        "apps": {id_: self._app_names[id_] for id_ in apps},
+                        "plans": {id_: self._plan_names[id_] for id_ in plans},
+                    }
+                    written_apps |= apps
+                    written_plans |= plans
+                    size += _write_archive_chunk(f, rows, names)
+                    total += len(rows)
+                f.write(_ARCHIVE_CHUNK.pack(0, 0))
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"使用記録を書き出し: {total}件 ({size / 1024:.0f} KB) → {path}")
+        return total
+
+    def import_(self, path: Path) -> int:
+        """export したファイルの使用記録を取り込む
+
+        (timestamp, アプリ) が既に存在する記録は重複とみなして読み飛ばすため、
+        複数台のデータを同じDBへ何度取り込んでもよい。
+        チャンクごとにコミットし、集計テーブルも更新する。
+
+        Returns:
+            追加した件数
+        """
+        self.flush()
+        inserted = 0
+        skipped = 0
+        with open(path, "rb") as f:
+            for table, app_names, plan_names in _read_archive(f):
+                rows = table.tolist()
+                try:
+                    with self._transaction() as conn:
+                        app_map = {
+                            id_: self._intern(conn, "apps", app_names[id_])
+                            for id_ in np.unique(table["app_id"]).tolist()
+                        }
+                        plan_map = {
+                            id_: self._intern(conn, "plans", plan_names[id_])
+                            for id_ in np.unique(table["plan_id"]).tolist()
+                        }
+
+                        # 同じ期間の既存記録（idx_usage_app_ts だけで引ける）
+                        lo, hi = rows[0][0], rows[-1][0]
+                        existing = set()
+                        for app_id in app_map.values():
+                            existing.update(conn.execute("""
+                                SELECT timestamp, app_id FROM usage_log
+                                WHERE app_id = ? AND timestamp BETWEEN ? AND ?
+                            """, (app_id, lo, hi)))
+
+                        resolved = []
+                        for ts, hour, dow, cpu, mem, battery, charging, app_id, plan_id in rows:
+                            key = (ts, app_map[app_id])
+                            if key in existing:
+                                continue
+                            existing.add(key)
+                            resolved.append((
+                                ts, hour, dow, cpu, mem,
+                                None if battery < 0 else battery, charging,
+                                key[1], plan_map[plan_id],
+                            ))
+                        conn.executemany(self._INSERT_USAGE_SQL, resolved)
+                        self._update_rollups(conn, resolved)
+                except sqlite3.Error:
+                    # ロールバックされた辞書エントリを破棄
+                    self._load_dictionaries(self._conn)
+                    raise
+                inserted += len(resolved)
+                skipped += len(rows) - len(resolved)
+
+        logger.info(f"使用記録を取り込み: {inserted}件（重複 {skipped}件）← {path}")
+        return inserted
 
     def get_recent_records(self, hours: int = 24) -> list[UsageRecord]:
-        """直近の使用記録を取得"""
+        """直近の使用記録を取得（新しい順）"""
         since = datetime.now() - timedelta(hours=hours)
+        return list(self.iter_records(since=since, descending=True))
 
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM usage_log
-                WHERE timestamp > ?
-                ORDER BY timestamp DESC
-            """, (since.isoformat(),))
-
-            records = []
-            for row in cursor.fetchall():
-                records.append(UsageRecord(
-                    id=row["id"],
-                    timestamp=datetime.fromisoformat(row["timestamp"]),
-                    hour=row["hour"],
-                    day_of_week=row["day_of_week"],
-                    cpu_percent=row["cpu_percent"],
-                    memory_percent=row["memory_percent"],
-                    battery_percent=row["battery_percent"],
-                    is_charging=bool(row["is_charging"]),
-                    active_app=row["active_app"],
-                    power_plan=row["power_plan"]
-                ))
-            return records
-
-    def get_hourly_pattern(self, hour: int) -> dict:
-        """特定時間帯の使用パターンを取得"""
-        with sqlite3.connect(self.db_path) as conn:
+    def get_hourly_pattern(
+        self,
+        hour: int,
+        day_of_week: Optional[int] = None,
+        is_charging: Optional[bool] = None
+    ) -> dict:
+        """特定時間帯の使用パターンを取得（曜日・AC接続で絞り込み可）"""
+        dow_range = (0, 6) if day_of_week is None else (day_of_week, day_of_week)
+        charging_range = (0, 1) if is_charging is None else (int(is_charging),) * 2
+
+        self.flush()
+        with self._transaction() as conn:
             cursor = conn.execute("""
                 SELECT
-                    AVG(cpu_percent) as avg_cpu,
-                    AVG(memory_percent) as avg_memory,
-                    COUNT(*) as count
-                FROM usage_log
+                    SUM(samples), SUM(cpu_sum), SUM(cpu_sq_sum),
+                    SUM(mem_sum), SUM(mem_sq_sum)
+                FROM hourly_rollup
                 WHERE hour = ?
-            """, (hour,))
-            row = cursor.fetchone()
+                  AND day_of_week BETWEEN ? AND ?
+                  AND is_charging BETWEEN ? AND ?
+            """, (hour, *dow_range, *charging_range))
+            count, cpu_sum, cpu_sq, mem_sum, mem_sq = cursor.fetchone()
 
-            return {
-                "avg_cpu": row[0] or 0,
-                "avg_memory": row[1] or 0,
-                "count": row[2] or 0
-            }
+        if not count:
+            return {"avg_cpu": 0, "avg_memory": 0, "std_cpu": 0, "std_memory": 0, "count": 0}
+
+        avg_cpu = cpu_sum / count
+        avg_mem = mem_sum / count
+        return {
+            "avg_cpu": avg_cpu,
+            "avg_memory": avg_mem,
+            "std_cpu": max(cpu_sq / count - avg_cpu * avg_cpu, 0.0) ** 0.5,
+            "std_memory": max(mem_sq / count - avg_mem * avg_mem, 0.0) ** 0.5,
+            "count": count
+        }
+
+    def get_app_usage_stats(self, limit: int = 20) -> dict[str, int]:
+        """アプリ別使用回数を取得（多い順）
 
-    def get_app_usage_stats(self) -> dict[str, int]:
-        """アプリ別使用回数を取得"""
-        with sqlite3.connect(self.db_path) as conn:
+        limit が TOP_K 以下ならメモリ上の上位K件から即座に返す。
+        """
+        self.flush()
+        with self._lock:
+            if limit <= self.TOP_K:
+                counts = self._app_samples
+                return {
+                    self._app_names[app_id]: counts[app_id]
+                    for app_id in self._top_apps[:limit]
+                }
+
+        with self._transaction() as conn:
             cursor = conn.execute("""
-                SELECT active_app, COUNT(*) as count
-                FROM usage_log
-                GROUP BY active_app
-                ORDER BY count DESC
-                LIMIT 20
-            """)
-            return {row[0]: row[1] for row in cursor.fetchall()}
-
-    def update_daily_stats(self, plan_name: str, minutes: int = 1):
-        """日次統計を更新"""
-        today = datetime.now().date().isoformat()
-        plan_col_map = {
-            "高パフォーマンス": "high_perf_minutes",
-            "バランス": "balanced_minutes",
-            "省電力": "power_saver_minutes",
+                SELECT app_id, samples FROM app_stats
+                ORDER BY samples DESC
+                LIMIT ?
+            """, (limit,))
+            return {self._app_names[row[0]]: row[1] for row in cursor.fetchall()}
+
+    def get_app_stats(self, app: str) -> Optional[dict]:
+        """アプリ1件の累積統計を取得（未記録なら None）"""
+        self.flush()
+        app_id = self._app_ids.get(self.vocabulary.normalize(app))
+        if app_id is None:
+            return None
+
+        with self._transaction() as conn:
+            row = conn.execute("""
+                SELECT samples, cpu_seconds, last_seen FROM app_stats WHERE app_id = ?
+            """, (app_id,)).fetchone()
+            if row is None:
+                return None
+            plans = {
+                self._plan_names[plan_id]: seconds
+                for plan_id, seconds in conn.execute(
+                    "SELECT plan_id, seconds FROM app_plan_stats WHERE app_id = ?",
+                    (app_id,)
+                )
+            }
+
+        return {
+            "samples": row[0],
+            "cpu_seconds": row[1],
+            "last_seen": datetime.fromtimestamp(row[2]),
+            "plan_seconds": plans,
         }
-        plan_col = plan_col_map.get(plan_name, "balanced_minutes")
-
-        with sqlite3.connect(self.db_path) as conn:
-            # まず既存レコードを確認
-            cursor = conn.execute("SELECT 1 FROM daily_stats WHERE date = ?", (today,))
-            exists = cursor.fetchone() is not None
-
-            if exists:
-                conn.execute(f"""
-                    UPDATE daily_stats SET
-                        total_minutes = total_minutes + ?,
-                        {plan_col} = {plan_col} + ?
-                    WHERE date = ?
-                """, (minutes, minutes, today))
-            else:
-                conn.execute(f"""
-                    INSERT INTO daily_stats (date, total_minutes, {plan_col})
-                    VALUES (?, ?, ?)
-                """, (today, minutes, minutes))
-            conn.commit()
+
+    def update_daily_stats(
+        self,
+        plan_name: str,
+        minutes: int = 1,
+        when: Optional[datetime] = None
+    ):
+        """日次統計（プラン別稼働時間）を加算
+
+        メモリ上で集計し、フラッシュ時に1回の UPSERT で書き込む。
+        日付は呼び出し時点で決まるため、日付をまたいでも正しい日に計上される。
+        """
+        date = (when or datetime.now()).date().isoformat()
+        with self._lock:
+            if not self._has_pending():
+                self._pending_since = time.monotonic()
+            key = (date, plan_name)
+            self._daily_pending[key] = self._daily_pending.get(key, 0) + minutes
+            self.flush_if_due()
+
+    def get_daily_stats(self, date: str) -> dict:
+        """指定日（YYYY-MM-DD）の統計を取得（未書き込み分を含む）"""
+        with self._transaction() as conn:
+            plans = {
+                self._plan_names[plan_id]: minutes
+                for plan_id, minutes in conn.execute(
+                    "SELECT plan_id, minutes FROM daily_plan_minutes WHERE date = ?",
+                    (date,)
+                )
+            }
+            for (pending_date, plan_name), minutes in self._daily_pending.items():
+                if pending_date == date:
+                    plans[plan_name] = plans.get(plan_name, 0) + minutes
+
+        stats = {
+            "date": date,
+            "total_minutes": sum(plans.values()),
+            "plans": plans,
+            # 旧 daily_stats の列。値を記録したことはないが、参照する呼び出し側のために残す
+            "estimated_battery_saved": 0,
+        }
+        for plan_name, key in self.PLAN_STAT_KEYS.items():
+            stats[key] = plans.get(plan_name, 0)
+        return stats
 
     def get_today_stats(self) -> dict:
         """今日の統計を取得"""
-        today = datetime.now().date().isoformat()
+        return self.get_daily_stats(datetime.now().date().isoformat())
 
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM daily_stats WHERE date = ?
-            """, (today,))
-            row = cursor.fetchone()
+    def get_setting(self, key: str, default: str = "") -> str:
+        """設定値を取得（キャッシュから）"""
+        return self._settings.get(key, default)
+
+    def get_int(self, key: str, default: int = 0) -> int:
+        """設定値を整数で取得"""
+        try:
+            return int(self._settings[key])
+        except (KeyError, ValueError):
+            return default
+
+    def get_float(self, key: str, default: float = 0.0) -> float:
+        """設定値を浮動小数点数で取得"""
+        try:
+            return float(self._settings[key])
+        except (KeyError, ValueError):
+            return default
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        """設定値を真偽値で取得（"1"/"true"/"yes"/"on" を真とみなす）"""
+        value = self._settings.get(key)
+        if value is None:
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
+    def get_json(self, key: str, default: Any = None) -> Any:
+        """設定値をJSONとして取得"""
+        value = self._settings.get(key)
+        if value is None:
+            return default
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            logger.warning(f"設定値がJSONとして不正です: {key}")
+            return default
+
+    def set_setting(self, key: str, value: Any):
+        """設定値を保存（DBとキャッシュの両方へ書き込む）"""
+        self.set_settings({key: value})
+
+    def set_json(self, key: str, value: Any):
+        """設定値をJSONとして保存"""
+        self.set_settings({key: json.dumps(value, ensure_ascii=False)})
+
+    def set_settings(self, values: dict[str, Any]):
+        """複数の設定値を1トランザクションで保存"""
+        values = {key: _setting_str(value) for key, value in values.items()}
+        with self._lock:
+            with self._transaction() as conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)
+                """, values.items())
+            # キャッシュはコミットできてから更新する
+            changed = {
+                key: value for key, value in values.items()
+                if self._settings.get(key) != value
+            }
+            self._settings.update(values)
+
+        # コミット後に通知（呼び出し元のスレッドで実行される）
+        for key, value in changed.items():
+            for listener_key, callback in list(self._setting_listeners):
+                if listener_key is None or listener_key == key:
+                    try:
+                        callback(key, value)
+                    except Exception as e:
+                        logger.error(f"設定変更コールバックエラー ({key}): {e}")
+
+    def add_setting_listener(
+        self,
+        callback: Callable[[str, str], None],
+        key: Optional[str] = None
+    ):
+        """設定変更の通知先を登録（key=None で全キー）
+
+        コールバックは set_setting を呼んだスレッドで実行されるため、
+        Qt ウィジェットを操作する場合はシグナル経由でGUIスレッドへ渡すこと。
+        """
+        self._setting_listeners.append((key, callback))
+
+    def remove_setting_listener(self, callback: Callable[[str, str], None]):
+        """設定変更の通知先を解除"""
+        self._setting_listeners = [
+            (key, cb) for key, cb in self._setting_listeners if cb is not callback
+        ]
+
+    def cleanup_old_records(
+        self, days: Optional[int] = None, max_chunks: Optional[int] = None
+    ) -> int:
+        """days 日（省略時は retention.raw_days）より古い記録をチャンク単位で削除
+
+        チャンクごとにコミットするため、書き込みロックを長時間保持しない。
+        max_chunks を指定した場合はそこで打ち切る（残りは次回）。
+
+        Returns:
+            削除した件数
+        """
+        policy = self.retention
+        days = policy.raw_days if days is None else days
+        cutoff = int((datetime.now() - timedelta(days=days)).timestamp())
+
+        self.flush()
+        deleted = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            with self._transaction() as conn:
+                rows = conn.execute("""
+                    SELECT timestamp, hour, day_of_week, cpu_percent, memory_percent,
+                           battery_percent, is_charging, app_id, plan_id, id
+                    FROM usage_log
+                    WHERE timestamp < ?
+                    ORDER BY timestamp
+                    LIMIT ?
+                """, (cutoff, policy.chunk_size)).fetchall()
+                if not rows:
+                    break
+                if not policy.keep_aggregates:
+                    self._update_rollups(conn, rows, sign=-1)
+                conn.executemany(
+                    "DELETE FROM usage_log WHERE id = ?", [(row[9],) for row in rows]
+                )
+            deleted += len(rows)
+            chunks += 1
+            if len(rows) < policy.chunk_size:
+                break
+
+        if deleted > 0:
+            logger.info(f"古い記録を削除: {deleted}件")
+        return deleted
+
+    def incremental_vacuum(self, pages: Optional[int] = None) -> int:
+        """空きページを少しずつファイルから解放
+
+        Returns:
+            解放後に残っている空きページ数
+        """
+        pages = self.retention.vacuum_pages if pages is None else pages
+        with self._lock:
+            conn = self._conn
+            if conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    @staticmethod
+    def _utc_offset() -> int:
+        """ローカル時刻のUTCオフセット（秒）。日単位の区間をローカルの0時に揃える"""
+        return time.localtime().tm_gmtoff
+
+    def _compact_step(self, source: str, target: str, size: int, cutoff: int) -> int:
+        """source の cutoff より古い行を最大 chunk_size 件ぶん target へ集約
+
+        区間の途中で切らないよう、境界は target の区間単位に揃える。
+
+        Returns:
+            集約して削除した source の行数
+        """
+        table, key = _TIER_SOURCES[source]
+        off = self._utc_offset()
+        align = lambda t: ((t + off) // size) * size - off  # noqa: E731
+        cutoff = align(cutoff)
+
+        with self._transaction() as conn:
+            first = conn.execute(
+                f"SELECT MIN({key}) FROM {table} WHERE {key} < ?", (cutoff,)
+            ).fetchone()[0]
+            if first is None:
+                return 0
+            nth = conn.execute(
+                f"SELECT {key} FROM {table} WHERE {key} < ? ORDER BY {key} LIMIT 1 OFFSET ?",
+                (cutoff, self.retention.chunk_size)
+            ).fetchone()
+            boundary = cutoff if nth is None else align(nth[0])
+            boundary = max(boundary, align(first) + size)
+
+            conn.execute(_COMPACT_SQL[target], {
+                "size": size, "off": off, "lo": first, "hi": boundary,
+            })
+
+            if source == "raw" and not self.retention.keep_aggregates:
+                rows = conn.execute("""
+                    SELECT timestamp, hour, day_of_week, cpu_percent, memory_percent,
+                           battery_percent, is_charging, app_id, plan_id
+                    FROM usage_log WHERE timestamp < ?
+                """, (boundary,)).fetchall()
+                self._update_rollups(conn, rows, sign=-1)
+
+            cursor = conn.execute(f"DELETE FROM {table} WHERE {key} < ?", (boundary,))
+            return cursor.rowcount
+
+    def compact_tiers(self, max_chunks: Optional[int] = None) -> int:
+        """保持期間を過ぎたデータを1段粗い階層へ集約
+
+        生データ → 分（raw_days 経過後）→ 時間（minute_days）→ 日（hour_days）。
+        チャンクごとにコミットし、max_chunks で1回の作業量を制限する。
+
+        Returns:
+            集約した行数（全階層の合計）
+        """
+        return self._compact_tiers(max_chunks)[0]
+
+    def _compact_tiers(self, max_chunks: Optional[int]) -> tuple[int, bool]:
+        """compact_tiers の本体。(集約した行数, 残作業があるか) を返す"""
+        policy = self.retention
+        now = datetime.now()
+        ages = (policy.raw_days, policy.minute_days, policy.hour_days)
+        sources = tuple(_TIER_SOURCES)
+
+        self.flush()
+        moved = 0
+        chunks = 0
+        more = False
+        for source, (target, size), days in zip(sources, TIERS, ages):
+            cutoff = int((now - timedelta(days=days)).timestamp())
+            while True:
+                if max_chunks is not None and chunks >= max_chunks:
+                    more = True
+                    break
+                n = self._compact_step(source, target, size, cutoff)
+                if n == 0:
+                    break
+                moved += n
+                chunks += 1
+
+        if moved > 0:
+            logger.info(f"古い記録を集約: {moved}件")
+        return moved, more
+
+    def get_series(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        resolution: int = 3600
+    ) -> list[SeriesPoint]:
+        """期間内の使用状況を resolution 秒単位の時系列で取得
+
+        生データと各集約階層を横断して読むため、古い期間は自動的に
+        保存されている粒度（分・時間・日）で返る。
+        """
+        params = {
+            "size": max(1, int(resolution)),
+            "off": self._utc_offset(),
+            "lo": int(since.timestamp()),
+            "hi": int((until or datetime.now()).timestamp()) + 1,
+        }
+
+        self.flush()
+        merged: dict[int, list] = {}
+        with self._transaction() as conn:
+            for source in _TIER_SOURCES:
+                for row in conn.execute(_SERIES_SQL[source], params):
+                    acc = merged.get(row[0])
+                    if acc is None:
+                        merged[row[0]] = list(row)
+                        continue
+                    # 階層の境界をまたぐ区間は合算（最多アプリ/プランは件数の多い側）
+                    if row[1] > acc[1]:
+                        acc[13], acc[14] = row[13], row[14]
+                    acc[1] += row[1]
+                    acc[2], acc[3] = min(acc[2], row[2]), max(acc[3], row[3])
+                    acc[4] += row[4]
+                    acc[5], acc[6] = min(acc[5], row[5]), max(acc[6], row[6])
+                    acc[7] += row[7]
+                    if row[8] is not None:
+                        acc[8] = row[8] if acc[8] is None else min(acc[8], row[8])
+                        acc[9] = row[9] if acc[9] is None else max(acc[9], row[9])
+                    acc[10] += row[10]
+                    acc[11] += row[11]
+                    acc[12] += row[12]
+
+        points = []
+        for bucket in sorted(merged):
+            (_, samples, cpu_min, cpu_max, cpu_sum, mem_min, mem_max, mem_sum,
+             bat_min, bat_max, bat_sum, bat_samples, charging, app_id, plan_id) = merged[bucket]
+            points.append(SeriesPoint(
+                start=datetime.fromtimestamp(bucket),
+                samples=samples,
+                cpu_min=cpu_min,
+                cpu_max=cpu_max,
+                cpu_avg=cpu_sum / samples,
+                memory_min=mem_min,
+                memory_max=mem_max,
+                memory_avg=mem_sum / samples,
+                battery_min=bat_min,
+                battery_max=bat_max,
+                battery_avg=bat_sum / bat_samples if bat_samples else None,
+                charging_ratio=charging / samples,
+                active_app=self._app_names[app_id],
+                power_plan=self._plan_names[plan_id],
+            ))
+        return points
+
+    def run_maintenance(self) -> bool:
+        """保持ポリシーを1回分適用（定期実行用）
+
+        集約・削除・VACUUMとも1回あたりの作業量に上限があるため、
+        残作業がある場合は True を返す。呼び出し側は間隔を空けて再実行する。
+        既存DBの auto_vacuum がまだ INCREMENTAL でなければ、保持ポリシーの適用後に
+        VACUUM して切り替える（失敗しても保持ポリシーの適用は妨げない）。
+        """
+        policy = self.retention
+        if policy.downsample:
+            _, more = self._compact_tiers(policy.max_chunks)
+        else:
+            deleted = self.cleanup_old_records(policy.raw_days, max_chunks=policy.max_chunks)
+            more = deleted >= policy.chunk_size * policy.max_chunks
+        remaining_pages = self.incremental_vacuum()
+        try:
+            if self._switch_auto_vacuum():
+                remaining_pages = 0
+        except sqlite3.Error as e:
+            # ディスク不足など。次回のメンテナンスで再試行する
+            logger.warning(f"auto_vacuum の切り替えに失敗: {e}")
+            # 切り替わるまで空きページは少しずつ解放できないので残作業に数えない
+            remaining_pages = 0
+        self.optimize()
+        return more or remaining_pages > 0
+
+    def explain_queries(self) -> dict[str, list[str]]:
+        """主要な読み出しクエリを実行し、その実行計画を取得
+
+        実際に発行されたSQLをトレースで集めるため、クエリを変更しても追従する。
+
+        Returns:
+            SQL → EXPLAIN QUERY PLAN の各行
+        """
+        statements: list[str] = []
+
+        def trace(sql: str):
+            if sql.lstrip().upper().startswith("SELECT"):
+                statements.append(sql)
+
+        now = datetime.now()
+        since = now - timedelta(days=1)
+        app = next(iter(self._app_ids), "")
+
+        self.flush()
+        with self._lock:
+            self._trace = trace
+            self._conn.set_trace_callback(trace)
+            try:
+                list(self.iter_records(since, now))
+                list(self.iter_records(since, now, app=app))
+                self.load_columns(since, now)
+                self.load_columns(since, now, app=app)
+                self.get_hourly_pattern(now.hour)
+                self.get_hourly_pattern(now.hour, now.weekday(), True)
+                self.get_app_usage_stats(self.TOP_K + 1)
+                self.get_app_stats(app)
+                self.get_today_stats()
+                self.get_series(since, now)
+            finally:
+                self._trace = None
+                self._conn.set_trace_callback(None)
 
-            if row:
-                return dict(row)
             return {
-                "total_minutes": 0,
-                "high_perf_minutes": 0,
-                "balanced_minutes": 0,
-                "power_saver_minutes": 0,
+                sql: [row[3] for row in self._conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                for sql in dict.fromkeys(statements)
             }
 
-    def get_setting(self, key: str, default: str = "") -> str:
-        """設定値を取得"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT value FROM settings WHERE key = ?", (key,)
-            )
-            row = cursor.fetchone()
-            return row[0] if row else default
-
-    def set_setting(self, key: str, value: str):
-        """設定値を保存"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)
-            """, (key, value))
-            conn.commit()
-
-    def cleanup_old_records(self, days: int = 30):
-        """古い記録を削除"""
-        cutoff = datetime.now() - timedelta(days=days)
-
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                DELETE FROM usage_log WHERE timestamp < ?
-            """, (cutoff.isoformat(),))
-            deleted = cursor.rowcount
-            conn.commit()
+    def find_full_scans(self) -> dict[str, list[str]]:
+        """インデックスを使わずに表を全件走査するクエリを検出（回帰チェック用）
 
-            if deleted > 0:
-                logger.info(f"古い記録を削除: {deleted}件")
+        Returns:
+            全件走査を含むSQL → 実行計画（問題がなければ空）
+        """
+        return {
+            sql: plan for sql, plan in self.explain_queries().items()
+            if _table_scans(plan)
+        }
 
 
 if __name__ == "__main__":
@@ -267,3 +1955,4 @@ if __name__ == "__main__":
 
     print("今日の統計:", db.get_today_stats())
     print("アプリ使用統計:", db.get_app_usage_stats())
+    db.close()
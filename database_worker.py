@@ -0,0 +1,142 @@
+"""
+データベースワーカーモジュール
+SQLiteへのアクセスを専用スレッドに集約し、GUIスレッドをブロックしない
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+import logging
+
+from storage import StorageEngine
+
+logger = logging.getLogger(__name__)
+
+# 停止要求
+_STOP = object()
+
+
+class DatabaseWorker:
+    """データベース専用ワーカースレッド
+
+    コマンドは有界キューで受け付け、結果は Future で返す。
+    キューが満杯のとき submit() は空くまで待ち（バックプレッシャー）、
+    post() は待たずにコマンドを破棄する（GUIスレッド向け）。
+    アイドル時にはバッファのフラッシュと定期メンテナンス（保持期間管理）を行う。
+    """
+
+    def __init__(
+        self,
+        database: StorageEngine,
+        max_queue: int = 256,
+        idle_interval: float = 5.0,
+        maintenance_interval: float = 3600.0
+    ):
+        self.database = database
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._idle_interval = idle_interval
+        self._maintenance_interval = maintenance_interval
+        # 起動直後の負荷を避けて最初のメンテナンスは1周期後
+        self._next_maintenance = time.monotonic() + maintenance_interval
+        self._high_water = max(1, max_queue * 3 // 4)
+        self._warned = False
+        self.dropped = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="DatabaseWorker", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Future:
+        """コマンドを投入（キュー満杯時は timeout 秒まで待機）
+
+        Raises:
+            queue.Full: timeout 内にキューが空かなかった場合
+        """
+        future: Future = Future()
+        self._queue.put((fn, args, kwargs, future), timeout=timeout)
+        self._check_depth()
+        return future
+
+    def post(self, fn: Callable[..., Any], *args, **kwargs) -> Optional[Future]:
+        """コマンドを投入（待たない）。キュー満杯なら破棄して None"""
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((fn, args, kwargs, future))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"DBキューが満杯のためコマンドを破棄 (累計{self.dropped}件)")
+            return None
+        self._check_depth()
+        return future
+
+    def pending(self) -> int:
+        """キューに溜まっているコマンド数"""
+        return self._queue.qsize()
+
+    def _check_depth(self):
+        """キューの滞留を監視"""
+        depth = self._queue.qsize()
+        if depth >= self._high_water and not self._warned:
+            self._warned = True
+            logger.warning(f"DBキューが滞留しています: {depth}件")
+        elif depth < self._high_water // 2:
+            self._warned = False
+
+    def _run(self):
+        """ワーカースレッド本体"""
+        while True:
+            try:
+                item = self._queue.get(timeout=self._idle_interval)
+            except queue.Empty:
+                self._on_idle()
+                continue
+
+            if item is _STOP:
+                break
+
+            fn, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"DBコマンドエラー ({getattr(fn, '__name__', fn)}): {e}")
+                future.set_exception(e)
+
+        self.database.close()
+        logger.info("DBワーカー停止")
+
+    def _on_idle(self):
+        """アイドル時の処理"""
+        # バッファの滞留上限を守る
+        try:
+            self.database.flush_if_due()
+        except Exception as e:
+            logger.error(f"定期フラッシュエラー: {e}")
+
+        if time.monotonic() < self._next_maintenance:
+            return
+        try:
+            more = self.database.run_maintenance()
+        except Exception as e:
+            logger.error(f"メンテナンスエラー: {e}")
+            more = False
+        # 残作業があれば次のアイドルで続ける
+        self._next_maintenance = time.monotonic() + (0 if more else self._maintenance_interval)
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """残りのコマンドを処理してから停止し、接続を閉じる"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("DBワーカーの停止がタイムアウトしました")
@@ -23,12 +23,15 @@ else:
     sys.path.insert(0, str(BASE_DIR))
 
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import QTimer
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
 
 from power_manager import PowerManager
 from system_monitor import SystemMonitor
-from database import Database, UsageRecord
+from database import UsageRecord
+from storage import create_engine
+from database_worker import DatabaseWorker
 from pattern_learner import SmartOptimizer
+from model_trainer import ModelTrainer, collect_usage
 from ui.tray_icon import TrayIcon
 from ui.dashboard import DashboardWindow
 from startup_manager import StartupManager
@@ -46,6 +49,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class DatabaseSignals(QObject):
+    """DBワーカーの結果をGUIスレッドへ届けるシグナル"""
+
+    today_stats_ready = pyqtSignal(dict)
+
+
 class PowerPlanAI:
     """メインアプリケーションクラス"""
 
@@ -61,8 +70,17 @@ class PowerPlanAI:
         # コンポーネント初期化
         self.power_manager = PowerManager()
         self.system_monitor = SystemMonitor()
-        self.database = Database()
+        # 保存先エンジン（sqlite / memory / binlog）。既定は SQLite
+        self.database = create_engine(os.environ.get("POWER_PLAN_AI_STORAGE", "sqlite"))
+        self.db_worker = DatabaseWorker(self.database)
+        self.db_signals = DatabaseSignals()
         self.optimizer = SmartOptimizer()
+        # 学習モデル（scikit-learn があれば裏で学習し、できたら optimizer に差し込む）
+        self.trainer = ModelTrainer(
+            self.optimizer.learner,
+            load_usage=lambda: self.db_worker.submit(collect_usage, self.database).result(),
+            on_ready=self.optimizer.set_model,
+        )
 
         # スタートアップマネージャー
         self.startup_manager = StartupManager()
@@ -87,6 +105,12 @@ class PowerPlanAI:
         self.stats_timer.timeout.connect(self._update_daily_stats)
         self.stats_timer.start(60000)
 
+        # 学習モデルの再学習タイマー（6時間ごと）
+        self.train_timer = QTimer()
+        self.train_timer.timeout.connect(self.trainer.start)
+        self.train_timer.start(6 * 3600 * 1000)
+        self.trainer.start()
+
         # 初回更新
         self._on_monitor_tick()
 
@@ -103,6 +127,9 @@ class PowerPlanAI:
         self.dashboard.plan_changed.connect(self._on_plan_change_request)
         self.dashboard.startup_changed.connect(self._on_startup_change)
 
+        # データベース（ワーカースレッド → GUIスレッド）
+        self.db_signals.today_stats_ready.connect(self.dashboard.update_stats)
+
     def _show_dashboard(self):
         """ダッシュボードを表示"""
         self.dashboard.show()
@@ -136,7 +163,8 @@ class PowerPlanAI:
                     memory_percent=status.memory_percent,
                     is_charging=status.is_charging,
                     active_app=status.active_app,
-                    chosen_plan=plan.name
+                    chosen_plan=plan.name,
+                    app_id=status.app_id
                 )
 
             self._update_ui()
@@ -178,9 +206,10 @@ class PowerPlanAI:
                 battery_percent=status.battery_percent,
                 is_charging=status.is_charging,
                 active_app=status.active_app,
-                power_plan=plan_name
+                power_plan=plan_name,
+                app_id=status.app_id
             )
-            self.database.add_usage_record(record)
+            self.db_worker.post(self.database.add_usage_record, record)
 
             # AI推奨取得
             prediction = self.optimizer.get_recommendation(
@@ -190,7 +219,8 @@ class PowerPlanAI:
                 memory_percent=status.memory_percent,
                 battery_percent=status.battery_percent,
                 is_charging=status.is_charging,
-                active_app=status.active_app
+                active_app=status.active_app,
+                app_id=status.app_id
             )
 
             # 自動最適化が有効な場合
@@ -238,7 +268,8 @@ class PowerPlanAI:
                 memory_percent=status.memory_percent,
                 battery_percent=status.battery_percent,
                 is_charging=status.is_charging,
-                active_app=status.active_app
+                active_app=status.active_app,
+                app_id=status.app_id
             )
             self.dashboard.update_ai_recommendation(
                 prediction.recommended_plan,
@@ -246,19 +277,25 @@ class PowerPlanAI:
                 prediction.reason
             )
 
-            # 統計
-            stats = self.database.get_today_stats()
-            self.dashboard.update_stats(stats)
+            # 統計（結果はシグナル経由で反映）
+            future = self.db_worker.post(self.database.get_today_stats)
+            if future is not None:
+                future.add_done_callback(self._on_today_stats)
 
         except Exception as e:
             logger.error(f"UI更新エラー: {e}")
 
+    def _on_today_stats(self, future):
+        """今日の統計をGUIスレッドへ転送（ワーカースレッドで呼ばれる）"""
+        if future.exception() is None:
+            self.db_signals.today_stats_ready.emit(future.result())
+
     def _update_daily_stats(self):
         """日次統計を更新"""
         try:
             plan = self.power_manager.get_active_plan()
             if plan:
-                self.database.update_daily_stats(plan.name)
+                self.db_worker.post(self.database.update_daily_stats, plan.name)
         except Exception as e:
             logger.error(f"統計更新エラー: {e}")
 
@@ -279,8 +316,11 @@ class PowerPlanAI:
         logger.info("終了中...")
         self.monitor_timer.stop()
         self.stats_timer.stop()
+        self.train_timer.stop()
         self.tray.hide()
         self.dashboard.close()
+        self.db_worker.stop()
+        self.optimizer.close()
         self.app.quit()
 
     def run(self) -> int:
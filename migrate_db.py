@@ -0,0 +1,88 @@
+"""
+データベース移行ツール
+既存の usage.db を最新スキーマへその場で変換
+
+    python migrate_db.py [DBパス] [--no-vacuum] [--rebuild-rollups]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from database import SCHEMA_VERSION, Database
+
+
+def _print_progress(stage: str, done: int, total: int):
+    """進捗を1行で表示"""
+    percent = done / total * 100 if total else 100.0
+    sys.stdout.write(f"\r  {stage}: {done:,}/{total:,} ({percent:5.1f}%)")
+    sys.stdout.flush()
+    if done >= total:
+        sys.stdout.write("\n")
+
+
+def _file_size(path: Path) -> int:
+    """DB本体とWALの合計サイズ"""
+    return sum(
+        p.stat().st_size
+        for p in (path, path.with_name(path.name + "-wal"))
+        if p.exists()
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="usage.db を最新スキーマへ移行")
+    parser.add_argument(
+        "db_path",
+        nargs="?",
+        type=Path,
+        default=Path(os.environ.get("APPDATA", ".")) / "PowerPlanAI" / "usage.db",
+    )
+    parser.add_argument(
+        "--no-vacuum",
+        action="store_true",
+        help="移行後のVACUUMを省略（auto_vacuum の切り替えはアプリの定期メンテナンスで行う）",
+    )
+    parser.add_argument(
+        "--rebuild-rollups", action="store_true", help="集計テーブルを生データから再構築"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not args.db_path.exists():
+        print(f"データベースが見つかりません: {args.db_path}")
+        return 1
+
+    with sqlite3.connect(args.db_path) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    if version >= SCHEMA_VERSION and not args.rebuild_rollups:
+        print(f"既に最新です (v{version})")
+        return 0
+
+    before = _file_size(args.db_path)
+    print(f"移行開始: v{version} → v{SCHEMA_VERSION} ({before / 1024 / 1024:.1f} MB)")
+    start = time.perf_counter()
+
+    with Database(args.db_path, progress=_print_progress) as db:
+        if args.rebuild_rollups:
+            print("  集計テーブルを再構築中...")
+            db.rebuild_rollups()
+        if not args.no_vacuum:
+            print("  VACUUM 実行中...")
+            db.vacuum()
+
+    after = _file_size(args.db_path)
+    print(
+        f"移行完了: {time.perf_counter() - start:.1f}秒, "
+        f"{before / 1024 / 1024:.1f} MB → {after / 1024 / 1024:.1f} MB"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+"""
+学習モデルモジュール
+使用記録とユーザーの選択から scikit-learn の分類器を学習し、
+準備ができたら SmartOptimizer に差し込む（scikit-learn が無ければ何もしない）
+"""
+import pickle
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import logging
+
+import numpy as np
+
+from pattern_learner import PatternLearner, Prediction
+
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+logger = logging.getLogger(__name__)
+
+# 使える分類器
+ESTIMATORS = ("hgb", "logistic")
+
+# 学習データの列
+TRAINING_COLUMNS = (
+    "hour", "day_of_week", "cpu_percent", "memory_percent",
+    "battery_percent", "is_charging", "active_app", "plan",
+)
+
+
+# 稼働中プランを取得できなかったときに記録される名前（学習の正解には使わない）
+UNKNOWN_PLAN = "不明"
+
+
+def collect_usage(engine, days: int = 14, max_samples: int = 50_000) -> dict[str, np.ndarray]:
+    """直近 days 日の使用記録を学習データの列にまとめる（新しい max_samples 件まで）
+
+    ストレージエンジンを持つスレッド（DatabaseWorker）で呼ぶ。列で読めるエンジン
+    （Database.load_columns）なら行ごとのオブジェクトを作らずに済ませる。
+    プランが不明な記録は除く。
+    """
+    since = datetime.now() - timedelta(days=days)
+    if hasattr(engine, "load_columns"):
+        return _usage_from_columns(engine.load_columns(since), max_samples)
+
+    rows = deque(
+        (
+            (r.hour, r.day_of_week, r.cpu_percent, r.memory_percent,
+             -1 if r.battery_percent is None else r.battery_percent,
+             r.is_charging, r.active_app.lower(), r.power_plan)
+            for r in engine.iter_records(since)
+            if r.power_plan != UNKNOWN_PLAN
+        ),
+        maxlen=max_samples,
+    )
+    columns = list(zip(*rows)) if rows else [()] * len(TRAINING_COLUMNS)
+    return {
+        name: np.array(values, dtype=object if name in ("active_app", "plan") else None)
+        for name, values in zip(TRAINING_COLUMNS, columns)
+    }
+
+
+def _usage_from_columns(columns, max_samples: int) -> dict[str, np.ndarray]:
+    """UsageColumns を学習データの列にする（名前はIDの種類ごとに1回だけ引く）"""
+    plan_ids, plan_index = np.unique(columns.plan_id, return_inverse=True)
+    plans = np.array([columns.plan_names[i] for i in plan_ids.tolist()], dtype=object)
+    # 新しい max_samples 件（記録は時刻順）
+    keep = np.flatnonzero(plans[plan_index] != UNKNOWN_PLAN)[-max_samples:]
+
+    app_ids, app_index = np.unique(columns.app_id[keep], return_inverse=True)
+    apps = np.array([columns.app_names[i].lower() for i in app_ids.tolist()], dtype=object)
+    return {
+        "hour": columns.hour[keep],
+        "day_of_week": columns.day_of_week[keep],
+        "cpu_percent": columns.cpu[keep],
+        "memory_percent": columns.memory[keep],
+        "battery_percent": columns.battery[keep],
+        "is_charging": columns.is_charging[keep],
+        "active_app": apps[app_index].reshape(-1),
+        "plan": plans[plan_index[keep]].reshape(-1),
+    }
+
+
+def _encode(
+    hour: np.ndarray,
+    day_of_week: np.ndarray,
+    cpu_percent: np.ndarray,
+    memory_percent: np.ndarray,
+    battery_percent: np.ndarray,
+    is_charging: np.ndarray,
+    app_index: np.ndarray,
+    n_apps: int,
+) -> np.ndarray:
+    """特徴量の行列を作る
+
+    時刻・曜日は周期を保つよう sin/cos に、アプリは上位 n_apps 種 + その他の one-hot にする。
+    バッテリー残量が無い（デスクトップ）場合は満充電として扱い、有無を別の列に持つ。
+    """
+    hour_angle = np.asarray(hour, dtype=np.float64) * (2 * np.pi / 24)
+    dow_angle = np.asarray(day_of_week, dtype=np.float64) * (2 * np.pi / 7)
+    battery = np.asarray(battery_percent, dtype=np.float64)
+    has_battery = battery >= 0
+    apps = np.zeros((len(hour_angle), n_apps + 1))
+    apps[np.arange(len(hour_angle)), app_index] = 1.0
+    return np.column_stack((
+        np.sin(hour_angle), np.cos(hour_angle),
+        np.sin(dow_angle), np.cos(dow_angle),
+        np.asarray(cpu_percent, dtype=np.float64) / 100,
+        np.asarray(memory_percent, dtype=np.float64) / 100,
+        np.where(has_battery, battery, 100.0) / 100,
+        has_battery,
+        np.asarray(is_charging, dtype=np.float64),
+        apps,
+    ))
+
+
+class PlanModel:
+    """学習済みの分類器と、予測時の特徴量の作り方
+
+    予測時間（指数移動平均）が予算を超えたら自分を無効にし、呼び出し側はルールベースに
+    戻る。無効の間も PROBE_INTERVAL 回に1回は予測して時間を測り、予算の
+    RECOVER_RATIO 倍まで下がったら有効に戻す。
+    """
+
+    PROBE_INTERVAL = 20
+    RECOVER_RATIO = 0.5
+
+    def __init__(
+        self,
+        estimator,
+        apps: list[str],
+        samples: int,
+        accuracy: float,
+        min_confidence: float = 0.6,
+        latency_budget_ms: float = 5.0,
+    ):
+        self.estimator = estimator
+        self.apps = apps
+        self._app_index = {app: i for i, app in enumerate(apps)}
+        self.samples = samples
+        self.accuracy = accuracy
+        self.min_confidence = min_confidence
+        self.latency_budget_ms = latency_budget_ms
+        # 予測時間の指数移動平均（ミリ秒）
+        self.latency_ms = 0.0
+        self.disabled = False
+        self._skipped = 0
+
+    def encode(self, columns: dict[str, np.ndarray]) -> np.ndarray:
+        """学習データの列から特徴量の行列を作る"""
+        other = len(self.apps)
+        app_index = np.array(
+            [self._app_index.get(app, other) for app in columns["active_app"]], dtype=np.int64
+        )
+        return _encode(
+            columns["hour"], columns["day_of_week"], columns["cpu_percent"],
+            columns["memory_percent"], columns["battery_percent"], columns["is_charging"],
+            app_index, other,
+        )
+
+    def predict(
+        self,
+        hour: int,
+        day_of_week: int,
+        cpu_percent: float,
+        memory_percent: float,
+        battery_percent: Optional[int],
+        is_charging: bool,
+        active_app: str
+    ) -> Optional[Prediction]:
+        """推奨プランを予測（自信が無い・無効なら None）"""
+        if self.disabled:
+            self._skipped += 1
+            if self._skipped < self.PROBE_INTERVAL:
+                return None
+            self._skipped = 0
+
+        start = time.perf_counter()
+        features = _encode(
+            [hour], [day_of_week], [cpu_percent], [memory_percent],
+            [-1 if battery_percent is None else battery_percent], [is_charging],
+            [self._app_index.get(active_app.lower(), len(self.apps))], len(self.apps),
+        )
+        proba = self.estimator.predict_proba(features)[0]
+        elapsed = (time.perf_counter() - start) * 1000
+
+        self._track_latency(elapsed)
+        if self.disabled:
+            return None
+
+        best = int(np.argmax(proba))
+        confidence = float(proba[best])
+        if confidence < self.min_confidence:
+            return None
+        return Prediction(
+            recommended_plan=str(self.estimator.classes_[best]),
+            confidence=min(confidence, 0.85),
+            reason=f"学習モデル（{self.samples}件から学習）による予測"
+        )
+
+    def _track_latency(self, elapsed: float):
+        """予測時間の移動平均を更新し、予算に応じて無効化・再有効化する"""
+        self.latency_ms = (
+            elapsed if self.latency_ms == 0 else 0.9 * self.latency_ms + 0.1 * elapsed
+        )
+        if not self.disabled and self.latency_ms > self.latency_budget_ms:
+            self.disabled = True
+            logger.warning(
+                f"学習モデルの予測が遅いため無効化: {self.latency_ms:.2f}ms"
+                f" (予算 {self.latency_budget_ms}ms)"
+            )
+        elif self.disabled and self.latency_ms <= self.latency_budget_ms * self.RECOVER_RATIO:
+            self.disabled = False
+            logger.info(f"学習モデルを再び有効化: {self.latency_ms:.2f}ms")
+
+
+def _unknown_battery(battery_percent: np.ndarray) -> float:
+    """残量が分からない行に入れる値（直近の記録にバッテリーが無ければ -1）"""
+    battery = np.asarray(battery_percent, dtype=np.float64)
+    if len(battery) == 0 or battery[-1] < 0:
+        return -1.0
+    return float(np.median(battery[battery >= 0]))
+
+
+class ModelTrainer:
+    """学習モデルをバックグラウンドスレッドで学習する
+
+    load_usage は使用記録の列（collect_usage の戻り値）を返す関数。
+    ストレージを持つスレッドに処理を渡して結果を待つものを想定している。
+    学習が終わり、精度・予測時間・サイズの条件を満たしたモデルだけを
+    on_ready に渡す（GUIスレッド以外から呼ばれる）。
+    """
+
+    def __init__(
+        self,
+        learner: PatternLearner,
+        load_usage: Callable[[], dict[str, np.ndarray]],
+        on_ready: Callable[[PlanModel], None],
+        estimator: str = "logistic",
+        max_apps: int = 32,
+        choice_weight: float = 5.0,
+        min_samples: int = 500,
+        latency_budget_ms: float = 5.0,
+        memory_budget_mb: float = 8.0,
+    ):
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"不明な分類器です: {estimator}")
+        self.learner = learner
+        self.load_usage = load_usage
+        self.on_ready = on_ready
+        self.estimator = estimator
+        self.max_apps = max_apps
+        # ユーザーが自分で選んだプランは、記録された稼働中プランより重く扱う
+        self.choice_weight = choice_weight
+        self.min_samples = min_samples
+        self.latency_budget_ms = latency_budget_ms
+        self.memory_budget_mb = memory_budget_mb
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        """学習を開始（scikit-learn が無い・学習中なら何もせず False）"""
+        if not HAS_SKLEARN:
+            logger.info("scikit-learn が無いため学習モデルは使いません")
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        # 学習パターンは呼び出し元のスレッドで写しておく
+        patterns = self.learner.get_patterns()
+        self._thread = threading.Thread(
+            target=self._run, args=(patterns,), name="ModelTrainer", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def join(self, timeout: Optional[float] = None):
+        """学習の終了を待つ"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, patterns: dict[str, np.ndarray]):
+        """学習スレッド本体"""
+        try:
+            model = self.train(self.load_usage(), patterns)
+        except Exception as e:
+            logger.error(f"学習モデルの学習エラー: {e}", exc_info=True)
+            return
+        if model is not None:
+            self.on_ready(model)
+
+    def _make_estimator(self):
+        """分類器を作る"""
+        if self.estimator == "hgb":
+            return HistGradientBoostingClassifier(max_iter=100, max_leaf_nodes=15)
+        return LogisticRegression(max_iter=500)
+
+    def train(
+        self, usage: dict[str, np.ndarray], patterns: dict[str, np.ndarray]
+    ) -> Optional[PlanModel]:
+        """学習して条件を満たしたモデルを返す（満たさなければ None）"""
+        # 学習パターンにはバッテリー残量が無い。「バッテリー無し」にすると予測時には
+        # 現れない状態になり、その列だけで選択の行を見分けられてしまうので、
+        # バッテリーの有無は予測時（直近の記録）にそろえ、残量は記録の中央値で埋める
+        choices = len(patterns["hour"])
+        patterns = dict(
+            patterns,
+            plan=patterns["chosen_plan"],
+            battery_percent=np.full(choices, _unknown_battery(usage["battery_percent"])),
+        )
+        columns = {
+            name: np.concatenate((usage[name], patterns[name])) for name in TRAINING_COLUMNS
+        }
+        weights = np.concatenate((
+            np.ones(len(usage["hour"])), np.full(choices, self.choice_weight)
+        ))
+        labels = columns["plan"].astype(str)
+        samples = len(labels)
+        if samples < self.min_samples or len(np.unique(labels)) < 2:
+            logger.info(f"学習データが足りないため学習モデルは作りません: {samples}件")
+            return None
+
+        # よく使うアプリだけ列にする（残りは「その他」）
+        apps, counts = np.unique(columns["active_app"].astype(str), return_counts=True)
+        top_apps = apps[np.argsort(-counts, kind="stable")[:self.max_apps]].tolist()
+        model = PlanModel(
+            None, top_apps, samples, 0.0, latency_budget_ms=self.latency_budget_ms
+        )
+        features = model.encode(columns)
+
+        # 8 割で学習して残りで評価し、最頻プランを答えるだけより良ければ採用
+        order = np.random.default_rng(0).permutation(samples)
+        train, test = order[:samples * 4 // 5], order[samples * 4 // 5:]
+        start = time.perf_counter()
+        estimator = self._make_estimator()
+        estimator.fit(features[train], labels[train], sample_weight=weights[train])
+        accuracy = float(estimator.score(features[test], labels[test]))
+        values, counts = np.unique(labels[train], return_counts=True)
+        baseline = float(np.mean(labels[test] == values[np.argmax(counts)]))
+        if accuracy < baseline:
+            logger.info(f"学習モデルを採用しません: 正解率 {accuracy:.3f} < 基準 {baseline:.3f}")
+            return None
+
+        estimator = self._make_estimator()
+        estimator.fit(features, labels, sample_weight=weights)
+        model.estimator = estimator
+        model.accuracy = accuracy
+        elapsed = time.perf_counter() - start
+
+        # 予算のチェック（サイズは pickle した大きさで見積もる）
+        size_mb = len(pickle.dumps(estimator)) / (1024 * 1024)
+        if size_mb > self.memory_budget_mb:
+            logger.info(
+                f"学習モデルを採用しません: {size_mb:.1f}MB (予算 {self.memory_budget_mb}MB)"
+            )
+            return None
+        # 予測時間は実際に何件か予測して測る（超えていれば predict が自分を無効にする）
+        estimator.predict_proba(features[:1])  # 初回だけの準備時間は数えない
+        for i in test[:100].tolist():
+            model.predict(*(columns[name][i] for name in TRAINING_COLUMNS[:-1]))
+        if model.disabled:
+            return None
+
+        logger.info(
+            f"学習モデルを学習: {samples}件, 正解率 {accuracy:.3f} (基準 {baseline:.3f}), "
+            f"{elapsed:.1f}秒, {size_mb:.2f}MB, 予測 {model.latency_ms:.2f}ms"
+        )
+        return model
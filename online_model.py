@@ -0,0 +1,197 @@
+"""
+オンライン学習モジュール
+ユーザーの選択を1件ずつ学習する多クラスのロジスティック回帰（NumPy のみ）
+"""
+import os
+import zlib
+from pathlib import Path
+from typing import Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 特徴量の並び: バイアス, 時(one-hot 24), 時の sin/cos, 曜日(one-hot 7), 充電中, アプリ(ハッシュ)
+_HOUR = 1
+_HOUR_CYCLE = _HOUR + 24
+_DOW = _HOUR_CYCLE + 2
+_CHARGING = _DOW + 7
+_APP = _CHARGING + 1
+
+_CHECKPOINT_VERSION = 1
+
+
+class OnlineLogisticModel:
+    """ソフトマックス回帰を1件ずつの SGD で学習するモデル
+
+    特徴量は one-hot とハッシュしたアプリだけなので、1件の学習・予測で触る重みは
+    プラン数 × 7 個に限られる（履歴の長さに依らない）。
+    学習率は 1/√t で下げていくが、直近の損失が長期の損失を大きく上回ったら
+    使い方が変わったとみなして初期値に戻す。
+    """
+
+    def __init__(
+        self,
+        app_buckets: int = 64,
+        learning_rate: float = 0.5,
+        min_learning_rate: float = 0.02,
+        l2: float = 1e-4,
+        drift_threshold: float = 1.5,
+        warmup: int = 50,
+    ):
+        self.app_buckets = app_buckets
+        self.learning_rate = learning_rate
+        self.min_learning_rate = min_learning_rate
+        self.l2 = l2
+        self.drift_threshold = drift_threshold
+        self.warmup = warmup
+
+        self.classes: list[str] = []
+        self._class_ids: dict[str, int] = {}
+        self.weights = np.zeros((0, _APP + app_buckets))
+        # 学習の状態
+        self.updates = 0            # 学習した件数
+        self.steps = 0              # 学習率を最後に戻してからの件数
+        self.fast_loss = 0.0        # 損失の短期平均
+        self.slow_loss = 0.0        # 損失の長期平均
+        self.last_timestamp = 0     # 最後に学習したパターンの時刻（エポック秒）
+        self.drifts = 0
+
+    def _active(
+        self, hour: int, day_of_week: int, is_charging: bool, app: str
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """0 でない特徴量の (位置, 値)"""
+        angle = hour * (2 * np.pi / 24)
+        index = np.array([
+            0,
+            _HOUR + hour,
+            _HOUR_CYCLE,
+            _HOUR_CYCLE + 1,
+            _DOW + day_of_week,
+            _CHARGING,
+            _APP + zlib.crc32(app.encode("utf-8")) % self.app_buckets,
+        ])
+        values = np.array([
+            1.0, 1.0, np.sin(angle), np.cos(angle), 1.0, float(bool(is_charging)), 1.0
+        ])
+        return index, values
+
+    def _proba(self, index: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """プランごとの確率"""
+        logits = self.weights[:, index] @ values
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    @property
+    def current_learning_rate(self) -> float:
+        """現在の学習率"""
+        return max(self.min_learning_rate, self.learning_rate / float(np.sqrt(1 + self.steps)))
+
+    def predict(
+        self, hour: int, day_of_week: int, is_charging: bool, app: str
+    ) -> Optional[tuple[str, float]]:
+        """(最も確率の高いプラン, 確率) を返す（未学習なら None）"""
+        if len(self.classes) < 2:
+            return None
+        proba = self._proba(*self._active(hour, day_of_week, is_charging, app))
+        best = int(np.argmax(proba))
+        return self.classes[best], float(proba[best])
+
+    def update(
+        self,
+        hour: int,
+        day_of_week: int,
+        is_charging: bool,
+        app: str,
+        plan: str,
+        timestamp: int = 0,
+    ) -> float:
+        """1件学習して、学習前の損失（交差エントロピー）を返す"""
+        label = self._class_ids.get(plan)
+        if label is None:
+            label = self._class_ids[plan] = len(self.classes)
+            self.classes.append(plan)
+            self.weights = np.vstack((self.weights, np.zeros((1, self.weights.shape[1]))))
+
+        index, values = self._active(hour, day_of_week, is_charging, app)
+        proba = self._proba(index, values)
+        loss = float(-np.log(max(proba[label], 1e-12)))
+
+        # 勾配 (p - y) x を、触る列だけ更新する
+        grad = proba
+        grad[label] -= 1.0
+        rate = self.current_learning_rate
+        touched = self.weights[:, index]
+        self.weights[:, index] = touched - rate * (np.outer(grad, values) + self.l2 * touched)
+
+        self._track_drift(loss)
+        self.updates += 1
+        self.steps += 1
+        self.last_timestamp = max(self.last_timestamp, int(timestamp))
+        return loss
+
+    def _track_drift(self, loss: float):
+        """損失の短期・長期平均を更新し、悪化していれば学習率を戻す"""
+        if self.updates == 0:
+            self.fast_loss = self.slow_loss = loss
+            return
+        self.fast_loss += 0.1 * (loss - self.fast_loss)
+        self.slow_loss += 0.01 * (loss - self.slow_loss)
+        if (
+            self.steps >= self.warmup
+            and self.fast_loss > self.slow_loss * self.drift_threshold
+        ):
+            self.steps = 0
+            self.drifts += 1
+            # 検出し続けないよう長期平均を今の水準に合わせる
+            self.slow_loss = self.fast_loss
+            logger.info(f"使い方の変化を検出: 学習率を {self.learning_rate} に戻します")
+
+    def save(self, path: Path):
+        """重みと学習の状態を保存（一時ファイルに書いてから置き換える）"""
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                version=_CHECKPOINT_VERSION,
+                weights=self.weights,
+                classes=np.array(self.classes, dtype=str),
+                state=np.array([
+                    self.app_buckets, self.updates, self.steps,
+                    self.last_timestamp, self.drifts,
+                ], dtype=np.int64),
+                loss=np.array([self.fast_loss, self.slow_loss]),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load(self, path: Path):
+        """save() で保存した状態を読み込む
+
+        Raises:
+            ValueError: 形式・アプリのハッシュ数が合わない場合
+        """
+        with np.load(path) as data:
+            if int(data["version"]) != _CHECKPOINT_VERSION:
+                raise ValueError(f"未対応の形式です: v{int(data['version'])}")
+            app_buckets, updates, steps, last_timestamp, drifts = data["state"].tolist()
+            if app_buckets != self.app_buckets:
+                raise ValueError(f"アプリのハッシュ数が違います: {app_buckets}")
+            weights = data["weights"]
+            classes = data["classes"].tolist()
+            fast_loss, slow_loss = data["loss"].tolist()
+        if weights.shape != (len(classes), _APP + self.app_buckets):
+            raise ValueError("重みの形が合いません")
+
+        self.weights = weights.astype(np.float64)
+        self.classes = classes
+        self._class_ids = {plan: i for i, plan in enumerate(classes)}
+        self.updates = updates
+        self.steps = steps
+        self.last_timestamp = last_timestamp
+        self.drifts = drifts
+        self.fast_loss = fast_loss
+        self.slow_loss = slow_loss
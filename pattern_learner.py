@@ -2,7 +2,13 @@
 AI学習モジュール
 使用パターンを学習して最適な電源プランを提案
 """
+import heapq
 import pickle
+import struct
+import time
+import zlib
+from collections import OrderedDict, deque
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass
@@ -12,6 +18,9 @@ import os
 
 import numpy as np
 
+from app_vocabulary import AppVocabulary, get_vocabulary
+from online_model import OnlineLogisticModel
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +32,429 @@ class Prediction:
     reason: str
 
 
+def _score_table() -> np.ndarray:
+    """類似度の組み合わせ → スコア
+
+    添字は (時間帯の近さ 0〜2)×8 + 曜日一致×4 + AC状態一致×2 + アプリ一致。
+    浮動小数点の丸めを旧実装と揃えるため、同じ順序で足し合わせて作る。
+    """
+    table = []
+    for hour_level in range(3):
+        for dow in (0, 1):
+            for charging in (0, 1):
+                for app in (0, 1):
+                    score = (0.0, 0.1, 0.3)[hour_level]
+                    if dow:
+                        score += 0.2
+                    if charging:
+                        score += 0.2
+                    if app:
+                        score += 0.3
+                    table.append(score)
+    return np.array(table)
+
+
+_SCORE_BY_CODE = _score_table()
+_SIMILAR_BY_CODE = _SCORE_BY_CODE >= 0.5
+
+# 状況キー (hour×7 + day_of_week)×2 + is_charging の各値に対応する要素
+_CONTEXT_KEYS = np.arange(24 * 7 * 2)
+_CONTEXT_HOUR = _CONTEXT_KEYS // 14
+_CONTEXT_DOW = _CONTEXT_KEYS // 2 % 7
+_CONTEXT_CHARGING = _CONTEXT_KEYS % 2
+
+
+@lru_cache(maxsize=512)
+def _context_codes(hour: int, day_of_week: int, is_charging: bool) -> np.ndarray:
+    """予測条件に対する、状況キーごとの類似度コード（アプリ一致を除く）"""
+    hour_diff = np.abs(_CONTEXT_HOUR - hour)
+    hour_level = np.where(hour_diff <= 1, 2, np.where(hour_diff <= 3, 1, 0))
+    codes = (
+        hour_level * 8
+        + (_CONTEXT_DOW == day_of_week) * 4
+        + (_CONTEXT_CHARGING == int(is_charging)) * 2
+    ).astype(np.int8)
+    codes.flags.writeable = False
+    return codes
+
+
+# 投票の重み（0.1 単位の整数。整数で足せば合計が足す順序に依らない）
+_SCORE_TENTHS = np.where(_SIMILAR_BY_CODE, np.rint(_SCORE_BY_CODE * 10), 0).astype(np.int64)
+
+
+@lru_cache(maxsize=512)
+def _context_weights(
+    hour: int, day_of_week: int, is_charging: bool
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """予測条件に対する、状況キーごとの投票の重みと類似かどうか
+
+    (アプリ不一致の重み, アプリ一致との差, アプリ不一致で類似か, アプリ一致との差) を返す。
+    """
+    codes = _context_codes(hour, day_of_week, is_charging)
+    other = _SCORE_TENTHS[codes]
+    same = _SCORE_TENTHS[codes + 1]
+    other_hit = (other > 0).astype(np.int64)
+    same_hit = (same > 0).astype(np.int64)
+    arrays = (other, same - other, other_hit, same_hit - other_hit)
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
+
+
+class _VoteTable:
+    """状況キー × プランごとのパターン数（全体とアプリ別）
+
+    予測はこの表と重みの内積になるので、パターン数に依らず一定時間で済む。
+    パターンの追加・削除のたびに該当するマスを増減して保つ。
+    """
+
+    def __init__(self):
+        self.total = np.zeros((len(_CONTEXT_KEYS), 0), dtype=np.int64)
+        self.by_app: dict[int, np.ndarray] = {}
+
+    def _widen(self, plans: int):
+        """プランの列を plans 列まで広げる"""
+        extra = plans - self.total.shape[1]
+        if extra > 0:
+            self.total = np.pad(self.total, ((0, 0), (0, extra)))
+            self.by_app = {
+                app_id: np.pad(table, ((0, 0), (0, extra)))
+                for app_id, table in self.by_app.items()
+            }
+
+    def add(self, record: np.void, delta: int = 1):
+        """パターン1件分を加える（delta=-1 で取り除く）"""
+        context = (
+            (int(record["hour"]) * 7 + int(record["day_of_week"])) * 2
+            + int(record["is_charging"])
+        )
+        app_id = int(record["app_id"])
+        plan_id = int(record["plan_id"])
+        self._widen(plan_id + 1)
+        self.total[context, plan_id] += delta
+        table = self.by_app.get(app_id)
+        if table is None:
+            table = self.by_app[app_id] = np.zeros_like(self.total)
+        table[context, plan_id] += delta
+        if delta < 0 and not table.any():
+            del self.by_app[app_id]
+
+    def rebuild(self, records: np.ndarray):
+        """パターン配列から作り直す"""
+        plans = int(records["plan_id"].max()) + 1 if len(records) else 0
+        self.total = np.zeros((len(_CONTEXT_KEYS), plans), dtype=np.int64)
+        self.by_app = {}
+        if not len(records):
+            return
+        context = (
+            (records["hour"].astype(np.int64) * 7 + records["day_of_week"]) * 2
+            + records["is_charging"]
+        )
+        cell = context * plans + records["plan_id"]
+        size = len(_CONTEXT_KEYS) * plans
+        self.total = np.bincount(cell, minlength=size).reshape(-1, plans)
+        app_ids = records["app_id"]
+        for app_id in np.unique(app_ids).tolist():
+            self.by_app[app_id] = np.bincount(
+                cell[app_ids == app_id], minlength=size
+            ).reshape(-1, plans)
+
+    def votes(
+        self, hour: int, day_of_week: int, is_charging: bool, app_id: int
+    ) -> tuple[np.ndarray, int]:
+        """(プラン別の得票（0.1 単位）, 類似パターン数) を返す"""
+        other, same, other_hit, same_hit = _context_weights(hour, day_of_week, is_charging)
+        votes = other @ self.total
+        count = int(other_hit @ self.total.sum(axis=1))
+        table = self.by_app.get(app_id)
+        if table is not None:
+            votes += same @ table
+            count += int(same_hit @ table.sum(axis=1))
+        return votes, count
+
+
+@dataclass
+class _PatternArrays:
+    """学習パターンを列ごとに並べた配列（類似パターン検索用）"""
+    context: np.ndarray   # int16 状況キー (hour×7 + day_of_week)×2 + is_charging
+    app_id: np.ndarray    # int32（アプリ名辞書のID）
+    plan_id: np.ndarray   # int32（plans の添字）
+    plans: list[str]
+
+    @classmethod
+    def build(cls, records: np.ndarray, plans: list[str]) -> "_PatternArrays":
+        """MODEL_DTYPE のレコード配列から作る"""
+        return cls(
+            context=(
+                (records["hour"].astype(np.int16) * 7 + records["day_of_week"]) * 2
+                + records["is_charging"]
+            ),
+            app_id=records["app_id"].astype(np.int32),
+            plan_id=records["plan_id"].astype(np.int32),
+            plans=plans,
+        )
+
+
+# 学習パターン1件（model.bin のレコード形式と同じ。22バイト）
+MODEL_DTYPE = np.dtype([
+    ("timestamp", "<i8"),        # 記録時刻（エポック秒）
+    ("cpu_percent", "<f4"),
+    ("memory_percent", "<f4"),
+    ("app_id", "<u2"),           # アプリ名表の添字（メモリ上ではアプリ名辞書のID）
+    ("plan_id", "u1"),           # プラン名表の添字
+    ("hour", "u1"),
+    ("day_of_week", "u1"),
+    ("is_charging", "u1"),
+])
+
+# model.bin: ヘッダ + 名前表（長さ付きUTF-8） + レコード配列
+#   ヘッダ: マジック, 形式バージョン, レコード数, アプリ数, プラン数, 名前表のバイト数, 世代
+#   v1 のヘッダには世代が無い（世代 0 として読む）
+_MODEL_HEADER = struct.Struct("<4sHIIIIQ")
+_MODEL_HEADER_V1 = struct.Struct("<4sHIIII")
+_MODEL_MAGIC = b"PPMD"
+_MODEL_VERSION = 2
+_NAME_LENGTH = struct.Struct("<H")
+
+# model.journal: スナップショット以降に追加したパターンの追記ログ
+#   ヘッダ: マジック, 形式バージョン, 対応するスナップショットの世代
+#   エントリ: ペイロード長, CRC32, ペイロード（時刻, CPU, メモリ, 時, 曜日, 充電中, アプリ名, プラン名）
+_JOURNAL_HEADER = struct.Struct("<4sHQ")
+_JOURNAL_ENTRY = struct.Struct("<HI")
+_JOURNAL_PATTERN = struct.Struct("<qffBBB")
+_JOURNAL_MAGIC = b"PPJL"
+_JOURNAL_VERSION = 1
+
+# ジャーナルの fsync 方針
+FSYNC_ALWAYS = "always"      # 追記のたびに fsync
+FSYNC_INTERVAL = "interval"  # 前回から fsync_interval 秒以上経っていれば fsync
+FSYNC_NEVER = "never"        # OS に任せる（プロセスが落ちても書いた分は残る）
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+
+def _pack_names(names: list[str]) -> bytes:
+    """名前表を長さ付きUTF-8の連結にする"""
+    parts = []
+    for name in names:
+        encoded = name.encode("utf-8")
+        parts += [_NAME_LENGTH.pack(len(encoded)), encoded]
+    return b"".join(parts)
+
+
+def _unpack_names(data: bytes, count: int, offset: int = 0) -> tuple[list[str], int]:
+    """名前表を count 件読み、(名前のリスト, 終端オフセット) を返す"""
+    names = []
+    for _ in range(count):
+        (length,) = _NAME_LENGTH.unpack_from(data, offset)
+        offset += _NAME_LENGTH.size
+        names.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    return names, offset
+
+
+# 容量を超えたときにどのパターンを捨てるか
+EVICT_FIFO = "fifo"        # 最も古いパターン
+EVICT_DIVERSE = "diverse"  # パターンの最も多い (アプリ, 時) の区分の中で最も古いもの
+EVICTION_POLICIES = (EVICT_FIFO, EVICT_DIVERSE)
+
+
+class PatternStore:
+    """容量固定の学習パターン置き場（MODEL_DTYPE 配列のリングバッファ）
+
+    fifo は書き込み位置を一周させるだけなので追加・削除とも O(1)。
+    diverse は (アプリ, 時) の区分ごとの件数を数えておき、満杯のときは件数の最も多い
+    区分の最も古いパターンを上書きする。同じ状況の新しいパターンばかりで埋まらず、
+    たまにしか使わないアプリや時間帯のパターンが残る。件数ごとに区分を最古の通し番号の
+    ヒープで持つので、追加・削除とも O(log n)。
+    """
+
+    __slots__ = (
+        "capacity", "policy", "_data", "_seq", "_size", "_head", "_next_seq",
+        "_buckets", "_by_count", "_heaps", "_max_count", "_ordered",
+    )
+
+    def __init__(self, capacity: int, policy: str = EVICT_FIFO):
+        if capacity <= 0:
+            raise ValueError(f"容量は1以上にしてください: {capacity}")
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"不明な削除方針です: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.clear()
+
+    def clear(self):
+        """全パターンを削除"""
+        self._data = np.zeros(self.capacity, dtype=MODEL_DTYPE)
+        self._seq = np.zeros(self.capacity, dtype=np.int64)  # 追加順の通し番号
+        self._size = 0
+        self._head = 0  # fifo: 最も古いパターンの位置
+        self._next_seq = 0
+        # diverse: 区分 → 位置（古い順）、件数 → その件数の区分
+        self._buckets: dict[tuple[int, int], deque[int]] = {}
+        self._by_count: dict[int, dict[tuple[int, int], None]] = {}
+        # 件数 → (区分の最古の通し番号, 区分) のヒープ。古くなった要素は取り出すときに捨てる
+        self._heaps: dict[int, list[tuple[int, tuple[int, int]]]] = {}
+        self._max_count = 0
+        self._ordered: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, record: np.void) -> Optional[np.void]:
+        """パターンを1件追加し、満杯で上書きしたパターンがあれば返す"""
+        evicted = None
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            if self.policy == EVICT_FIFO:
+                slot = self._head
+                self._head = (self._head + 1) % self.capacity
+            else:
+                slot = self._evict()
+            evicted = self._data[slot].copy()
+
+        self._data[slot] = record
+        self._seq[slot] = self._next_seq
+        self._next_seq += 1
+        if self.policy == EVICT_DIVERSE:
+            key = (int(record["app_id"]), int(record["hour"]))
+            self._buckets.setdefault(key, deque()).append(slot)
+            self._recount(key, 1)
+        self._ordered = None
+        return evicted
+
+    def extend(self, records: np.ndarray):
+        """古い順に並んだパターンをまとめて追加"""
+        if self.policy == EVICT_FIFO:
+            # 残るのは末尾の capacity 件だけなので、並べ直して一度に書き込む
+            merged = np.concatenate((self.records(), records))[-self.capacity:]
+            count = len(merged)
+            self._data[:count] = merged
+            self._seq[:count] = np.arange(count)
+            self._size = count
+            self._head = 0
+            self._next_seq = count
+            self._ordered = None
+            return
+        for record in records:
+            self.append(record)
+
+    def records(self) -> np.ndarray:
+        """古い順に並べたパターン（次に追加するまで有効）"""
+        if self._ordered is None:
+            if self._size < self.capacity:
+                self._ordered = self._data[:self._size]
+            elif self.policy == EVICT_FIFO:
+                self._ordered = np.concatenate(
+                    (self._data[self._head:], self._data[:self._head])
+                )
+            else:
+                self._ordered = self._data[np.argsort(self._seq, kind="stable")]
+        return self._ordered
+
+    def _evict(self) -> int:
+        """件数の最も多い区分から最も古いパターンを外し、空いた位置を返す
+
+        同数の区分が複数あれば、最も古いパターンを持つ区分から外す（読み込み直しても
+        同じものが選ばれるよう、追加順だけで決める）。
+        """
+        count = self._max_count
+        members = self._by_count[count]
+        heap = self._heaps[count]
+        while True:
+            seq, key = heap[0]
+            # 別の件数へ移った・最古のパターンが入れ替わった区分の要素は捨てる
+            if key in members and self._seq[self._buckets[key][0]] == seq:
+                break
+            heapq.heappop(heap)
+        heapq.heappop(heap)
+        slot = self._buckets[key].popleft()
+        self._recount(key, -1)
+        return slot
+
+    def _recount(self, key: tuple[int, int], delta: int):
+        """区分の件数が delta 変わったあとで件数別の索引を更新"""
+        count = len(self._buckets[key])
+        old = count - delta
+        if old:
+            same = self._by_count[old]
+            del same[key]
+            if not same:
+                del self._by_count[old]
+                del self._heaps[old]
+        if count:
+            members = self._by_count.setdefault(count, {})
+            members[key] = None
+            heap = self._heaps.setdefault(count, [])
+            heapq.heappush(heap, (int(self._seq[self._buckets[key][0]]), key))
+            if len(heap) > 2 * len(members) + 16:
+                # 古くなった要素が溜まったら作り直す
+                heap[:] = [(int(self._seq[self._buckets[k][0]]), k) for k in members]
+                heapq.heapify(heap)
+        else:
+            del self._buckets[key]
+        if count > self._max_count:
+            self._max_count = count
+        elif old == self._max_count and old not in self._by_count:
+            self._max_count = count
+
+
+class PredictionCache:
+    """予測結果の LRU キャッシュ（有効期限付き）
+
+    監視のたびにほぼ同じ状態で何度も predict が呼ばれるので、量子化した状態を
+    キーにして結果を使い回す。学習パターンが変わったら clear() で捨てる。
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, Prediction]] = OrderedDict()
+        # 調整用の統計
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[Prediction]:
+        """キャッシュを引く（無い・期限切れなら None）"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, prediction = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prediction
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, prediction: Prediction):
+        """結果を登録（上限を超えたら最も使われていないものを捨てる）"""
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic(), prediction)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """全エントリを破棄（統計は残す）"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """ヒット率などの統計を取得"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
 class PatternLearner:
     """使用パターン学習・予測クラス"""
 
@@ -46,38 +478,488 @@ class PatternLearner:
         "explorer.exe", "searchhost.exe",
     }
 
-    def __init__(self, model_path: Optional[Path] = None):
+    # 保持する学習パターンの上限
+    MAX_PATTERNS = 1000
+
+    # オンライン学習の予測を使い始める学習件数と、採用する確率の下限
+    ONLINE_MIN_UPDATES = 30
+    ONLINE_MIN_CONFIDENCE = 0.6
+
+    def __init__(
+        self,
+        model_path: Optional[Path] = None,
+        fsync: str = FSYNC_INTERVAL,
+        fsync_interval: float = 5.0,
+        compact_every: int = 256,
+        capacity: Optional[int] = None,
+        eviction: str = EVICT_DIVERSE,
+        cache_size: int = 256,
+        cache_ttl: float = 60.0,
+        online: bool = False,
+        checkpoint_every: int = 50,
+        vocabulary: Optional[AppVocabulary] = None,
+    ):
         if model_path is None:
             app_data = Path(os.environ.get("APPDATA", "."))
-            self.model_path = app_data / "PowerPlanAI" / "model.pkl"
-        else:
-            self.model_path = model_path
+            model_path = app_data / "PowerPlanAI" / "model.bin"
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"不明な fsync 方針です: {fsync}")
+        # 旧形式のパスを渡された場合も新形式で保存する
+        self.model_path = model_path.with_suffix(".bin")
+        self.journal_path = model_path.with_suffix(".journal")
+        self.legacy_path = model_path.with_suffix(".pkl")
+        self.online_path = model_path.with_suffix(".online.npz")
 
         self.model_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 学習データ
-        self._patterns: list[dict] = []
+        # ジャーナルの設定（compact_every 件たまったらスナップショットに畳み込む）
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        # 学習データ（最大 capacity 件。省略時は MAX_PATTERNS 件）
+        self._store = PatternStore(capacity or self.MAX_PATTERNS, eviction)
+        # アプリは共有のアプリ名辞書のIDで持ち、参照している件数分 pin しておく
+        self.vocabulary = get_vocabulary() if vocabulary is None else vocabulary
+        self._pinned_apps: dict[int, int] = {}
+        self._temporary_pins: list[int] = []
+        self._plans: list[str] = []
+        self._plan_ids: dict[str, int] = {}
+        # 類似検索用の配列（パターンが変わったら作り直す）
+        self._arrays: Optional[_PatternArrays] = None
+        # 状況 × プランの得票表（パターンの追加・削除に合わせて更新する）
+        self._votes = _VoteTable()
+        # 予測結果のキャッシュ（パターンが変わったら捨てる）
+        self.cache = PredictionCache(cache_size, cache_ttl)
+
+        # スナップショットの世代（None: 読めなかった）とジャーナルの状態
+        self._generation: Optional[int] = 0
+        self._journal = None
+        self._journal_entries = 0
+        self._last_fsync = time.monotonic()
         self._load_model()
 
+        # オンライン学習（checkpoint_every 件ごとに重みを保存する）
+        self.online: Optional[OnlineLogisticModel] = None
+        self.checkpoint_every = checkpoint_every
+        self._online_pending = 0
+        if online:
+            self._load_online()
+
     def _load_model(self):
-        """モデルを読み込み"""
+        """スナップショットとジャーナルからモデルを復元
+
+        旧形式の model.pkl しか無ければ変換する。ジャーナルは末尾が壊れていれば
+        そこまでを採用して切り詰める。
+        """
+        compact = False
         if self.model_path.exists():
             try:
-                with open(self.model_path, "rb") as f:
-                    self._patterns = pickle.load(f)
-                logger.info(f"モデル読み込み: {len(self._patterns)}パターン")
-            except Exception as e:
+                self._read_model()
+                logger.info(f"モデル読み込み: {len(self._records)}パターン")
+            except (OSError, ValueError) as e:
                 logger.warning(f"モデル読み込みエラー: {e}")
-                self._patterns = []
+                self._set_plans([])
+                self._store.clear()
+                # 読めるジャーナルがあれば世代を問わず採用し、スナップショットを書き直す
+                self._generation = None
+                compact = True
+        elif self.legacy_path.exists():
+            compact = self._migrate_legacy_model()
+
+        journal = None if compact and self._generation is not None else self._read_journal()
+        if journal is not None:
+            rows, valid_size = journal
+            self._apply_journal(rows)
+            if rows:
+                logger.info(f"ジャーナル再生: {len(rows)}パターン")
+            compact = compact or len(rows) >= self.compact_every
+
+        self._votes.rebuild(self._records)
+        self._repin_apps()
+
+        if journal is None:
+            self.compact()
+        elif compact:
+            self.compact(journal=(valid_size, len(rows)))
+        else:
+            self._open_journal(valid_size, len(rows))
+
+    def _read_model(self):
+        """model.bin を読む。レコード部分はメモリマップしてパターン置き場へ写す"""
+        with open(self.model_path, "rb") as f:
+            header = f.read(_MODEL_HEADER.size)
+            if len(header) < _MODEL_HEADER_V1.size:
+                raise ValueError("モデルファイルが短すぎます")
+            magic, version = header[:4], _MODEL_HEADER_V1.unpack_from(header)[1]
+            if magic != _MODEL_MAGIC:
+                raise ValueError("モデルファイルではありません")
+            if version == 1:
+                header_size = _MODEL_HEADER_V1.size
+                _, _, count, n_apps, n_plans, names_size = _MODEL_HEADER_V1.unpack_from(header)
+                generation = 0
+            elif version == _MODEL_VERSION and len(header) == _MODEL_HEADER.size:
+                header_size = _MODEL_HEADER.size
+                _, _, count, n_apps, n_plans, names_size, generation = _MODEL_HEADER.unpack(header)
+            else:
+                raise ValueError(f"未対応のモデル形式です: v{version}")
+            f.seek(header_size)
+            names = f.read(names_size)
+
+        offset = header_size + names_size
+        expected = offset + count * MODEL_DTYPE.itemsize
+        if len(names) < names_size or self.model_path.stat().st_size < expected:
+            raise ValueError("モデルファイルが途中で切れています")
+
+        apps, end = _unpack_names(names, n_apps)
+        plans, _ = _unpack_names(names, n_plans, end)
+        # ファイル内のアプリ番号 → アプリ名辞書のID
+        app_map = np.array([self._intern_app(name) for name in apps], dtype=np.uint16)
+        self._set_plans(plans)
+        self._store.clear()
+        if count:
+            # 写し終えたらマップは手放す（Windows ではマップ中のファイルを置き換えられない）
+            records = np.array(np.memmap(
+                self.model_path, dtype=MODEL_DTYPE, mode="r", offset=offset, shape=(count,)
+            ))
+            records["app_id"] = app_map[records["app_id"]]
+            self._store.extend(records)
+        self._generation = generation
+        self._arrays = None
 
-    def _save_model(self):
-        """モデルを保存"""
+    def _migrate_legacy_model(self) -> bool:
+        """旧形式（pickle した辞書のリスト）を新形式へ変換し、成功したかを返す
+
+        旧ファイルは自分で書いたものに限り一度だけ読み、スナップショットを書いた後に
+        .pkl.bak に改名して残す。
+        """
         try:
-            with open(self.model_path, "wb") as f:
-                pickle.dump(self._patterns, f)
-            logger.debug("モデル保存完了")
+            with open(self.legacy_path, "rb") as f:
+                patterns = pickle.load(f)
+            self._replace_patterns(patterns)
+            logger.info(f"旧形式のモデルを変換: {len(self._records)}パターン")
+            return True
         except Exception as e:
+            logger.warning(f"旧形式のモデル変換エラー: {e}")
+            self._set_plans([])
+            self._store.clear()
+            return False
+
+    def _read_journal(self) -> Optional[tuple[list[tuple], int]]:
+        """ジャーナルを読み、(パターンのリスト, 正常な部分のバイト数) を返す
+
+        ファイルが無い・別の世代のもの（畳み込み済み）なら None。
+        CRC が合わないエントリや途中で切れたエントリ以降は捨てる。
+        """
+        try:
+            data = self.journal_path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"ジャーナル読み込みエラー: {e}")
+            return None
+
+        if len(data) < _JOURNAL_HEADER.size:
+            logger.warning("ジャーナルのヘッダが壊れています")
+            return None
+        magic, version, generation = _JOURNAL_HEADER.unpack_from(data)
+        if magic != _JOURNAL_MAGIC or version != _JOURNAL_VERSION:
+            logger.warning("ジャーナルの形式が不正です")
+            return None
+        if self._generation is None:
+            self._generation = generation
+        elif generation != self._generation:
+            # 畳み込み後、ジャーナルを作り直す前に終了した場合
+            logger.debug(f"古い世代のジャーナルを破棄: {generation}")
+            return None
+
+        rows = []
+        offset = _JOURNAL_HEADER.size
+        while offset + _JOURNAL_ENTRY.size <= len(data):
+            length, crc = _JOURNAL_ENTRY.unpack_from(data, offset)
+            start = offset + _JOURNAL_ENTRY.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            try:
+                fields = _JOURNAL_PATTERN.unpack_from(payload)
+                names, end = _unpack_names(payload, 2, _JOURNAL_PATTERN.size)
+            except (struct.error, UnicodeDecodeError):
+                break
+            if end != length:
+                break
+            rows.append((*fields, *names))
+            offset = start + length
+
+        if offset < len(data):
+            logger.warning(f"ジャーナル末尾の破損を切り詰め: {len(data) - offset}バイト")
+        return rows, offset
+
+    def _apply_journal(self, rows: list[tuple]):
+        """ジャーナルのパターンを現在のパターンの後ろに追加"""
+        if not rows:
+            return
+        records = np.empty(len(rows), dtype=MODEL_DTYPE)
+        for i, (timestamp, cpu, memory, hour, dow, charging, app, plan) in enumerate(rows):
+            records[i] = (
+                timestamp,
+                cpu,
+                memory,
+                self._intern_app(app),
+                self._intern(self._plans, self._plan_ids, plan),
+                hour,
+                dow,
+                charging,
+            )
+        self._store.extend(records)
+        self._arrays = None
+
+    def _open_journal(self, valid_size: int, entries: int):
+        """既存のジャーナルを壊れた末尾を落として追記用に開く"""
+        try:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_size)
+            self._journal = open(self.journal_path, "ab")
+            self._journal_entries = entries
+        except OSError as e:
+            logger.error(f"ジャーナルを開けません: {e}")
+            self._journal = None
+
+    def _reset_journal(self):
+        """現在の世代の空のジャーナルを作る（一時ファイルに書いてから置き換える）"""
+        self._close_journal()
+        tmp = self.journal_path.with_suffix(".journal.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_JOURNAL_HEADER.pack(_JOURNAL_MAGIC, _JOURNAL_VERSION, self._generation))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journal_path)
+            self._journal = open(self.journal_path, "ab")
+            self._journal_entries = 0
+            self._last_fsync = time.monotonic()
+        except OSError as e:
+            logger.error(f"ジャーナル作成エラー: {e}")
+
+    def _close_journal(self):
+        """ジャーナルを fsync して閉じる"""
+        if self._journal is None:
+            return
+        try:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+        except OSError as e:
+            logger.error(f"ジャーナルを閉じられません: {e}")
+        self._journal = None
+
+    def _append_journal(self, record: np.void):
+        """パターン1件をジャーナルに追記し、fsync 方針に従って同期する"""
+        if self._journal is None:
+            return
+        payload = _JOURNAL_PATTERN.pack(
+            int(record["timestamp"]),
+            float(record["cpu_percent"]),
+            float(record["memory_percent"]),
+            int(record["hour"]),
+            int(record["day_of_week"]),
+            int(record["is_charging"]),
+        ) + _pack_names([
+            self.vocabulary.name(int(record["app_id"])), self._plans[record["plan_id"]]
+        ])
+        try:
+            self._journal.write(_JOURNAL_ENTRY.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._journal.flush()
+            now = time.monotonic()
+            if self.fsync == FSYNC_ALWAYS or (
+                self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(self._journal.fileno())
+                self._last_fsync = now
+        except OSError as e:
+            logger.error(f"ジャーナル書き込みエラー: {e}")
+            return
+        self._journal_entries += 1
+
+    @property
+    def _records(self) -> np.ndarray:
+        """学習パターン（古い順）"""
+        return self._store.records()
+
+    def _set_plans(self, plans: list[str]):
+        """プラン名表を設定"""
+        self._plans = plans
+        self._plan_ids = {name: i for i, name in enumerate(plans)}
+
+    def _intern_app(self, name: str) -> int:
+        """アプリ名辞書のIDを取得（まとめて読み込む間は仮に pin し、_repin_apps で外す）"""
+        id_ = self.vocabulary.intern(name, pin=True)
+        self._temporary_pins.append(id_)
+        return id_
+
+    def _repin_apps(self):
+        """保持しているパターンが参照するアプリを、参照件数分だけ pin し直す"""
+        counts = np.bincount(self._records["app_id"]).tolist()
+        pinned = {id_: count for id_, count in enumerate(counts) if count}
+        for id_ in pinned.keys() | self._pinned_apps.keys():
+            delta = pinned.get(id_, 0) - self._pinned_apps.get(id_, 0)
+            if delta > 0:
+                self.vocabulary.pin(id_, delta)
+            elif delta < 0:
+                self.vocabulary.release(id_, -delta)
+        self._pinned_apps = pinned
+        for id_ in self._temporary_pins:
+            self.vocabulary.release(id_)
+        self._temporary_pins = []
+
+    def _release_app(self, id_: int):
+        """パターン1件分のアプリの pin を外す"""
+        remaining = self._pinned_apps.get(id_, 0) - 1
+        if remaining > 0:
+            self._pinned_apps[id_] = remaining
+        else:
+            self._pinned_apps.pop(id_, None)
+        self.vocabulary.release(id_)
+
+    def _intern(self, names: list[str], ids: dict[str, int], name: str) -> int:
+        """名前表での添字を取得（無ければ追加）"""
+        id_ = ids.get(name)
+        if id_ is None:
+            id_ = ids[name] = len(names)
+            names.append(name)
+        return id_
+
+    def _replace_patterns(self, patterns: list[dict]):
+        """学習パターンを辞書のリスト（旧形式）で置き換える"""
+        self._set_plans([])
+        records = np.empty(len(patterns), dtype=MODEL_DTYPE)
+        for i, p in enumerate(patterns):
+            timestamp = p.get("timestamp")
+            records[i] = (
+                int(datetime.fromisoformat(timestamp).timestamp()) if timestamp else 0,
+                p["cpu_percent"],
+                p["memory_percent"],
+                self._intern_app(p["active_app"]),
+                self._intern(self._plans, self._plan_ids, p["chosen_plan"]),
+                p["hour"],
+                p["day_of_week"],
+                bool(p["is_charging"]),
+            )
+        self._store.clear()
+        self._store.extend(records)
+        self._arrays = None
+        self._votes.rebuild(self._records)
+        self._repin_apps()
+        self.cache.clear()
+
+    def _save_model(self, generation: int) -> bool:
+        """スナップショットを保存（一時ファイルに書いてから置き換える）
+
+        名前表は現在のパターンが参照しているものだけに詰めて書く。
+        """
+        records = self._records
+        used_apps = np.unique(records["app_id"])
+        used_plans = np.unique(records["plan_id"])
+        packed = records.copy()
+        packed["app_id"] = np.searchsorted(used_apps, records["app_id"])
+        packed["plan_id"] = np.searchsorted(used_plans, records["plan_id"])
+        names = (
+            _pack_names([self.vocabulary.name(i) for i in used_apps.tolist()])
+            + _pack_names([self._plans[i] for i in used_plans.tolist()])
+        )
+        header = _MODEL_HEADER.pack(
+            _MODEL_MAGIC, _MODEL_VERSION, len(packed), len(used_apps), len(used_plans),
+            len(names), generation
+        )
+
+        tmp = self.model_path.with_suffix(".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(header)
+                f.write(names)
+                f.write(packed.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.model_path)
+            logger.debug("モデル保存完了")
+            return True
+        except OSError as e:
             logger.error(f"モデル保存エラー: {e}")
+            return False
+
+    def compact(self, journal: Optional[tuple[int, int]] = None):
+        """現在のパターンをスナップショットに畳み込み、ジャーナルを空にする
+
+        スナップショットを次の世代で書いてからジャーナルを作り直す。間で落ちても
+        古い世代のジャーナルは起動時に破棄されるので、同じパターンが二重に入らない。
+        journal は起動時に読んだジャーナルの (正常な部分のバイト数, 件数)。
+        """
+        generation = (self._generation or 0) + 1
+        if not self._save_model(generation):
+            # スナップショットを書けなければ今のジャーナルに追記し続ける
+            # （起動時はまだ開いていないので、読んだジャーナルを開き直す）
+            if self._journal is None:
+                if journal is not None:
+                    self._open_journal(*journal)
+                elif self._generation is not None:
+                    self._reset_journal()
+            return
+        self._generation = generation
+        self._reset_journal()
+        if self.legacy_path.exists():
+            try:
+                os.replace(self.legacy_path, self.legacy_path.with_suffix(".pkl.bak"))
+            except OSError as e:
+                logger.warning(f"旧形式のモデルを退避できません: {e}")
+
+    def _load_online(self):
+        """オンライン学習の重みを読み込み、保存後に増えたパターンを学習し直す
+
+        保存した重みが無ければ、保持しているパターン全件から学習する。
+        """
+        self.online = OnlineLogisticModel()
+        if self.online_path.exists():
+            try:
+                self.online.load(self.online_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"オンライン学習の重み読み込みエラー: {e}")
+                self.online = OnlineLogisticModel()
+
+        records = self._records
+        newer = records[records["timestamp"] > self.online.last_timestamp]
+        for record in newer:
+            self._update_online(record)
+        if len(newer):
+            logger.info(f"オンライン学習: {len(newer)}パターンを追加学習")
+            self.checkpoint()
+
+    def _update_online(self, record: np.void):
+        """パターン1件をオンライン学習に反映"""
+        self.online.update(
+            int(record["hour"]),
+            int(record["day_of_week"]),
+            bool(record["is_charging"]),
+            self.vocabulary.name(int(record["app_id"])),
+            self._plans[record["plan_id"]],
+            int(record["timestamp"]),
+        )
+        self._online_pending += 1
+
+    def checkpoint(self):
+        """オンライン学習の重みを保存"""
+        if self.online is None:
+            return
+        try:
+            self.online.save(self.online_path)
+            self._online_pending = 0
+        except OSError as e:
+            logger.error(f"オンライン学習の重み保存エラー: {e}")
+
+    def close(self):
+        """ジャーナルを同期して閉じる（オンライン学習の重みも保存する）"""
+        self._close_journal()
+        if self._online_pending:
+            self.checkpoint()
 
     def add_pattern(
         self,
@@ -87,27 +969,43 @@ class PatternLearner:
         memory_percent: float,
         is_charging: bool,
         active_app: str,
-        chosen_plan: str
+        chosen_plan: str,
+        app_id: int = -1
     ):
-        """学習パターンを追加"""
-        pattern = {
-            "hour": hour,
-            "day_of_week": day_of_week,
-            "cpu_percent": cpu_percent,
-            "memory_percent": memory_percent,
-            "is_charging": is_charging,
-            "active_app": active_app.lower(),
-            "chosen_plan": chosen_plan,
-            "timestamp": datetime.now().isoformat()
-        }
+        """学習パターンを追加（ジャーナルに1件追記するだけで、全体は書き直さない）
+
+        app_id は SystemStatus.app_id（アプリ名辞書のID）。不明なら -1。
+        """
+        record = np.array([(
+            int(datetime.now().timestamp()),
+            cpu_percent,
+            memory_percent,
+            self.vocabulary.acquire(active_app, app_id),
+            self._intern(self._plans, self._plan_ids, chosen_plan),
+            hour,
+            day_of_week,
+            bool(is_charging),
+        )], dtype=MODEL_DTYPE)
 
-        self._patterns.append(pattern)
+        # 容量を超えたら削除方針に従って1件捨てる
+        evicted = self._store.append(record[0])
+        self._votes.add(record[0])
+        app_id = int(record[0]["app_id"])
+        self._pinned_apps[app_id] = self._pinned_apps.get(app_id, 0) + 1
+        if evicted is not None:
+            self._votes.add(evicted, -1)
+            self._release_app(int(evicted["app_id"]))
+        self._arrays = None
+        self.cache.clear()
 
-        # 最大1000パターンを保持
-        if len(self._patterns) > 1000:
-            self._patterns = self._patterns[-1000:]
+        self._append_journal(record[0])
+        if self._journal_entries >= self.compact_every:
+            self.compact()
 
-        self._save_model()
+        if self.online is not None:
+            self._update_online(record[0])
+            if self._online_pending >= self.checkpoint_every:
+                self.checkpoint()
 
     def predict(
         self,
@@ -117,12 +1015,105 @@ class PatternLearner:
         memory_percent: float,
         battery_percent: Optional[int],
         is_charging: bool,
+        active_app: str,
+        app_id: int = -1
+    ) -> Prediction:
+        """最適な電源プランを予測（同じ状態の結果はキャッシュから返す）
+
+        app_id は SystemStatus.app_id（アプリ名辞書のID）。不明なら -1。
+        """
+        key = self._prediction_key(
+            hour, day_of_week, cpu_percent, battery_percent, is_charging, active_app
+        )
+        prediction = self.cache.get(key)
+        if prediction is None:
+            prediction = self._predict(
+                hour, day_of_week, cpu_percent, battery_percent, is_charging, active_app, app_id
+            )
+            self.cache.put(key, prediction)
+        return prediction
+
+    @staticmethod
+    def _prediction_key(
+        hour: int,
+        day_of_week: int,
+        cpu_percent: float,
+        battery_percent: Optional[int],
+        is_charging: bool,
         active_app: str
+    ) -> tuple:
+        """予測キャッシュのキー（予測結果が変わらない範囲をまとめて量子化する）
+
+        CPU は判定のしきい値（20% / 70%）で区切り、理由に数値が出る両端だけ表示桁で
+        分ける。バッテリーも理由に残量が出る 20% 未満だけ値を持つ。メモリ使用率は
+        予測に使わないのでキーに含めない。
+        """
+        if cpu_percent > 70:
+            cpu_bucket = (1, f"{cpu_percent:.0f}")
+        elif cpu_percent < 20:
+            cpu_bucket = (-1, f"{cpu_percent:.0f}")
+        else:
+            cpu_bucket = (0, "")
+        battery_bucket = (
+            battery_percent if battery_percent is not None and battery_percent < 20 else None
+        )
+        return (
+            hour, day_of_week, cpu_bucket, battery_bucket, bool(is_charging), active_app
+        )
+
+    def _predict(
+        self,
+        hour: int,
+        day_of_week: int,
+        cpu_percent: float,
+        battery_percent: Optional[int],
+        is_charging: bool,
+        active_app: str,
+        app_id: int = -1
     ) -> Prediction:
-        """最適な電源プランを予測"""
-        app_lower = active_app.lower()
+        """最適な電源プランを予測（キャッシュを通さない）"""
+        prediction = self.predict_by_rules(cpu_percent, battery_percent, is_charging, active_app)
+        if prediction is not None:
+            return prediction
+
+        app = self.vocabulary.normalize(active_app)
+
+        # 5. オンライン学習の予測
+        online = self.online
+        if online is not None and online.updates >= self.ONLINE_MIN_UPDATES:
+            result = online.predict(hour, day_of_week, is_charging, app)
+            if result is not None and result[1] >= self.ONLINE_MIN_CONFIDENCE:
+                plan, confidence = result
+                return Prediction(
+                    recommended_plan=plan,
+                    confidence=min(confidence, 0.85),
+                    reason=f"オンライン学習（{online.updates}件）による予測"
+                )
+
+        # 6. 学習パターンからの予測
+        if len(self._records) >= 10:
+            prediction = self._predict_from_patterns(
+                hour, day_of_week, cpu_percent, is_charging, app, app_id
+            )
+            if prediction:
+                return prediction
 
-        # ルールベースの判定（優先）
+        # 7. デフォルト：バランス
+        return Prediction(
+            recommended_plan=self.PLAN_BALANCED,
+            confidence=0.50,
+            reason="標準設定（学習データ収集中）"
+        )
+
+    def predict_by_rules(
+        self,
+        cpu_percent: float,
+        battery_percent: Optional[int],
+        is_charging: bool,
+        active_app: str
+    ) -> Optional[Prediction]:
+        """ルールベースの判定（予測の 1〜4。どのルールにも当たらなければ None）"""
+        app_lower = active_app.lower()
 
         # 1. バッテリー残量が低い場合は省電力
         if battery_percent is not None and battery_percent < 20 and not is_charging:
@@ -179,20 +1170,7 @@ class PatternLearner:
                 reason=f"CPU負荷が{cpu_percent:.0f}%と低い"
             )
 
-        # 5. 学習パターンからの予測
-        if len(self._patterns) >= 10:
-            prediction = self._predict_from_patterns(
-                hour, day_of_week, cpu_percent, is_charging, app_lower
-            )
-            if prediction:
-                return prediction
-
-        # 6. デフォルト：バランス
-        return Prediction(
-            recommended_plan=self.PLAN_BALANCED,
-            confidence=0.50,
-            reason="標準設定（学習データ収集中）"
-        )
+        return None
 
     def _predict_from_patterns(
         self,
@@ -200,79 +1178,103 @@ class PatternLearner:
         day_of_week: int,
         cpu_percent: float,
         is_charging: bool,
-        active_app: str
+        active_app: str,
+        app_id: int = -1
     ) -> Optional[Prediction]:
-        """学習パターンから予測"""
-        # 類似パターンを検索
-        similar_patterns = []
-
-        for p in self._patterns:
-            score = 0.0
-
-            # 時間帯の類似度
-            hour_diff = abs(p["hour"] - hour)
-            if hour_diff <= 1:
-                score += 0.3
-            elif hour_diff <= 3:
-                score += 0.1
-
-            # 曜日の類似度
-            if p["day_of_week"] == day_of_week:
-                score += 0.2
-
-            # AC接続状態
-            if p["is_charging"] == is_charging:
-                score += 0.2
+        """学習パターンから予測
 
-            # アプリの一致
-            if p["active_app"] == active_app:
-                score += 0.3
-
-            if score >= 0.5:
-                similar_patterns.append((score, p["chosen_plan"]))
-
-        if not similar_patterns:
-            return None
-
-        # 最も多いプランをカウント
-        plan_counts = {}
-        for score, plan in similar_patterns:
-            plan_counts[plan] = plan_counts.get(plan, 0) + score
-
-        if not plan_counts:
+        類似パターンのスコアのプラン別合計を得票表から求めて多数決する。
+        パターンを走査するのは、得票が同点で先に現れたプランを調べるときだけ。
+        """
+        app_id = self.vocabulary.resolve(active_app, app_id)
+        votes, count = self._votes.votes(hour, day_of_week, bool(is_charging), app_id)
+        if count == 0:
             return None
 
-        best_plan = max(plan_counts, key=plan_counts.get)
-        total_score = sum(plan_counts.values())
-        confidence = plan_counts[best_plan] / total_score if total_score > 0 else 0.5
+        best_votes = votes.max()
+        tied = np.flatnonzero(votes == best_votes).tolist()
+        best = tied[0] if len(tied) == 1 else self._first_voted(
+            tied, hour, day_of_week, is_charging, app_id
+        )
+        total = int(votes.sum())
+        confidence = int(best_votes) / total if total > 0 else 0.5
 
         return Prediction(
-            recommended_plan=best_plan,
+            recommended_plan=self._plans[best],
             confidence=min(confidence, 0.85),
-            reason=f"過去の使用パターン（{len(similar_patterns)}件）から予測"
+            reason=f"過去の使用パターン（{count}件）から予測"
         )
 
-    def get_stats(self) -> dict:
-        """学習統計を取得"""
-        if not self._patterns:
-            return {"total_patterns": 0, "plan_distribution": {}}
+    def _first_voted(
+        self,
+        plan_ids: list[int],
+        hour: int,
+        day_of_week: int,
+        is_charging: bool,
+        app_id: int
+    ) -> int:
+        """plan_ids のうち、類似パターンの中で最初に現れるプランを返す"""
+        arrays = self._arrays
+        if arrays is None:
+            arrays = self._arrays = _PatternArrays.build(
+                self._records, self._plans
+            )
 
-        plan_dist = {}
-        for p in self._patterns:
-            plan = p["chosen_plan"]
-            plan_dist[plan] = plan_dist.get(plan, 0) + 1
+        code = _context_codes(hour, day_of_week, bool(is_charging))[arrays.context]
+        code += arrays.app_id == app_id
+        similar_plans = arrays.plan_id[_SIMILAR_BY_CODE[code]]
+        # プランの種類は少ないので、出現位置はプランごとに探す
+        return min(plan_ids, key=lambda plan_id: int(np.argmax(similar_plans == plan_id)))
 
+    def get_patterns(self) -> dict[str, np.ndarray]:
+        """学習パターンを列ごとの配列で取得（古い順。呼び出し側で変更してよいコピー）"""
+        records = self._records
+        app_ids, app_index = np.unique(records["app_id"], return_inverse=True)
+        apps = np.array([self.vocabulary.name(id_) for id_ in app_ids.tolist()], dtype=object)
+        plans = np.array(self._plans, dtype=object)
         return {
-            "total_patterns": len(self._patterns),
-            "plan_distribution": plan_dist
+            "hour": records["hour"].astype(np.int64),
+            "day_of_week": records["day_of_week"].astype(np.int64),
+            "cpu_percent": records["cpu_percent"].astype(np.float64),
+            "memory_percent": records["memory_percent"].astype(np.float64),
+            "is_charging": records["is_charging"].astype(bool),
+            "active_app": apps[app_index],
+            "chosen_plan": plans[records["plan_id"]],
         }
 
+    def get_stats(self) -> dict:
+        """学習統計を取得"""
+        # 出現順に並べる
+        plan_ids = self._records["plan_id"]
+        counts = np.bincount(plan_ids)
+        ids, first = np.unique(plan_ids, return_index=True)
+        plan_dist = {
+            self._plans[id_]: int(counts[id_])
+            for id_ in ids[np.argsort(first)].tolist()
+        }
+
+        stats = {
+            "total_patterns": len(self._records),
+            "plan_distribution": plan_dist,
+            "prediction_cache": self.cache.stats(),
+        }
+        if self.online is not None:
+            stats["online"] = {
+                "updates": self.online.updates,
+                "drifts": self.online.drifts,
+                "learning_rate": self.online.current_learning_rate,
+                "loss": self.online.fast_loss,
+            }
+        return stats
+
 
 class SmartOptimizer:
     """スマート最適化エンジン"""
 
     def __init__(self):
-        self.learner = PatternLearner()
+        self.learner = PatternLearner(online=True)
+        # 学習モデル（model_trainer.PlanModel）。学習が終わるまでは None
+        self.model = None
         self._last_plan: Optional[str] = None
         self._switch_count = 0
         self._min_switch_interval = 60  # 最小切り替え間隔（秒）
@@ -285,9 +1287,25 @@ class SmartOptimizer:
         memory_percent: float,
         battery_percent: Optional[int],
         is_charging: bool,
-        active_app: str
+        active_app: str,
+        app_id: int = -1
     ) -> Prediction:
-        """最適化推奨を取得"""
+        """最適化推奨を取得
+
+        ルールに当たらない場合は学習モデルを使い、モデルが無い・自信が無いときは
+        学習パターンによる予測に戻る。
+        """
+        model = self.model
+        if model is not None and self.learner.predict_by_rules(
+            cpu_percent, battery_percent, is_charging, active_app
+        ) is None:
+            prediction = model.predict(
+                hour, day_of_week, cpu_percent, memory_percent,
+                battery_percent, is_charging, active_app
+            )
+            if prediction is not None:
+                return prediction
+
         prediction = self.learner.predict(
             hour=hour,
             day_of_week=day_of_week,
@@ -295,7 +1313,8 @@ class SmartOptimizer:
             memory_percent=memory_percent,
             battery_percent=battery_percent,
             is_charging=is_charging,
-            active_app=active_app
+            active_app=active_app,
+            app_id=app_id
         )
 
         return prediction
@@ -308,7 +1327,8 @@ class SmartOptimizer:
         memory_percent: float,
         is_charging: bool,
         active_app: str,
-        chosen_plan: str
+        chosen_plan: str,
+        app_id: int = -1
     ):
         """ユーザーの選択を学習"""
         self.learner.add_pattern(
@@ -318,9 +1338,22 @@ class SmartOptimizer:
             memory_percent=memory_percent,
             is_charging=is_charging,
             active_app=active_app,
-            chosen_plan=chosen_plan
+            chosen_plan=chosen_plan,
+            app_id=app_id
         )
 
+    def set_model(self, model):
+        """学習モデルを差し替える（None でルールベースのみに戻す）
+
+        参照の代入だけなので、学習スレッドから呼んでもよい。
+        """
+        self.model = model
+        logger.info("学習モデルを差し替え" if model is not None else "学習モデルを解除")
+
+    def close(self):
+        """終了処理（学習データを同期して閉じる）"""
+        self.learner.close()
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,408 @@
+"""
+サンプルログモジュール
+高頻度サンプリング向けの固定長レコードを日別セグメントファイルへ追記し、
+期間指定で numpy.memmap のビューとして読み出す
+
+    samples/
+        names.jsonl        アプリ名・プラン名 ↔ ID（追記専用）
+        20261017.seg       ヘッダ16バイト + 22バイト固定長レコード（ローカル日付ごと）
+"""
+import json
+import os
+import struct
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterator, Optional
+import logging
+
+import numpy as np
+
+from database import UsageRecord
+
+logger = logging.getLogger(__name__)
+
+# 1レコード22バイト（パディングなし）
+SAMPLE_DTYPE = np.dtype([
+    ("epoch", "<i8"),     # エポック秒
+    ("cpu", "<f4"),
+    ("memory", "<f4"),
+    ("battery", "i1"),    # -1 = バッテリーなし
+    ("flags", "u1"),      # FLAG_* の組み合わせ
+    ("app_id", "<u2"),
+    ("plan_id", "<u2"),
+])
+FLAG_CHARGING = 0x01
+
+_RECORD = struct.Struct("<qffbBHH")
+assert _RECORD.size == SAMPLE_DTYPE.itemsize
+
+# セグメントのヘッダ: マジック, 形式バージョン, レコード長
+_HEADER = struct.Struct("<4sHH8x")
+_MAGIC = b"PPSL"
+_VERSION = 1
+
+_MAX_ID = 0xFFFF
+_KINDS = ("app", "plan")
+
+
+def _day_of(epoch: int) -> date:
+    """エポック秒が属するローカル日付"""
+    return datetime.fromtimestamp(epoch).date()
+
+
+def local_time_fields(epochs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """エポック秒の配列からローカル時刻の (時, 曜日) 配列を計算
+
+    日ごとに各時刻の境界を求めて二分探索するため、夏時間の切り替えでも正しい。
+    """
+    epochs = np.asarray(epochs)
+    if len(epochs) == 0:
+        return np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.uint8)
+
+    day = _day_of(int(epochs.min()))
+    last = _day_of(int(epochs.max()))
+    bounds, hours, dows = [], [], []
+    while day <= last:
+        for hour in range(24):
+            bounds.append(datetime(day.year, day.month, day.day, hour).timestamp())
+            hours.append(hour)
+            dows.append(day.weekday())
+        day = date.fromordinal(day.toordinal() + 1)
+
+    index = np.searchsorted(np.array(bounds), epochs, side="right") - 1
+    return (
+        np.array(hours, dtype=np.uint8)[index],
+        np.array(dows, dtype=np.uint8)[index],
+    )
+
+
+class SampleLog:
+    """日別セグメントに固定長レコードを追記するサンプルストア
+
+    書き込みは batch_size 件ごと、または日付が変わったときにファイルへ出す。
+    読み出しはファイルをメモリマップするだけで、コピーやデコードを伴わない。
+    Windows ではマップ中のファイルを削除できないため、
+    drop_before() の前にビューを解放しておくこと。
+    """
+
+    def __init__(self, directory: Optional[Path] = None, batch_size: int = 20):
+        if directory is None:
+            app_data = Path(os.environ.get("APPDATA", "."))
+            self.directory = app_data / "PowerPlanAI" / "samples"
+        else:
+            self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.RLock()
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._day: Optional[date] = None
+        # 書き込み中のセグメントが受け持つ期間 [_day_start, _day_end)
+        self._day_start = self._day_end = 0
+        self._last_epoch = 0
+        # 時刻が巻き戻った書き込みがあったセグメント（フラッシュ時に並べ直す）
+        self._unsorted: set[date] = set()
+
+        self._names_path = self.directory / "names.jsonl"
+        self._ids: dict[str, dict[str, int]] = {kind: {} for kind in _KINDS}
+        self._names: dict[str, dict[int, str]] = {kind: {} for kind in _KINDS}
+        self._load_names()
+        self.recover()
+
+    # --- 名前辞書 ---
+
+    def _load_names(self):
+        """名前辞書を読み込み（書きかけの最終行は捨てる）"""
+        if not self._names_path.exists():
+            return
+        good = 0
+        with open(self._names_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    kind, id_, name = json.loads(line)
+                except ValueError:
+                    break
+                self._ids[kind][name] = id_
+                self._names[kind][id_] = name
+                good += len(line)
+            size = f.seek(0, os.SEEK_END)
+        if good < size:
+            logger.warning(f"名前辞書の壊れた末尾を切り捨て: {size - good}バイト")
+            with open(self._names_path, "r+b") as f:
+                f.truncate(good)
+
+    def intern(self, kind: str, name: str) -> int:
+        """名前のIDを取得（未登録なら辞書へ追記）"""
+        with self._lock:
+            ids = self._ids[kind]
+            id_ = ids.get(name)
+            if id_ is not None:
+                return id_
+            id_ = len(ids) + 1
+            if id_ > _MAX_ID:
+                raise OverflowError(f"{kind} の種類が上限（{_MAX_ID}）を超えました")
+            line = json.dumps([kind, id_, name], ensure_ascii=False) + "\n"
+            with open(self._names_path, "ab") as f:
+                f.write(line.encode("utf-8"))
+            ids[name] = id_
+            self._names[kind][id_] = name
+            return id_
+
+    def names(self, kind: str) -> dict[int, str]:
+        """ID → 名前の辞書（コピー）"""
+        with self._lock:
+            return dict(self._names[kind])
+
+    def ids(self, kind: str) -> dict[str, int]:
+        """名前 → ID の辞書（コピー）"""
+        with self._lock:
+            return dict(self._ids[kind])
+
+    # --- 書き込み ---
+
+    def append(
+        self,
+        epoch: int,
+        cpu: float,
+        memory: float,
+        battery: Optional[int],
+        charging: bool,
+        app_id: int,
+        plan_id: int
+    ):
+        """レコードを1件追記（バッファ経由）"""
+        with self._lock:
+            if not self._day_start <= epoch < self._day_end:
+                self.flush()
+                self._switch(_day_of(epoch))
+            if epoch < self._last_epoch:
+                self._unsorted.add(self._day)
+            self._last_epoch = max(self._last_epoch, epoch)
+            self._buffer += _RECORD.pack(
+                epoch, cpu, memory,
+                -1 if battery is None else battery,
+                FLAG_CHARGING if charging else 0,
+                app_id, plan_id
+            )
+            self._buffered += 1
+            if self._buffered >= self.batch_size:
+                self.flush()
+
+    @property
+    def pending(self) -> int:
+        """ファイルへ書き出していないレコード数"""
+        return self._buffered
+
+    def append_record(self, record: UsageRecord):
+        """UsageRecord を追記（アプリ名・プラン名はIDへ変換）"""
+        self.append(
+            int(record.timestamp.timestamp()),
+            record.cpu_percent,
+            record.memory_percent,
+            record.battery_percent,
+            record.is_charging,
+            self.intern("app", record.active_app),
+            self.intern("plan", record.power_plan),
+        )
+
+    def _segment_path(self, day: date) -> Path:
+        return self.directory / f"{day:%Y%m%d}.seg"
+
+    def _switch(self, day: date):
+        """書き込み先のセグメントを切り替え（無ければヘッダ付きで作成）"""
+        path = self._segment_path(day)
+        if not path.exists():
+            with open(path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, SAMPLE_DTYPE.itemsize))
+            self._last_epoch = 0
+        else:
+            records = self._map(path)
+            self._last_epoch = int(records["epoch"][-1]) if len(records) else 0
+            del records
+        self._day = day
+        next_day = date.fromordinal(day.toordinal() + 1)
+        self._day_start = int(datetime(day.year, day.month, day.day).timestamp())
+        self._day_end = int(datetime(next_day.year, next_day.month, next_day.day).timestamp())
+
+    def flush(self):
+        """バッファをセグメントへ書き出す"""
+        with self._lock:
+            if not self._buffer:
+                return
+            with open(self._segment_path(self._day), "ab") as f:
+                f.write(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            if self._day in self._unsorted:
+                self._unsorted.discard(self._day)
+                self._sort_segment(self._segment_path(self._day))
+
+    # --- 読み出し ---
+
+    def segments(self) -> list[tuple[date, Path]]:
+        """セグメントの一覧（日付順）"""
+        segments = []
+        for path in self.directory.glob("*.seg"):
+            try:
+                day = datetime.strptime(path.stem, "%Y%m%d").date()
+            except ValueError:
+                continue
+            segments.append((day, path))
+        segments.sort()
+        return segments
+
+    @staticmethod
+    def _map(path: Path) -> np.ndarray:
+        """セグメント全体を読み取り専用でマップ（レコードが無ければ空配列）"""
+        count = (path.stat().st_size - _HEADER.size) // SAMPLE_DTYPE.itemsize
+        if count <= 0:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.memmap(path, dtype=SAMPLE_DTYPE, mode="r", offset=_HEADER.size, shape=(count,))
+
+    def iter_views(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[np.ndarray]:
+        """期間内のレコードをセグメントごとのビュー（コピーなし）で返す"""
+        lo = int(since.timestamp()) if since else 0
+        hi = int(until.timestamp()) if until else 2**62
+        first = _day_of(lo) if since else date.min
+        last = _day_of(hi) if until else date.max
+
+        self.flush()
+        for day, path in self.segments():
+            if day < first or day > last:
+                continue
+            records = self._map(path)
+            epochs = records["epoch"]
+            start, stop = np.searchsorted(epochs, (lo, hi))
+            if stop > start:
+                yield records[start:stop]
+
+    def view(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> np.ndarray:
+        """期間内のレコードを1つの配列で返す
+
+        1セグメントに収まる期間ならメモリマップのビュー、
+        複数日にまたがる場合は連結したコピーになる。
+        """
+        parts = list(self.iter_views(since, until))
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def __len__(self) -> int:
+        self.flush()
+        return sum(
+            max(0, (path.stat().st_size - _HEADER.size) // SAMPLE_DTYPE.itemsize)
+            for _, path in self.segments()
+        )
+
+    # --- 保守 ---
+
+    def recover(self) -> int:
+        """全セグメントを検査して修復
+
+        - 書きかけの末尾（レコード長に満たない端数）を切り捨てる
+        - 電源断などでゼロ埋めされた末尾レコードを切り捨てる
+        - 時刻順になっていないセグメントを並べ直す
+        ヘッダが不正なセグメントは .bad に改名して読み出し対象から外す。
+
+        Returns:
+            切り捨てたバイト数
+        """
+        removed = 0
+        with self._lock:
+            self.flush()
+            for _, path in self.segments():
+                with open(path, "rb") as f:
+                    header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size or _HEADER.unpack(header) != (
+                    _MAGIC, _VERSION, SAMPLE_DTYPE.itemsize
+                ):
+                    logger.warning(f"不正なセグメントを退避: {path.name}")
+                    os.replace(path, path.with_suffix(".bad"))
+                    continue
+
+                size = path.stat().st_size
+                good = size - (size - _HEADER.size) % SAMPLE_DTYPE.itemsize
+                records = self._map(path)
+                epochs = np.asarray(records["epoch"])
+                nonzero = np.flatnonzero(epochs)
+                count = int(nonzero[-1]) + 1 if len(nonzero) else 0
+                good = min(good, _HEADER.size + count * SAMPLE_DTYPE.itemsize)
+                unsorted = bool(np.any(np.diff(epochs[:count]) < 0))
+                del records, epochs
+
+                if good < size:
+                    logger.warning(f"セグメント末尾の壊れたレコードを切り捨て: {path.name} {size - good}バイト")
+                    with open(path, "r+b") as f:
+                        f.truncate(good)
+                    removed += size - good
+                if unsorted:
+                    self._sort_segment(path)
+        return removed
+
+    def _sort_segment(self, path: Path):
+        """セグメントを時刻順に並べ直して置き換える"""
+        records = np.array(self._map(path))
+        order = np.argsort(records["epoch"], kind="stable")
+        self._rewrite(path, records[order])
+
+    @staticmethod
+    def _rewrite(path: Path, records: np.ndarray):
+        """セグメントを一時ファイル経由で置き換える"""
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, SAMPLE_DTYPE.itemsize))
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def drop_before(self, cutoff: datetime) -> int:
+        """cutoff より古いレコードを削除
+
+        丸ごと古いセグメントはファイルごと削除し、境界のセグメントだけ書き直す。
+
+        Returns:
+            削除したレコード数
+        """
+        lo = int(cutoff.timestamp())
+        boundary = _day_of(lo)
+        dropped = 0
+        with self._lock:
+            self.flush()
+            for day, path in self.segments():
+                if day > boundary:
+                    break
+                records = self._map(path)
+                if day < boundary:
+                    dropped += len(records)
+                    del records
+                    path.unlink()
+                    continue
+                keep = int(np.searchsorted(records["epoch"], lo))
+                if keep > 0:
+                    dropped += keep
+                    remaining = np.array(records[keep:])
+                    del records
+                    self._rewrite(path, remaining)
+            if self._day is not None and self._day < boundary:
+                self._day = None
+                self._day_start = self._day_end = 0
+        return dropped
+
+    def close(self):
+        """バッファをフラッシュ"""
+        self.flush()
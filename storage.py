@@ -0,0 +1,700 @@
+"""
+ストレージモジュール
+使用記録ストレージの共通インターフェースと、SQLite以外の実装
+
+- Database（database.py）: SQLite。既定のエンジン
+- MemoryEngine: メモリ上のリングバッファと辞書。テスト・一時利用向け
+- BinaryLogEngine: 日別セグメントの固定長サンプルログ（sample_log.py）
+"""
+import heapq
+import os
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, Optional
+import logging
+
+import numpy as np
+
+from database import Database, UsageRecord, _setting_str
+from sample_log import FLAG_CHARGING, SampleLog, local_time_fields
+
+logger = logging.getLogger(__name__)
+
+
+class StorageEngine(ABC):
+    """使用記録ストレージの共通インターフェース
+
+    アプリ本体（DatabaseWorker 経由の呼び出し）が使うのはこのメソッドだけ。
+    集計（時間帯別・アプリ別）は古い記録を削除しても保持される。
+    """
+
+    @abstractmethod
+    def add_usage_record(self, record: UsageRecord):
+        """使用記録を追加（バッファしてもよい）"""
+
+    @abstractmethod
+    def flush(self):
+        """バッファ中の書き込みを確定"""
+
+    def flush_if_due(self):
+        """バッファの滞留時間が上限を超えていればフラッシュ（アイドル時に呼ばれる）"""
+
+    @abstractmethod
+    def iter_records(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        *,
+        app: Optional[str] = None
+    ) -> Iterator[UsageRecord]:
+        """期間内の使用記録を古い順に返す（until は含まない）"""
+
+    def get_recent_records(self, hours: int = 24) -> list[UsageRecord]:
+        """直近の使用記録を取得（新しい順）"""
+        since = datetime.now() - timedelta(hours=hours)
+        records = list(self.iter_records(since))
+        records.reverse()
+        return records
+
+    @abstractmethod
+    def get_hourly_pattern(
+        self,
+        hour: int,
+        day_of_week: Optional[int] = None,
+        is_charging: Optional[bool] = None
+    ) -> dict:
+        """特定時間帯の使用パターン（平均・標準偏差・件数）を取得"""
+
+    @abstractmethod
+    def get_app_usage_stats(self, limit: int = 20) -> dict[str, int]:
+        """アプリ別使用回数を取得（多い順）"""
+
+    @abstractmethod
+    def update_daily_stats(
+        self,
+        plan_name: str,
+        minutes: int = 1,
+        when: Optional[datetime] = None
+    ):
+        """日次統計（プラン別稼働時間）を加算"""
+
+    @abstractmethod
+    def get_daily_stats(self, date: str) -> dict:
+        """指定日（YYYY-MM-DD）の統計を取得"""
+
+    def get_today_stats(self) -> dict:
+        """今日の統計を取得"""
+        return self.get_daily_stats(datetime.now().date().isoformat())
+
+    @abstractmethod
+    def get_setting(self, key: str, default: str = "") -> str:
+        """設定値を取得"""
+
+    @abstractmethod
+    def set_setting(self, key: str, value: Any):
+        """設定値を保存"""
+
+    @abstractmethod
+    def cleanup_old_records(self, days: Optional[int] = None) -> int:
+        """days 日（省略時はエンジンの保持日数）より古い記録を削除し、削除件数を返す"""
+
+    def run_maintenance(self) -> bool:
+        """保持ポリシーを適用（定期実行用）。残作業があれば True"""
+        self.cleanup_old_records()
+        return False
+
+    @abstractmethod
+    def close(self):
+        """バッファをフラッシュして閉じる"""
+
+    def __enter__(self) -> "StorageEngine":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# SQLiteエンジンは既存の Database をそのまま使う
+StorageEngine.register(Database)
+
+
+class _Aggregates:
+    """時間帯別・アプリ別・日次の集計（Database の集計テーブルと同じ値を返す）"""
+
+    def __init__(self):
+        # (hour, day_of_week, is_charging) → [件数, CPU合計, CPU二乗和, メモリ合計, メモリ二乗和]
+        self.hourly: dict[tuple[int, int, int], list[float]] = {}
+        self.apps: dict[str, int] = {}
+        self.daily: dict[tuple[str, str], int] = {}
+
+    def add(self, hour: int, day_of_week: int, charging: int, cpu: float, mem: float, app: str):
+        """使用記録1件を加算"""
+        acc = self.hourly.get((hour, day_of_week, charging))
+        if acc is None:
+            acc = self.hourly[(hour, day_of_week, charging)] = [0, 0.0, 0.0, 0.0, 0.0]
+        acc[0] += 1
+        acc[1] += cpu
+        acc[2] += cpu * cpu
+        acc[3] += mem
+        acc[4] += mem * mem
+        self.apps[app] = self.apps.get(app, 0) + 1
+
+    def merge_hourly(self, key: tuple[int, int, int], values: list[float]):
+        """集計済みの時間帯別の値を合算"""
+        acc = self.hourly.get(key)
+        if acc is None:
+            self.hourly[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                acc[i] += value
+
+    def hourly_pattern(
+        self,
+        hour: int,
+        day_of_week: Optional[int],
+        is_charging: Optional[bool]
+    ) -> dict:
+        """get_hourly_pattern の結果を計算"""
+        count = cpu_sum = cpu_sq = mem_sum = mem_sq = 0
+        for (h, dow, charging), acc in self.hourly.items():
+            if h != hour:
+                continue
+            if day_of_week is not None and dow != day_of_week:
+                continue
+            if is_charging is not None and charging != int(is_charging):
+                continue
+            count += acc[0]
+            cpu_sum += acc[1]
+            cpu_sq += acc[2]
+            mem_sum += acc[3]
+            mem_sq += acc[4]
+
+        if not count:
+            return {"avg_cpu": 0, "avg_memory": 0, "std_cpu": 0, "std_memory": 0, "count": 0}
+
+        avg_cpu = cpu_sum / count
+        avg_mem = mem_sum / count
+        return {
+            "avg_cpu": avg_cpu,
+            "avg_memory": avg_mem,
+            "std_cpu": max(cpu_sq / count - avg_cpu * avg_cpu, 0.0) ** 0.5,
+            "std_memory": max(mem_sq / count - avg_mem * avg_mem, 0.0) ** 0.5,
+            "count": int(count)
+        }
+
+    def app_usage(self, limit: int) -> dict[str, int]:
+        """get_app_usage_stats の結果を計算"""
+        apps = self.apps
+        return {app: apps[app] for app in heapq.nlargest(limit, apps, key=apps.get)}
+
+    def add_daily(self, date: str, plan_name: str, minutes: int):
+        """日次統計を加算"""
+        key = (date, plan_name)
+        self.daily[key] = self.daily.get(key, 0) + minutes
+
+    def daily_stats(self, date: str) -> dict:
+        """get_daily_stats の結果を計算"""
+        plans = {
+            plan_name: minutes
+            for (day, plan_name), minutes in self.daily.items()
+            if day == date
+        }
+        stats = {
+            "date": date,
+            "total_minutes": sum(plans.values()),
+            "plans": plans,
+            # 旧 daily_stats の列。値を記録したことはないが、参照する呼び出し側のために残す
+            "estimated_battery_saved": 0,
+        }
+        for plan_name, key in Database.PLAN_STAT_KEYS.items():
+            stats[key] = plans.get(plan_name, 0)
+        return stats
+
+
+def _epoch_range(since: Optional[datetime], until: Optional[datetime]) -> tuple[int, int]:
+    """期間をエポック秒の半開区間に変換"""
+    return (
+        int(since.timestamp()) if since else 0,
+        int(until.timestamp()) if until else 2**62,
+    )
+
+
+class MemoryEngine(StorageEngine):
+    """メモリ上のストレージ（プロセス終了で消える）
+
+    使用記録は max_records 件のリングバッファに保持し、溢れた分は古い順に捨てる。
+    集計は捨てた記録も含めた累積値。
+    """
+
+    def __init__(self, max_records: int = 100_000, retention_days: int = 30):
+        self.retention_days = retention_days
+        self._lock = threading.RLock()
+        # (id, エポック秒, hour, day_of_week, cpu, memory, battery, is_charging, app, plan)
+        self._records: deque[tuple] = deque(maxlen=max_records)
+        self._next_id = 1
+        self._agg = _Aggregates()
+        self._settings: dict[str, str] = {}
+
+    def add_usage_record(self, record: UsageRecord):
+        """使用記録を追加"""
+        charging = 1 if record.is_charging else 0
+        with self._lock:
+            self._records.append((
+                self._next_id,
+                int(record.timestamp.timestamp()),
+                record.hour,
+                record.day_of_week,
+                record.cpu_percent,
+                record.memory_percent,
+                record.battery_percent,
+                charging,
+                record.active_app,
+                record.power_plan,
+            ))
+            self._next_id += 1
+            self._agg.add(
+                record.hour, record.day_of_week, charging,
+                record.cpu_percent, record.memory_percent, record.active_app
+            )
+
+    def flush(self):
+        """バッファなしのため何もしない"""
+
+    def iter_records(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        *,
+        app: Optional[str] = None
+    ) -> Iterator[UsageRecord]:
+        """期間内の使用記録を古い順に返す"""
+        lo, hi = _epoch_range(since, until)
+        with self._lock:
+            rows = list(self._records)
+
+        fromtimestamp = datetime.fromtimestamp
+        for row in rows:
+            if not lo <= row[1] < hi or (app is not None and row[8] != app):
+                continue
+            yield UsageRecord(
+                id=row[0],
+                timestamp=fromtimestamp(row[1]),
+                hour=row[2],
+                day_of_week=row[3],
+                cpu_percent=row[4],
+                memory_percent=row[5],
+                battery_percent=row[6],
+                is_charging=bool(row[7]),
+                active_app=row[8],
+                power_plan=row[9]
+            )
+
+    def get_hourly_pattern(
+        self,
+        hour: int,
+        day_of_week: Optional[int] = None,
+        is_charging: Optional[bool] = None
+    ) -> dict:
+        """特定時間帯の使用パターンを取得"""
+        with self._lock:
+            return self._agg.hourly_pattern(hour, day_of_week, is_charging)
+
+    def get_app_usage_stats(self, limit: int = 20) -> dict[str, int]:
+        """アプリ別使用回数を取得（多い順）"""
+        with self._lock:
+            return self._agg.app_usage(limit)
+
+    def update_daily_stats(
+        self,
+        plan_name: str,
+        minutes: int = 1,
+        when: Optional[datetime] = None
+    ):
+        """日次統計を加算"""
+        date = (when or datetime.now()).date().isoformat()
+        with self._lock:
+            self._agg.add_daily(date, plan_name, minutes)
+
+    def get_daily_stats(self, date: str) -> dict:
+        """指定日の統計を取得"""
+        with self._lock:
+            return self._agg.daily_stats(date)
+
+    def get_setting(self, key: str, default: str = "") -> str:
+        """設定値を取得"""
+        return self._settings.get(key, default)
+
+    def set_setting(self, key: str, value: Any):
+        """設定値を保存"""
+        with self._lock:
+            self._settings[key] = _setting_str(value)
+
+    def cleanup_old_records(self, days: Optional[int] = None) -> int:
+        """古い記録を削除（記録は時刻順に追加される前提）"""
+        days = self.retention_days if days is None else days
+        cutoff = int((datetime.now() - timedelta(days=days)).timestamp())
+        deleted = 0
+        with self._lock:
+            records = self._records
+            while records and records[0][1] < cutoff:
+                records.popleft()
+                deleted += 1
+        return deleted
+
+    def close(self):
+        """何もしない（内容はそのまま残る）"""
+
+
+# --- メタログ形式（使用記録以外を追記するログ） ---
+# 各エントリは1バイトのタグ + 固定長ヘッダ（+ 設定値は可変長の文字列）
+_TAG_DAILY = b"D"    # 日次統計の加算
+_TAG_SETTING = b"K"  # 設定値
+_TAG_HOURLY = b"H"   # 削除した記録の時間帯別集計
+_TAG_APP = b"A"      # 削除した記録のアプリ別件数
+_TAG_CUTOFF = b"C"   # この時刻より古い記録は削除済み
+
+_DAILY = struct.Struct("<10sIi")      # 日付, plan_id, 分
+_SETTING = struct.Struct("<HI")       # キーのバイト数, 値のバイト数
+_HOURLY = struct.Struct("<BBBqdddd")  # hour, day_of_week, is_charging, 件数, 合計×4
+_APP = struct.Struct("<Iq")           # app_id, 件数
+_CUTOFF = struct.Struct("<q")         # エポック秒
+
+_FIXED = {
+    _TAG_DAILY: _DAILY,
+    _TAG_SETTING: _SETTING,
+    _TAG_HOURLY: _HOURLY,
+    _TAG_APP: _APP,
+    _TAG_CUTOFF: _CUTOFF,
+}
+
+
+def _read_entries(f: BinaryIO) -> Iterator[tuple[bytes, tuple, bytes, int]]:
+    """ログのエントリを順に返す: (タグ, 固定長部, 可変長部, 終端オフセット)
+
+    末尾が書きかけ・壊れている場合はそこで止まる。
+    """
+    offset = f.tell()
+    while True:
+        tag = f.read(1)
+        fmt = _FIXED.get(tag)
+        if fmt is None:
+            return
+        head = f.read(fmt.size)
+        if len(head) < fmt.size:
+            return
+        fields = fmt.unpack(head)
+        extra = fields[0] + fields[1] if tag == _TAG_SETTING else 0
+        tail = f.read(extra) if extra else b""
+        if len(tail) < extra:
+            return
+        offset += 1 + fmt.size + extra
+        yield tag, fields, tail, offset
+
+
+def _sample_aggregates(records: np.ndarray, app_names: dict[int, str]) -> _Aggregates:
+    """サンプルログのレコード配列を集計（ベクトル演算）"""
+    agg = _Aggregates()
+    if len(records) == 0:
+        return agg
+
+    hours, dows = local_time_fields(records["epoch"])
+    charging = (records["flags"] & FLAG_CHARGING).astype(np.intp)
+    key = (hours.astype(np.intp) * 7 + dows) * 2 + charging
+    cpu = records["cpu"].astype(np.float64)
+    mem = records["memory"].astype(np.float64)
+    size = 24 * 7 * 2
+    counts = np.bincount(key, minlength=size)
+    sums = [
+        np.bincount(key, weights=w, minlength=size)
+        for w in (cpu, cpu * cpu, mem, mem * mem)
+    ]
+    for k in np.flatnonzero(counts):
+        hour, rest = divmod(int(k), 14)
+        dow, flag = divmod(rest, 2)
+        agg.merge_hourly(
+            (hour, dow, flag), [int(counts[k])] + [float(s[k]) for s in sums]
+        )
+
+    app_counts = np.bincount(records["app_id"])
+    for app_id in np.flatnonzero(app_counts):
+        agg.apps[app_names[int(app_id)]] = int(app_counts[app_id])
+    return agg
+
+
+class BinaryLogEngine(StorageEngine):
+    """固定長のサンプルログ（sample_log.SampleLog）に保存するストレージ
+
+    使用記録は日別セグメントへ追記し、日次統計・設定・削除済み記録の集計は
+    追記専用のメタログに書く。起動時にメタログを再生し、残っている使用記録を
+    ベクトル演算で集計し直して状態を復元する。
+    CPU・メモリ使用率は float32 で保存される。
+    未書き込み分は batch_size 件に達するか、最古のものが max_buffer_age 秒を
+    超えた時点（flush_if_due）で書き出す。
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        batch_size: int = 20,
+        retention_days: int = 30,
+        max_buffer_age: float = 300.0
+    ):
+        if directory is None:
+            app_data = Path(os.environ.get("APPDATA", "."))
+            self.directory = app_data / "PowerPlanAI" / "binlog"
+        else:
+            self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.directory / "meta.log"
+
+        self.retention_days = retention_days
+        self.max_buffer_age = max_buffer_age
+        self._lock = threading.RLock()
+        self._samples = SampleLog(self.directory / "samples", batch_size)
+        self._buffer = bytearray()
+        self._pending_since = 0.0
+        self._replay()
+        self._file: Optional[BinaryIO] = open(self.meta_path, "ab")
+
+    def _replay(self):
+        """メタログとサンプルログから状態を復元（壊れた末尾は切り捨てる）"""
+        self._agg = _Aggregates()
+        self._settings: dict[str, str] = {}
+        plan_names = self._samples.names("plan")
+        app_names = self._samples.names("app")
+
+        cutoff = None
+        if self.meta_path.exists():
+            good = 0
+            with open(self.meta_path, "rb") as f:
+                for tag, fields, tail, good in _read_entries(f):
+                    if tag == _TAG_DAILY:
+                        date, plan_id, minutes = fields
+                        self._agg.add_daily(date.decode("ascii"), plan_names[plan_id], minutes)
+                    elif tag == _TAG_SETTING:
+                        key = tail[:fields[0]].decode("utf-8")
+                        self._settings[key] = tail[fields[0]:].decode("utf-8")
+                    elif tag == _TAG_HOURLY:
+                        self._agg.merge_hourly(fields[:3], list(fields[3:]))
+                    elif tag == _TAG_APP:
+                        app = app_names[fields[0]]
+                        self._agg.apps[app] = self._agg.apps.get(app, 0) + fields[1]
+                    elif tag == _TAG_CUTOFF:
+                        cutoff = fields[0]
+                size = f.seek(0, os.SEEK_END)
+            if good < size:
+                logger.warning(f"メタログ末尾の壊れたエントリを切り捨て: {size - good}バイト")
+                with open(self.meta_path, "r+b") as f:
+                    f.truncate(good)
+
+        # 削除の途中で終了していた場合は残りを消す（集計はメタログに記録済み）
+        if cutoff is not None:
+            self._samples.drop_before(datetime.fromtimestamp(cutoff))
+
+        for records in self._samples.iter_views():
+            self._merge(_sample_aggregates(records, app_names))
+
+    def _merge(self, other: _Aggregates):
+        """集計を合算"""
+        for key, values in other.hourly.items():
+            self._agg.merge_hourly(key, values)
+        apps = self._agg.apps
+        for app, count in other.apps.items():
+            apps[app] = apps.get(app, 0) + count
+
+    def add_usage_record(self, record: UsageRecord):
+        """使用記録を追加（SampleLog の batch_size 件ごとにファイルへ書き出す）"""
+        # 再起動後の集計と一致させるため、保存される精度に丸めてから集計する
+        cpu = float(np.float32(record.cpu_percent))
+        mem = float(np.float32(record.memory_percent))
+        with self._lock:
+            if not self._has_pending():
+                self._pending_since = time.monotonic()
+            self._samples.append_record(record)
+            self._agg.add(
+                record.hour, record.day_of_week, 1 if record.is_charging else 0,
+                cpu, mem, record.active_app
+            )
+
+    def flush(self):
+        """バッファをログへ書き出す"""
+        with self._lock:
+            self._samples.flush()
+            if not self._buffer or self._file is None:
+                return
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._buffer.clear()
+
+    def flush_if_due(self) -> bool:
+        """最古の未書き込み分が max_buffer_age を超えていればフラッシュ"""
+        with self._lock:
+            if not self._has_pending():
+                return False
+            if time.monotonic() - self._pending_since < self.max_buffer_age:
+                return False
+            self.flush()
+            return True
+
+    def _has_pending(self) -> bool:
+        """未書き込みのデータがあるか"""
+        return bool(self._buffer or self._samples.pending)
+
+    def iter_records(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        *,
+        app: Optional[str] = None
+    ) -> Iterator[UsageRecord]:
+        """期間内の使用記録を古い順に返す"""
+        with self._lock:
+            self.flush()
+            app_names = self._samples.names("app")
+            plan_names = self._samples.names("plan")
+            app_id = self._samples.ids("app").get(app, 0) if app is not None else None
+
+        fromtimestamp = datetime.fromtimestamp
+        for records in self._samples.iter_views(since, until):
+            if app_id is not None:
+                records = records[records["app_id"] == app_id]
+            for ts, cpu, mem, battery, flags, rec_app, plan_id in records.tolist():
+                when = fromtimestamp(ts)
+                yield UsageRecord(
+                    id=None,
+                    timestamp=when,
+                    hour=when.hour,
+                    day_of_week=when.weekday(),
+                    cpu_percent=cpu,
+                    memory_percent=mem,
+                    battery_percent=None if battery < 0 else battery,
+                    is_charging=bool(flags & FLAG_CHARGING),
+                    active_app=app_names[rec_app],
+                    power_plan=plan_names[plan_id]
+                )
+
+    def view(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> np.ndarray:
+        """期間内の使用記録を SAMPLE_DTYPE の配列で取得（SampleLog.view 参照）"""
+        return self._samples.view(since, until)
+
+    def get_hourly_pattern(
+        self,
+        hour: int,
+        day_of_week: Optional[int] = None,
+        is_charging: Optional[bool] = None
+    ) -> dict:
+        """特定時間帯の使用パターンを取得"""
+        with self._lock:
+            return self._agg.hourly_pattern(hour, day_of_week, is_charging)
+
+    def get_app_usage_stats(self, limit: int = 20) -> dict[str, int]:
+        """アプリ別使用回数を取得（多い順）"""
+        with self._lock:
+            return self._agg.app_usage(limit)
+
+    def update_daily_stats(
+        self,
+        plan_name: str,
+        minutes: int = 1,
+        when: Optional[datetime] = None
+    ):
+        """日次統計を加算（次のフラッシュでログへ書き出す）"""
+        date = (when or datetime.now()).date().isoformat()
+        with self._lock:
+            if not self._has_pending():
+                self._pending_since = time.monotonic()
+            plan_id = self._samples.intern("plan", plan_name)
+            self._buffer += _TAG_DAILY + _DAILY.pack(date.encode("ascii"), plan_id, minutes)
+            self._agg.add_daily(date, plan_name, minutes)
+
+    def get_daily_stats(self, date: str) -> dict:
+        """指定日の統計を取得"""
+        with self._lock:
+            return self._agg.daily_stats(date)
+
+    def get_setting(self, key: str, default: str = "") -> str:
+        """設定値を取得"""
+        return self._settings.get(key, default)
+
+    def set_setting(self, key: str, value: Any):
+        """設定値を保存（即座にログへ書き出す）"""
+        value = _setting_str(value)
+        k, v = key.encode("utf-8"), value.encode("utf-8")
+        with self._lock:
+            self._buffer += _TAG_SETTING + _SETTING.pack(len(k), len(v)) + k + v
+            self._settings[key] = value
+            self.flush()
+
+    def cleanup_old_records(self, days: Optional[int] = None) -> int:
+        """古い記録を削除（集計はメタログに残す）
+
+        削除分の集計と削除時刻をメタログへ書いてからセグメントを消すため、
+        途中で終了しても次回起動時に続きから完了する。
+        """
+        days = self.retention_days if days is None else days
+        cutoff = datetime.now() - timedelta(days=days)
+
+        with self._lock:
+            self.flush()
+            app_ids = self._samples.ids("app")
+            dropped = _Aggregates()
+            count = 0
+            for records in self._samples.iter_views(until=cutoff):
+                part = _sample_aggregates(records, self._samples.names("app"))
+                for key, values in part.hourly.items():
+                    dropped.merge_hourly(key, values)
+                for app, n in part.apps.items():
+                    dropped.apps[app] = dropped.apps.get(app, 0) + n
+                count += len(records)
+                del records
+            if count == 0:
+                return 0
+
+            for key, values in dropped.hourly.items():
+                self._buffer += _TAG_HOURLY + _HOURLY.pack(*key, int(values[0]), *values[1:])
+            for app, n in dropped.apps.items():
+                self._buffer += _TAG_APP + _APP.pack(app_ids[app], n)
+            self._buffer += _TAG_CUTOFF + _CUTOFF.pack(int(cutoff.timestamp()))
+            self.flush()
+            os.fsync(self._file.fileno())
+
+            self._samples.drop_before(cutoff)
+
+        logger.info(f"古い記録を削除: {count}件")
+        return count
+
+    def close(self):
+        """バッファをフラッシュしてログを閉じる"""
+        with self._lock:
+            if self._file is None:
+                return
+            self.flush()
+            self._samples.close()
+            self._file.close()
+            self._file = None
+
+
+# 名前 → エンジンクラス（create_engine 用）
+ENGINES: dict[str, type] = {
+    "sqlite": Database,
+    "memory": MemoryEngine,
+    "binlog": BinaryLogEngine,
+}
+
+
+def create_engine(kind: str = "sqlite", **kwargs) -> StorageEngine:
+    """名前を指定してストレージエンジンを生成"""
+    try:
+        engine = ENGINES[kind]
+    except KeyError:
+        raise ValueError(f"不明なストレージエンジン: {kind}（{', '.join(ENGINES)}）") from None
+    return engine(**kwargs)
@@ -10,6 +10,8 @@ from datetime import datetime
 from typing import Optional
 import logging
 
+from app_vocabulary import AppVocabulary, get_vocabulary
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,12 +24,16 @@ class SystemStatus:
     is_charging: bool
     active_app: str
     timestamp: datetime
+    app_id: int = -1  # アプリ名辞書のID
 
 
 class SystemMonitor:
     """システム監視クラス"""
     
-    def __init__(self):
+    def __init__(self, vocabulary: Optional[AppVocabulary] = None):
+        self.vocabulary = get_vocabulary() if vocabulary is None else vocabulary
+        # 直近に返したアプリのID（次の状態を返すまで pin しておく）
+        self._app_id = -1
         self._user32 = ctypes.windll.user32
         self._kernel32 = ctypes.windll.kernel32
     
@@ -93,7 +99,13 @@ class SystemMonitor:
         cpu = self.get_cpu_usage()
         memory = self.get_memory_usage()
         battery, charging = self.get_battery_info()
+        # アプリ名はここで一度だけ正規化して辞書に登録し、以降はIDで扱う
+        # （active_app は表示用に元の名前のまま渡す）
         active_app = self.get_foreground_window_process()
+        app_id = self.vocabulary.intern(self.vocabulary.normalize(active_app), pin=True)
+        if self._app_id >= 0:
+            self.vocabulary.release(self._app_id)
+        self._app_id = app_id
         
         return SystemStatus(
             cpu_percent=cpu,
@@ -101,7 +113,8 @@ class SystemMonitor:
             battery_percent=battery,
             is_charging=charging,
             active_app=active_app,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            app_id=app_id
         )
     
     def is_heavy_load(self) -> bool: